@@ -5,19 +5,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 
 from services.database import get_db, ModelMetrics
-from services.ml_service import MLService
+from services.ml_service import MLService, require_ml_service
 
 router = APIRouter()
 
 @router.get("/performance")
 async def get_model_performance(
-    ml_service: MLService = Depends(lambda: MLService())
+    ml_service: MLService = Depends(require_ml_service)
 ):
     """Get current model performance metrics"""
     try:
-        if not ml_service.is_ready:
-            await ml_service.load_models()
-        
         metrics = ml_service.get_model_metrics()
         return {
             "status": "healthy",
@@ -29,13 +26,10 @@ async def get_model_performance(
 
 @router.get("/feature-importance")
 async def get_feature_importance(
-    ml_service: MLService = Depends(lambda: MLService())
+    ml_service: MLService = Depends(require_ml_service)
 ):
     """Get feature importance from the model"""
     try:
-        if not ml_service.is_ready:
-            await ml_service.load_models()
-        
         importance = ml_service.get_feature_importance()
         
         # Sort by importance
@@ -53,6 +47,32 @@ async def get_feature_importance(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/version")
+async def get_model_version(
+    ml_service: MLService = Depends(require_ml_service)
+):
+    """Get the model version being served and the versions in the registry"""
+    return {
+        "active_version": ml_service.model_version,
+        "loaded_at": ml_service.models.loaded_at.isoformat(),
+        "registry_versions": ml_service.registry.versions(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@router.post("/reload")
+async def reload_models(
+    ml_service: MLService = Depends(require_ml_service)
+):
+    """Swap to the registry's active version now instead of waiting for the next poll"""
+    previous_version = ml_service.model_version
+    swapped = await ml_service.check_for_new_version()
+    return {
+        "reloaded": swapped,
+        "previous_version": previous_version,
+        "active_version": ml_service.model_version,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @router.get("/history")
 async def get_model_history(
     limit: int = 10,
@@ -4,9 +4,9 @@ from typing import Dict
 import psutil
 import os
 
-from services.database import get_db
+from services.database import get_db, ping_database
 from services.redis_client import redis_client
-from services.ml_service import MLService
+from services.ml_service import MLService, get_ml_service
 from services.websocket_manager import WebSocketManager
 
 router = APIRouter()
@@ -43,18 +43,12 @@ async def get_system_metrics():
 
 @router.get("/services")
 async def get_services_status(
-    ml_service: MLService = Depends(lambda: MLService())
+    ml_service: MLService = Depends(get_ml_service)
 ):
     """Get status of all services"""
     try:
         # Check database
-        try:
-            from services.database import engine
-            async with engine.begin() as conn:
-                await conn.execute("SELECT 1")
-            db_status = "healthy"
-        except:
-            db_status = "unhealthy"
+        db_status = "healthy" if await ping_database() is not None else "unhealthy"
         
         # Check Redis
         redis_status = "healthy" if await redis_client.ping() else "unhealthy"
@@ -75,7 +69,7 @@ async def get_services_status(
                 },
                 "ml_models": {
                     "status": ml_status,
-                    "version": "v1.0.0"
+                    "version": ml_service.model_version
                 }
             },
             "overall_status": "healthy" if all([
@@ -144,7 +138,7 @@ async def get_active_alerts():
 
 @router.get("/live-metrics")
 async def get_live_metrics(
-    ml_service: MLService = Depends(lambda: MLService())
+    ml_service: MLService = Depends(get_ml_service)
 ):
     """Get live system metrics for real-time monitoring"""
     try:
@@ -153,15 +147,8 @@ async def get_live_metrics(
         memory = psutil.virtual_memory()
         
         # Service status
-        try:
-            from services.database import engine
-            async with engine.begin() as conn:
-                await conn.execute("SELECT 1")
-            db_status = "healthy"
-            db_latency = 5.2  # Would measure actual latency in production
-        except:
-            db_status = "unhealthy"
-            db_latency = None
+        db_latency = await ping_database()
+        db_status = "healthy" if db_latency is not None else "unhealthy"
         
         redis_status = "healthy" if await redis_client.ping() else "unhealthy"
         ml_status = "healthy" if ml_service.is_ready else "unhealthy"
@@ -169,7 +156,7 @@ async def get_live_metrics(
         # Get cached API stats
         api_stats = await redis_client.get_api_stats()
         total_requests = api_stats.get('total_requests', 0) if api_stats else 0
-        avg_response_time = api_stats.get('avg_response_time', 45) if api_stats else 45
+        avg_response_time = api_stats.get('avg_response_time', 0.0) if api_stats else 0.0
         
         return {
             "timestamp": datetime.utcnow().isoformat(),
@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import Awaitable, Callable, List, Literal, Optional, Dict, Tuple
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-import hashlib
+import asyncio
 import json
+import os
+import time
+import uuid
 
 from services.database import get_db, Valuation, Property
 from services.redis_client import redis_client
-from services.ml_service import MLService
+from services.ml_service import MLService, ExplanationUnavailable, InferenceQueueFull, require_ml_service
+from services.micro_batcher import MicroBatcher, get_valuation_batcher
+from services.single_flight import SingleFlight, get_valuation_flights
+from services.valuation_jobs import ValuationJobs, JobNotFound, get_valuation_jobs
+from services.valuation_writer import ValuationWriter, get_valuation_writer
+from services.columnar import (
+    ColumnarError, RESPONSE_MEDIA_TYPES, column_specs, decode_columns, encode_columns, media_kind, validate_columns
+)
 
 router = APIRouter()
 
@@ -45,6 +56,7 @@ class ValuationResponse(BaseModel):
     model_version: str
     processing_time_ms: Optional[float]
     cached: bool = False
+    explanation: Optional[Dict] = None
 
 class BatchValuationRequest(BaseModel):
     properties: List[PropertyValuationRequest]
@@ -58,13 +70,25 @@ class BatchValuationResponse(BaseModel):
     average_property_value: float
     results: List[Dict]
     processing_time_ms: float
+    cache_hits: int = 0
+    cache_hit_ratio: float = 0.0
+
+# Same field names and ranges as PropertyValuationRequest, checked a column at a time
+COLUMNAR_SPECS = column_specs(PropertyValuationRequest)
+COLUMNAR_MAX_ROWS = int(os.getenv('COLUMNAR_MAX_ROWS', '100000'))
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+# Properties valued per model call when streaming; each chunk is flushed as soon as it is done
+BATCH_STREAM_CHUNK_SIZE = int(os.getenv('BATCH_STREAM_CHUNK_SIZE', '500'))
 
 @router.post("/predict", response_model=ValuationResponse)
 async def predict_valuation(
     request: PropertyValuationRequest,
-    background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(get_db),
-    ml_service: MLService = Depends(lambda: MLService())
+    explain: Optional[Literal['fast']] = Query(None, description="'fast' adds approximate per-feature contributions"),
+    ml_service: MLService = Depends(require_ml_service),
+    batcher: MicroBatcher = Depends(get_valuation_batcher),
+    flights: SingleFlight = Depends(get_valuation_flights),
+    writer: ValuationWriter = Depends(get_valuation_writer)
 ):
     """
     Predict property valuation using ensemble ML model
@@ -72,55 +96,72 @@ async def predict_valuation(
     start_time = datetime.utcnow()
     
     try:
-        # Generate cache key
+        # Keyed by model version and what the models actually see, so a new version never reads old entries
         request_dict = request.dict()
-        cache_key = hashlib.md5(json.dumps(request_dict, sort_keys=True).encode()).hexdigest()
+        cache_key = ml_service.valuation_cache_key(request_dict)
+        
+        # Identical requests in flight on any worker share one inference; only the one that ran it saves it
+        prediction = None
+        
+        def valuer(with_explanation: bool) -> Callable[[], Awaitable[Dict]]:
+            async def value_once() -> Dict:
+                nonlocal prediction
+                # Coalesced with other concurrent requests into one model call; contributions only when asked for
+                prediction = await batcher.submit(request_dict, explain=with_explanation)
+                # Cached with any explanation so a later explain=fast hit can serve it
+                return ValuationResponse(
+                    property_id=None,
+                    predicted_value=prediction['predicted_value'],
+                    confidence_interval=prediction['confidence_interval'],
+                    price_per_sqft=prediction['price_per_sqft'],
+                    valuation_date=datetime.utcnow().isoformat(),
+                    model_version=prediction.get('model_version', 'v1.0.0'),
+                    processing_time_ms=None,
+                    cached=False,
+                    explanation=prediction.get('explanation')
+                ).dict()
+            return value_once
         
         # Check cache
-        cached_result = await redis_client.get_cached_valuation(cache_key)
-        if cached_result:
+        cached_result, refresh = await redis_client.lookup_valuation(cache_key)
+        # Entries written by /batch or by requests without explain=fast carry no explanation; explain=fast recomputes those
+        if cached_result and (explain != 'fast' or cached_result.get('explanation')):
+            # Near or past expiry: this request is still served from cache while one refresh runs in the background
+            if refresh:
+                # The refreshed entry keeps an explanation if the current one has it
+                with_explanation = bool(cached_result.get('explanation'))
+                flights.refresh(cache_key, valuer(with_explanation), refresh, ttl=3600, explained=with_explanation)
+            cached_result['property_id'] = request.property_id
             cached_result['cached'] = True
             cached_result['processing_time_ms'] = (datetime.utcnow() - start_time).total_seconds() * 1000
+            if explain != 'fast':
+                cached_result['explanation'] = None
+            redis_client.track_api_call('/api/v1/valuations/predict', response_time_ms=cached_result['processing_time_ms'])
+            # Cache keys leave the property id out, so the entry may have been computed for another property
+            writer.submit(request.property_id, cached_result, request_dict)
             return ValuationResponse(**cached_result)
         
-        # Ensure ML service is ready
-        if not ml_service.is_ready:
-            await ml_service.load_models()
-        
-        # Make prediction
-        prediction = await ml_service.predict_with_confidence(request_dict)
+        valuation, shared = await flights.run(cache_key, valuer(explain == 'fast'), ttl=3600, explained=explain == 'fast')
         
         # Prepare response
         processing_time = (datetime.utcnow() - start_time).total_seconds() * 1000
+        response = ValuationResponse(**{
+            **valuation,
+            'property_id': request.property_id,
+            'processing_time_ms': processing_time,
+            'cached': shared
+        })
+        if explain != 'fast':
+            response.explanation = None
+        redis_client.track_api_call('/api/v1/valuations/predict', response_time_ms=processing_time)
         
-        response = ValuationResponse(
-            property_id=request.property_id,
-            predicted_value=prediction['predicted_value'],
-            confidence_interval=prediction['confidence_interval'],
-            price_per_sqft=prediction['price_per_sqft'],
-            valuation_date=datetime.utcnow().isoformat(),
-            model_version=prediction.get('model_version', 'v1.0.0'),
-            processing_time_ms=processing_time,
-            cached=False
-        )
-        
-        # Cache the result
-        await redis_client.cache_valuation(cache_key, response.dict(), ttl=3600)
-        
-        # Save to database in background
-        background_tasks.add_task(
-            save_valuation_to_db,
-            db,
-            request.property_id,
-            prediction,
-            request_dict
-        )
-        
-        # Track API usage
-        await redis_client.track_api_call('/api/v1/valuations/predict')
+        # Persisted with the next batched write, also when another request for any property computed it
+        writer.submit(request.property_id, valuation if shared else prediction, request_dict)
         
         return response
         
+    except InferenceQueueFull:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -128,8 +169,10 @@ async def predict_valuation(
 async def batch_valuation(
     request: BatchValuationRequest,
     background_tasks: BackgroundTasks,
+    http_request: Request,
+    stream: bool = Query(False, description="Stream one NDJSON line per valuation, then a summary line"),
     db: AsyncSession = Depends(get_db),
-    ml_service: MLService = Depends(lambda: MLService())
+    ml_service: MLService = Depends(require_ml_service)
 ):
     """
     Process batch property valuations
@@ -137,39 +180,24 @@ async def batch_valuation(
     start_time = datetime.utcnow()
     batch_id = f"batch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
     
+    if stream or NDJSON_MEDIA_TYPE in http_request.headers.get('accept', ''):
+        return StreamingResponse(
+            stream_batch_valuation(request.properties, ml_service, batch_id, start_time),
+            media_type=NDJSON_MEDIA_TYPE
+        )
+    
     try:
-        # Ensure ML service is ready
-        if not ml_service.is_ready:
-            await ml_service.load_models()
+        # Cached valuations first, then one vectorized pass over the misses
+        predictions, cache_hits = await predict_with_cache(ml_service, [p.dict() for p in request.properties], ml_service.batch_predict)
         
         results = []
         total_value = 0
         successful = 0
         
-        for property_data in request.properties:
-            try:
-                prediction = await ml_service.predict_with_confidence(property_data.dict())
-                
-                result = {
-                    'property_id': property_data.property_id,
-                    'status': 'success',
-                    'valuation': {
-                        'predicted_value': prediction['predicted_value'],
-                        'confidence_interval': prediction['confidence_interval'],
-                        'price_per_sqft': prediction['price_per_sqft']
-                    }
-                }
-                
-                total_value += prediction['predicted_value']
-                successful += 1
-                results.append(result)
-                
-            except Exception as e:
-                results.append({
-                    'property_id': property_data.property_id,
-                    'status': 'error',
-                    'error': str(e)
-                })
+        for property_data, prediction in zip(request.properties, predictions):
+            results.append(batch_result(property_data, prediction))
+            total_value += prediction['predicted_value']
+            successful += 1
         
         processing_time = (datetime.utcnow() - start_time).total_seconds() * 1000
         
@@ -181,58 +209,337 @@ async def batch_valuation(
             total_portfolio_value=total_value,
             average_property_value=total_value / max(successful, 1),
             results=results,
-            processing_time_ms=processing_time
+            processing_time_ms=processing_time,
+            cache_hits=cache_hits,
+            cache_hit_ratio=cache_hits / max(len(request.properties), 1)
         )
         
         # Track API usage
-        await redis_client.track_api_call('/api/v1/valuations/batch')
+        redis_client.track_api_call('/api/v1/valuations/batch', response_time_ms=processing_time)
         
         return response
         
+    except InferenceQueueFull:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def predict_with_cache(ml_service: MLService, properties: List[Dict], predict) -> Tuple[List[Dict], int]:
+    """
+    Serve what the valuation cache already holds and predict only the misses, which are cached in turn;
+    returns predictions in input order and the number of cache hits
+    """
+    cache_keys = ml_service.valuation_cache_keys(properties)
+    predictions = await redis_client.get_cached_valuations(cache_keys)
+    misses = [i for i, prediction in enumerate(predictions) if prediction is None]
+    
+    if misses:
+        started = time.perf_counter()
+        fresh = await predict([properties[i] for i in misses])
+        # What recomputing one entry cost, amortized over the batch; drives early refresh of these entries
+        compute_seconds = (time.perf_counter() - started) / len(misses)
+        records = {}
+        for i, prediction in zip(misses, fresh):
+            predictions[i] = prediction
+            # Same record shape /predict caches, so both endpoints share entries
+            if cache_keys[i].startswith(f"{prediction.get('model_version')}:"):
+                records[cache_keys[i]] = {
+                    'property_id': None,
+                    'predicted_value': prediction['predicted_value'],
+                    'confidence_interval': prediction['confidence_interval'],
+                    'price_per_sqft': prediction['price_per_sqft'],
+                    'valuation_date': prediction.get('timestamp', datetime.utcnow().isoformat()),
+                    'model_version': prediction['model_version'],
+                    'processing_time_ms': None,
+                    'cached': False,
+                    'explanation': None
+                }
+        await redis_client.cache_valuations(records, ttl=3600, compute_seconds=compute_seconds)
+    
+    return predictions, len(properties) - len(misses)
+
+def batch_result(property_data: PropertyValuationRequest, prediction: Dict) -> Dict:
+    """One entry of a batch response"""
+    return {
+        'property_id': property_data.property_id,
+        'status': 'success',
+        'valuation': {
+            'predicted_value': prediction['predicted_value'],
+            'confidence_interval': prediction['confidence_interval'],
+            'price_per_sqft': prediction['price_per_sqft']
+        }
+    }
+
+async def stream_batch_valuation(
+    properties: List[PropertyValuationRequest],
+    ml_service: MLService,
+    batch_id: str,
+    start_time: datetime
+):
+    """Yield NDJSON result lines chunk by chunk, then the portfolio summary; nothing accumulates per row"""
+    total_value = 0.0
+    successful = 0
+    cache_hits = 0
+    
+    for start in range(0, len(properties), BATCH_STREAM_CHUNK_SIZE):
+        chunk = properties[start:start + BATCH_STREAM_CHUNK_SIZE]
+        try:
+            predictions, hits = await predict_with_cache(
+                ml_service,
+                [p.dict() for p in chunk],
+                lambda misses: predict_with_backpressure(ml_service, misses)
+            )
+            cache_hits += hits
+            lines = []
+            for index, (property_data, prediction) in enumerate(zip(chunk, predictions), start):
+                lines.append(json.dumps({'type': 'result', 'index': index, **batch_result(property_data, prediction)}))
+                total_value += prediction['predicted_value']
+            successful += len(predictions)
+        except Exception as e:
+            # Headers are already sent, so failures are reported in-band
+            lines = [
+                json.dumps({
+                    'type': 'result',
+                    'index': index,
+                    'property_id': property_data.property_id,
+                    'status': 'error',
+                    'error': str(e)
+                })
+                for index, property_data in enumerate(chunk, start)
+            ]
+        yield '\n'.join(lines) + '\n'
+    
+    yield json.dumps({
+        'type': 'summary',
+        'batch_id': batch_id,
+        'total_properties': len(properties),
+        'successful_valuations': successful,
+        'failed_valuations': len(properties) - successful,
+        'total_portfolio_value': total_value,
+        'average_property_value': total_value / max(successful, 1),
+        'processing_time_ms': (datetime.utcnow() - start_time).total_seconds() * 1000,
+        'cache_hits': cache_hits,
+        'cache_hit_ratio': cache_hits / max(len(properties), 1)
+    }) + '\n'
+    
+    # Track API usage
+    redis_client.track_api_call('/api/v1/valuations/batch')
+
+async def predict_with_backpressure(ml_service: MLService, properties: List[Dict]) -> List[Dict]:
+    """Batch predict, waiting out a full inference queue instead of failing mid-stream"""
+    while True:
+        try:
+            return await ml_service.batch_predict(properties)
+        except InferenceQueueFull as e:
+            await asyncio.sleep(e.retry_after)
+
+@router.post("/bulk")
+async def bulk_valuation(
+    http_request: Request,
+    ml_service: MLService = Depends(require_ml_service)
+):
+    """
+    Value a portfolio sent as columns and answer in the same format.
+    
+    Content-Type application/json takes {"columns": {"square_feet": [...], ...}};
+    application/vnd.apache.arrow.stream and application/vnd.apache.parquet take a table
+    with the same column names (requires pyarrow).
+    """
+    start_time = datetime.utcnow()
+    
+    try:
+        kind = media_kind(http_request.headers.get('content-type'))
+        columns = decode_columns(await http_request.body(), kind)
+        validated, n_rows = validate_columns(columns, COLUMNAR_SPECS, COLUMNAR_MAX_ROWS)
+    except ColumnarError as e:
+        raise HTTPException(status_code=e.status_code, detail={'message': str(e), 'errors': e.errors})
+    
+    try:
+        # Only numeric columns feed the model matrix
+        numeric_columns = {name: values for name, values in validated.items() if values.dtype != object}
+        result = await ml_service.batch_predict_columns(numeric_columns, n_rows)
+        
+        processing_time = (datetime.utcnow() - start_time).total_seconds() * 1000
+        content = encode_columns(
+            {
+                'property_id': validated['property_id'],
+                'predicted_value': result['predicted_value'],
+                'lower': result['lower'],
+                'upper': result['upper'],
+                'uncertainty_percentage': result['uncertainty_percentage'],
+                'price_per_sqft': result['price_per_sqft']
+            },
+            kind,
+            metadata={
+                'model_version': result['model_version'],
+                'total_properties': n_rows,
+                'total_portfolio_value': float(result['predicted_value'].sum()),
+                'processing_time_ms': processing_time
+            }
+        )
+        
+        # Track API usage
+        redis_client.track_api_call('/api/v1/valuations/bulk', response_time_ms=processing_time)
+        
+        return Response(content=content, media_type=RESPONSE_MEDIA_TYPES[kind])
+        
+    except InferenceQueueFull:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/jobs", status_code=202)
+async def submit_valuation_job(
+    request: BatchValuationRequest,
+    jobs: ValuationJobs = Depends(get_valuation_jobs)
+):
+    """
+    Queue a batch valuation to run in the background; poll /jobs/{job_id} for progress
+    """
+    try:
+        job = await jobs.submit([p.dict() for p in request.properties])
+        
+        # Track API usage
+        redis_client.track_api_call('/api/v1/valuations/jobs')
+        
+        return {
+            **job,
+            'links': {
+                'status': f"/api/v1/valuations/jobs/{job['job_id']}",
+                'results': f"/api/v1/valuations/jobs/{job['job_id']}/results"
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_valuation_job(
+    job_id: str,
+    jobs: ValuationJobs = Depends(get_valuation_jobs)
+):
+    """
+    Get batch valuation job status and progress
+    """
+    try:
+        return await jobs.get(job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+@router.get("/jobs/{job_id}/results")
+async def get_valuation_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    jobs: ValuationJobs = Depends(get_valuation_jobs)
+):
+    """
+    Page through a job's results; available while the job is still running
+    """
+    try:
+        return await jobs.results(job_id, offset, limit)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+@router.delete("/jobs/{job_id}")
+async def cancel_valuation_job(
+    job_id: str,
+    jobs: ValuationJobs = Depends(get_valuation_jobs)
+):
+    """
+    Cancel a queued or running job after its current chunk
+    """
+    try:
+        return await jobs.cancel(job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+class ExplainBatchRequest(BaseModel):
+    valuation_ids: List[str] = Field(..., min_length=1, max_length=1000, description="Valuations to explain")
+
+async def explain_valuations(db: AsyncSession, ml_service: MLService, valuation_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Explanations keyed by valuation id; computed in one batch for those without stored SHAP values, then persisted
+    """
+    try:
+        requested = {uuid.UUID(valuation_id): valuation_id for valuation_id in valuation_ids}
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid valuation id")
+    
+    result = await db.execute(
+        select(Valuation, Property)
+        .outerjoin(Property, Property.property_id == Valuation.property_id)
+        .where(Valuation.id.in_(list(requested)))
+    )
+    rows = result.all()
+    
+    pending = [(valuation, property_data) for valuation, property_data in rows if not valuation.shap_values and property_data is not None]
+    if pending:
+        explanations = await ml_service.explain_batch([
+            {column.name: getattr(property_data, column.name) for column in Property.__table__.columns}
+            for _, property_data in pending
+        ])
+        for (valuation, _), explanation in zip(pending, explanations):
+            valuation.shap_values = explanation
+        await db.commit()
+    
+    return {
+        requested[valuation.id]: {
+            'valuation_id': str(valuation.id),
+            'property_id': valuation.property_id,
+            'predicted_value': float(valuation.predicted_value),
+            'explanation': valuation.shap_values
+        }
+        for valuation, _ in rows
+    }
+
 @router.get("/{valuation_id}/explain")
 async def explain_valuation(
     valuation_id: str,
     db: AsyncSession = Depends(get_db),
-    ml_service: MLService = Depends(lambda: MLService())
+    ml_service: MLService = Depends(require_ml_service)
 ):
     """
     Get SHAP explanation for a valuation
     """
     try:
-        # Get valuation from database
-        result = await db.execute(
-            select(Valuation).where(Valuation.id == valuation_id)
-        )
-        valuation = result.scalar_one_or_none()
+        explained = await explain_valuations(db, ml_service, [valuation_id])
         
-        if not valuation:
+        if valuation_id not in explained:
             raise HTTPException(status_code=404, detail="Valuation not found")
-        
-        # Get property data
-        property_result = await db.execute(
-            select(Property).where(Property.property_id == valuation.property_id)
-        )
-        property_data = property_result.scalar_one_or_none()
-        
-        if not property_data:
+        if explained[valuation_id]['explanation'] is None:
             raise HTTPException(status_code=404, detail="Property not found")
         
-        # Get SHAP values
-        shap_explanation = await ml_service.get_shap_values(property_data.__dict__)
-        
         return {
-            'valuation_id': str(valuation_id),
-            'property_id': valuation.property_id,
-            'predicted_value': float(valuation.predicted_value),
-            'explanation': shap_explanation,
+            **explained[valuation_id],
             'feature_importance': ml_service.get_feature_importance()
         }
         
     except HTTPException:
         raise
+    except ExplanationUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/explain")
+async def explain_valuations_batch(
+    request: ExplainBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    ml_service: MLService = Depends(require_ml_service)
+):
+    """
+    Get SHAP explanations for many valuations, computing the missing ones in a single pass
+    """
+    try:
+        explained = await explain_valuations(db, ml_service, request.valuation_ids)
+        return {
+            'explanations': [explained[valuation_id] for valuation_id in request.valuation_ids if valuation_id in explained],
+            'not_found': [valuation_id for valuation_id in request.valuation_ids if valuation_id not in explained]
+        }
+    except HTTPException:
+        raise
+    except ExplanationUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -317,46 +624,4 @@ async def get_valuation_history(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def save_valuation_to_db(
-    db: AsyncSession,
-    property_id: Optional[str],
-    prediction: Dict,
-    property_data: Dict
-):
-    """
-    Save valuation to database (background task)
-    """
-    try:
-        if property_id:
-            # Check if property exists
-            result = await db.execute(
-                select(Property).where(Property.property_id == property_id)
-            )
-            existing_property = result.scalar_one_or_none()
-            
-            if not existing_property:
-                # Create property record
-                new_property = Property(
-                    property_id=property_id,
-                    **{k: v for k, v in property_data.items() if k != 'property_id' and hasattr(Property, k)}
-                )
-                db.add(new_property)
-            
-            # Create valuation record
-            new_valuation = Valuation(
-                property_id=property_id,
-                predicted_value=prediction['predicted_value'],
-                confidence_lower=prediction['confidence_interval']['lower'],
-                confidence_upper=prediction['confidence_interval']['upper'],
-                model_version=prediction.get('model_version', 'v1.0.0'),
-                model_type='ensemble',
-                prediction_metadata=prediction
-            )
-            db.add(new_valuation)
-            
-            await db.commit()
-    except Exception as e:
-        print(f"Error saving valuation to database: {e}")
-        await db.rollback()
-
 valuations_router = router
\ No newline at end of file
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
@@ -15,9 +15,13 @@ from api.models import models_router
 from api.properties import properties_router
 from api.analytics import analytics_router
 from api.monitoring import monitoring_router
-from services.database import init_db, get_db
+from services.database import init_db, get_db, ping_database
 from services.redis_client import redis_client
-from services.ml_service import MLService
+from services.ml_service import MLService, InferenceQueueFull
+from services.micro_batcher import MicroBatcher
+from services.single_flight import SingleFlight
+from services.valuation_jobs import ValuationJobs
+from services.valuation_writer import ValuationWriter
 from services.websocket_manager import WebSocketManager
 from middleware.logging import LoggingMiddleware
 from middleware.metrics import MetricsMiddleware
@@ -28,14 +32,32 @@ async def lifespan(app: FastAPI):
     print("Starting AVM Backend Server...")
     await init_db()
     await redis_client.initialize()
+    # Single MLService per worker, handed to routers via get_ml_service
     ml_service = MLService()
-    await ml_service.load_models()
     app.state.ml_service = ml_service
+    # Cache keys carry the model version; local tiers drop the previous version's entries right away
+    ml_service.version_listeners.append(lambda version: redis_client.invalidate_local_caches(f"model {version}"))
+    await ml_service.load_models()
+    # Requests asking for fast (Saabas) explanations get them off the shared prediction traversal; the rest skip that work
+    app.state.valuation_batcher = MicroBatcher(ml_service.batch_predict)
+    app.state.valuation_batcher.start()
+    # Identical valuations in flight share one inference, within this worker and across workers via Redis
+    app.state.valuation_flights = SingleFlight(redis_client)
+    # Valuations are persisted write-behind, in batched inserts off the request path
+    app.state.valuation_writer = ValuationWriter()
+    app.state.valuation_writer.start()
+    # Background runners for /api/v1/valuations/jobs; picks up jobs left unfinished by a previous process
+    app.state.valuation_jobs = ValuationJobs(redis_client, ml_service)
+    app.state.valuation_jobs.start()
     app.state.ws_manager = WebSocketManager()
     
     yield
     
     print("Shutting down AVM Backend Server...")
+    await app.state.valuation_jobs.stop()
+    await app.state.valuation_batcher.stop()
+    await app.state.valuation_writer.stop()
+    ml_service.shutdown()
     await redis_client.close()
 
 app = FastAPI(
@@ -59,6 +81,14 @@ app.add_middleware(MetricsMiddleware)
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
 
+@app.exception_handler(InferenceQueueFull)
+async def inference_queue_full_handler(request: Request, exc: InferenceQueueFull):
+    return JSONResponse(
+        content={"detail": "Inference capacity exhausted, retry shortly"},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 app.include_router(auth_router, prefix="/api/v1/auth", tags=["Authentication"])
 app.include_router(valuations_router, prefix="/api/v1/valuations", tags=["Valuations"])
 app.include_router(models_router, prefix="/api/v1/models", tags=["ML Models"])
@@ -106,13 +136,7 @@ async def health_check():
         )
 
 async def check_database_health():
-    try:
-        from services.database import engine
-        async with engine.begin() as conn:
-            await conn.execute("SELECT 1")
-        return True
-    except:
-        return False
+    return await ping_database() is not None
 
 @app.websocket("/ws/valuations")
 async def websocket_valuations(websocket: WebSocket):
@@ -125,9 +149,27 @@ async def websocket_valuations(websocket: WebSocket):
             if message["type"] == "valuation_request":
                 property_data = message["data"]
                 
-                valuation_result = await app.state.ml_service.predict_with_confidence(
-                    property_data
-                )
+                try:
+                    valuation_result = await app.state.valuation_batcher.submit(property_data, explain=message.get("explain") == "fast")
+                except InferenceQueueFull as e:
+                    # Overload or a failed batch ends this request, not the connection
+                    await app.state.ws_manager.send_personal_message(
+                        json.dumps({
+                            "type": "valuation_error",
+                            "data": {"detail": "Inference capacity exhausted, retry shortly", "retry_after": e.retry_after}
+                        }),
+                        websocket
+                    )
+                    continue
+                except Exception as e:
+                    await app.state.ws_manager.send_personal_message(
+                        json.dumps({
+                            "type": "valuation_error",
+                            "data": {"detail": str(e)}
+                        }),
+                        websocket
+                    )
+                    continue
                 
                 await app.state.ws_manager.send_personal_message(
                     json.dumps({
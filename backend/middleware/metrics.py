@@ -33,6 +33,86 @@ valuation_values = Histogram(
     buckets=(100000, 250000, 500000, 750000, 1000000, 2000000, 5000000, 10000000, float('inf'))
 )
 
+inference_queue_depth = Gauge(
+    'inference_queue_depth',
+    'Valuation requests waiting to be coalesced into a model call'
+)
+
+inference_batch_size = Histogram(
+    'inference_batch_size',
+    'Number of valuation requests coalesced into one model call',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+cache_requests_total = Counter(
+    'cache_requests_total',
+    'Valuation cache lookups per tier',
+    ['tier', 'result']
+)
+
+cache_evictions_total = Counter(
+    'cache_evictions_total',
+    'Valuation cache entries dropped per tier',
+    ['tier', 'reason']
+)
+
+cache_refreshes_total = Counter(
+    'cache_refreshes_total',
+    'Cached valuations recomputed in the background, early (XFetch) or after going stale',
+    ['reason']
+)
+
+valuation_write_queue_depth = Gauge(
+    'valuation_write_queue_depth',
+    'Valuations buffered for the next database write'
+)
+
+valuation_writes_total = Counter(
+    'valuation_writes_total',
+    'Valuations handled by the write-behind writer',
+    ['result']
+)
+
+db_pool_connections = Gauge(
+    'db_pool_connections',
+    'Database pool connections by state',
+    ['state']
+)
+
+db_pool_max_connections = Gauge(
+    'db_pool_max_connections',
+    'Database connections the pool may open, pool size plus overflow'
+)
+
+db_pool_waiting = Gauge(
+    'db_pool_waiting',
+    'Callers waiting for a database connection from the pool'
+)
+
+db_pool_wait_seconds = Histogram(
+    'db_pool_wait_seconds',
+    'Time to get a database connection from the pool',
+    buckets=[0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+)
+
+circuit_breaker_open = Gauge(
+    'circuit_breaker_open',
+    'Whether calls to a dependency are currently being skipped (1) or allowed (0)',
+    ['dependency']
+)
+
+cache_entries = Gauge(
+    'cache_entries',
+    'Valuation cache entries held per tier',
+    ['tier']
+)
+
+cache_bytes = Gauge(
+    'cache_bytes',
+    'Encoded size of the valuation cache entries held per tier',
+    ['tier']
+)
+
 class MetricsMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         # Track in-progress requests
@@ -78,8 +158,9 @@ class MetricsMiddleware(BaseHTTPMiddleware):
             
             # Track specific endpoints
             if endpoint == '/api/v1/valuations/predict' and response.status_code == 200:
+                ml_service = getattr(request.app.state, 'ml_service', None)
                 model_predictions_total.labels(
-                    model_version='v1.0.0',
+                    model_version=ml_service.model_version if ml_service else 'unknown',
                     status='success'
                 ).inc()
             
@@ -0,0 +1,59 @@
+import time
+
+from middleware.metrics import circuit_breaker_open
+
+class CircuitBreaker:
+    """Skip calls to a failing dependency for a cool-down window after repeated consecutive failures.
+
+    Once the window passes a single trial call is let through: success closes the breaker, failure
+    starts another window.
+    """
+
+    def __init__(self, dependency: str, failure_threshold: int, reset_seconds: float):
+        self.dependency = dependency
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        # Monotonic time the breaker opened, None while closed
+        self.opened_at = None
+        self.trial_in_flight = False
+        # A trial that never reports back (its caller vanished) stops blocking the next one after reset_seconds
+        self.trial_started_at = 0.0
+        circuit_breaker_open.labels(dependency=dependency).set(0)
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_seconds:
+            return False
+        if self.trial_in_flight and now - self.trial_started_at < self.reset_seconds:
+            return False
+        self.trial_in_flight = True
+        self.trial_started_at = now
+        return True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print(f"{self.dependency} recovered, circuit breaker closed")
+            circuit_breaker_open.labels(dependency=self.dependency).set(0)
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_abandoned(self):
+        """A call ended without an outcome, e.g. it was cancelled; a trial it was making can be retried"""
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or (self.opened_at is None and self.failures >= self.failure_threshold):
+            if self.opened_at is None:
+                print(f"{self.dependency} failed {self.failures} times in a row, skipping it for {self.reset_seconds}s")
+            self.opened_at = time.monotonic()
+            circuit_breaker_open.labels(dependency=self.dependency).set(1)
+        self.trial_in_flight = False
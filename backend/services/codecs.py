@@ -0,0 +1,194 @@
+import json
+import math
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # The msgpack codec is unavailable; JSON and struct still work
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Every stored value starts with <codec tag><compression flag>, so entries stay readable after the codec changes
+UNCOMPRESSED, ZLIB = b'0', b'z'
+# Cached valuations are prefixed with when they go stale (unix time) and how long computing them took
+FRESHNESS_TAG = b'~'
+FRESHNESS = struct.Struct('<dd')
+
+class Codec(ABC):
+    """Turns cache values into bytes and back"""
+
+    name = ''
+    tag = b''
+
+    @abstractmethod
+    def encode(self, value: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        ...
+
+class JsonCodec(Codec):
+    name = 'json'
+    tag = b'j'
+
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(value) if orjson is not None else json.dumps(value).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    tag = b'm'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("msgpack is not installed")
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+class ValuationStructCodec(Codec):
+    """Fixed binary layout for cached ValuationResponse records.
+
+    Numbers are packed little-endian doubles, strings are length-prefixed UTF-8, and anything
+    outside the layout (the explanation, unexpected interval keys) rides along as a JSON tail.
+    """
+
+    name = 'struct'
+    tag = b's'
+
+    INTERVAL_FIELDS = ('lower', 'upper', 'confidence_level', 'uncertainty_percentage')
+    STRING_FIELDS = ('property_id', 'valuation_date', 'model_version')
+    # predicted_value, 4 interval values, price_per_sqft, processing_time_ms (NaN for None), flags, string and tail lengths
+    HEADER = struct.Struct('<7dB3HI')
+    NONE_STRING = 0xFFFF
+    FLAG_CACHED, FLAG_INTERVAL_IN_TAIL = 1, 2
+
+    def __init__(self):
+        self.fallback = JsonCodec()
+
+    def encode(self, value: Dict) -> bytes:
+        interval = value.get('confidence_interval') or {}
+        fixed_interval = set(interval) == set(self.INTERVAL_FIELDS)
+        tail = {
+            key: item for key, item in value.items()
+            if key not in ('predicted_value', 'price_per_sqft', 'processing_time_ms', 'cached', *self.STRING_FIELDS)
+            and (key != 'confidence_interval' or not fixed_interval)
+        }
+        strings = [None if value.get(field) is None else str(value[field]).encode() for field in self.STRING_FIELDS]
+        if any(encoded is not None and len(encoded) >= self.NONE_STRING for encoded in strings):
+            # 0xFFFF is the None marker, so the 16-bit length cannot describe these
+            raise ValueError("String field too long for the struct layout")
+        tail_bytes = self.fallback.encode(tail) if tail else b''
+        processing_time = value.get('processing_time_ms')
+
+        header = self.HEADER.pack(
+            float(value['predicted_value']),
+            *(float(interval[field]) if fixed_interval else 0.0 for field in self.INTERVAL_FIELDS),
+            float(value.get('price_per_sqft', 0.0)),
+            math.nan if processing_time is None else float(processing_time),
+            (self.FLAG_CACHED if value.get('cached') else 0) | (0 if fixed_interval else self.FLAG_INTERVAL_IN_TAIL),
+            *(self.NONE_STRING if encoded is None else len(encoded) for encoded in strings),
+            len(tail_bytes)
+        )
+        return b''.join([header, *(encoded or b'' for encoded in strings), tail_bytes])
+
+    def decode(self, data: bytes) -> Dict:
+        header = self.HEADER.unpack_from(data)
+        flags = header[7]
+        value = {
+            'predicted_value': header[0],
+            'confidence_interval': {
+                'lower': header[1],
+                'upper': header[2],
+                'confidence_level': header[3],
+                'uncertainty_percentage': header[4]
+            },
+            'price_per_sqft': header[5],
+            # NaN marks a missing processing time
+            'processing_time_ms': header[6] if header[6] == header[6] else None,
+            'cached': bool(flags & self.FLAG_CACHED)
+        }
+        if flags & self.FLAG_INTERVAL_IN_TAIL:
+            del value['confidence_interval']
+
+        offset = self.HEADER.size
+        for field, length in zip(self.STRING_FIELDS, header[8:11]):
+            if length == self.NONE_STRING:
+                value[field] = None
+            else:
+                value[field] = data[offset:offset + length].decode()
+                offset += length
+        if header[11]:
+            value.update(self.fallback.decode(data[offset:offset + header[11]]))
+        return value
+
+CODECS = {codec.name: codec for codec in (JsonCodec, MsgpackCodec, ValuationStructCodec)}
+
+class CacheSerializer:
+    """Tagged, optionally zlib-compressed encoding used for everything RedisClient stores"""
+
+    def __init__(self, codec: str = 'json', compress_threshold: int = 1024, compress_level: int = 1):
+        self.codec = CODECS[codec]()
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.fallback = JsonCodec()
+        self._decoders: Dict[bytes, Codec] = {self.codec.tag: self.codec, self.fallback.tag: self.fallback}
+
+    def dumps(self, value: Any) -> bytes:
+        codec = self.codec
+        try:
+            data = codec.encode(value)
+        except (AttributeError, KeyError, TypeError, ValueError, struct.error):
+            # Values that do not fit a fixed layout are stored with the general-purpose codec
+            codec = self.fallback
+            data = codec.encode(value)
+        if self.compress_threshold and len(data) >= self.compress_threshold:
+            compressed = zlib.compress(data, self.compress_level)
+            if len(compressed) < len(data):
+                return codec.tag + ZLIB + compressed
+        return codec.tag + UNCOMPRESSED + data
+
+    def loads(self, data: Optional[bytes]) -> Any:
+        if not data:
+            return None
+        if isinstance(data, str):
+            data = data.encode()
+        if data[:1] in (b'{', b'['):
+            # Plain JSON written before values were tagged
+            return json.loads(data)
+        payload = data[2:]
+        if data[1:2] == ZLIB:
+            payload = zlib.decompress(payload)
+        return self._decoder(data[:1]).decode(payload)
+
+    def _decoder(self, tag: bytes) -> Codec:
+        if tag not in self._decoders:
+            codec = next((codec for codec in CODECS.values() if codec.tag == tag), None)
+            if codec is None:
+                raise ValueError(f"Unknown cache codec tag {tag!r}")
+            self._decoders[tag] = codec()
+        return self._decoders[tag]
+
+def stamp(data: bytes, stale_at: float, compute_seconds: float) -> bytes:
+    """Prefix an encoded value with its freshness"""
+    return FRESHNESS_TAG + FRESHNESS.pack(stale_at, compute_seconds) + data
+
+def unstamp(data: bytes) -> Tuple[bytes, Optional[float], float]:
+    """Split a stored value into the encoded value, when it goes stale (None if never) and its compute time"""
+    if data[:1] != FRESHNESS_TAG:
+        return data, None, 0.0
+    stale_at, compute_seconds = FRESHNESS.unpack_from(data, 1)
+    return data[1 + FRESHNESS.size:], stale_at, compute_seconds
@@ -0,0 +1,229 @@
+import io
+import json
+import numpy as np
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow and Parquet bodies are rejected without pyarrow; column JSON still works
+    pa = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MEDIA_TYPE = 'application/json'
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+PARQUET_MEDIA_TYPE = 'application/vnd.apache.parquet'
+
+MEDIA_TYPES = {
+    JSON_MEDIA_TYPE: 'json',
+    ARROW_MEDIA_TYPE: 'arrow',
+    'application/vnd.apache.arrow.file': 'arrow',
+    PARQUET_MEDIA_TYPE: 'parquet',
+    'application/x-parquet': 'parquet',
+}
+
+RESPONSE_MEDIA_TYPES = {
+    'json': JSON_MEDIA_TYPE,
+    'arrow': ARROW_MEDIA_TYPE,
+    'parquet': PARQUET_MEDIA_TYPE,
+}
+
+# Failing row indices reported per violated constraint
+MAX_REPORTED_ROWS = 10
+
+class ColumnarError(ValueError):
+    """Columnar payload that cannot be decoded or fails validation"""
+
+    def __init__(self, message: str, errors: Optional[List[Dict]] = None, status_code: int = 422):
+        super().__init__(message)
+        self.errors = errors or []
+        self.status_code = status_code
+
+class ColumnSpec(NamedTuple):
+    name: str
+    numeric: bool
+    integer: bool
+    required: bool
+    default: object
+    ge: Optional[float]
+    gt: Optional[float]
+    le: Optional[float]
+
+def column_specs(model: Type[BaseModel]) -> List[ColumnSpec]:
+    """Derive per-column checks from a Pydantic model so the columnar path enforces the same ranges"""
+    specs = []
+    for name, field in model.model_fields.items():
+        bounds = {'ge': None, 'gt': None, 'le': None}
+        for constraint in field.metadata:
+            for key in bounds:
+                if getattr(constraint, key, None) is not None:
+                    bounds[key] = float(getattr(constraint, key))
+
+        annotation = _unwrap_optional(field.annotation)
+        specs.append(ColumnSpec(
+            name=name,
+            numeric=annotation in (int, float),
+            integer=annotation is int,
+            required=field.is_required(),
+            default=None if field.is_required() else field.default,
+            **bounds
+        ))
+    return specs
+
+def _unwrap_optional(annotation):
+    """int for Optional[int], unchanged for anything else"""
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+def media_kind(content_type: Optional[str]) -> str:
+    """Payload format for a Content-Type header: 'json', 'arrow' or 'parquet'"""
+    media_type = (content_type or JSON_MEDIA_TYPE).split(';')[0].strip().lower()
+    if media_type not in MEDIA_TYPES:
+        raise ColumnarError(f"Unsupported media type {media_type}", status_code=415)
+    kind = MEDIA_TYPES[media_type]
+    if kind != 'json' and pa is None:
+        raise ColumnarError(f"{media_type} requires pyarrow, which is not installed", status_code=415)
+    return kind
+
+def decode_columns(body: bytes, kind: str) -> Dict[str, object]:
+    """Decode a payload into field name -> list or array, without building per-row objects"""
+    try:
+        if kind == 'json':
+            payload = orjson.loads(body) if orjson is not None else json.loads(body)
+            columns = payload.get('columns') if isinstance(payload, dict) else None
+            if not isinstance(columns, dict):
+                raise ColumnarError('Body must be {"columns": {"<field>": [values, ...], ...}}')
+            return columns
+
+        if kind == 'arrow':
+            table = pa_ipc.open_stream(body).read_all() if body[:6] != b'ARROW1' else pa_ipc.open_file(io.BytesIO(body)).read_all()
+        else:
+            table = pq.read_table(io.BytesIO(body))
+        return {
+            name: table.column(name).to_numpy(zero_copy_only=False)
+            for name in table.column_names
+        }
+    except ColumnarError:
+        raise
+    except Exception as e:
+        raise ColumnarError(f"Could not decode {kind} payload: {e}", status_code=400)
+
+def validate_columns(columns: Dict[str, object], specs: List[ColumnSpec], max_rows: int) -> Tuple[Dict[str, np.ndarray], int]:
+    """Check every column at once and return float64 arrays for numeric fields (defaults filled in)"""
+    names = {spec.name for spec in specs}
+    # A scalar, string or null where a column belongs has no usable length
+    not_columns = [name for name, values in columns.items() if name in names and not _is_column(values)]
+    if not_columns:
+        raise ColumnarError('Every column must be a list of values', [{'column': name, 'error': 'not a list'} for name in not_columns])
+    lengths = {name: len(values) for name, values in columns.items() if name in names}
+    if len(set(lengths.values())) > 1:
+        raise ColumnarError('All columns must have the same length', [{'column': name, 'length': length} for name, length in lengths.items()])
+    n_rows = next(iter(lengths.values()), 0)
+    if n_rows == 0:
+        raise ColumnarError('Payload contains no rows')
+    if n_rows > max_rows:
+        raise ColumnarError(f"At most {max_rows} rows per request", status_code=413)
+
+    validated = {}
+    errors = []
+    for spec in specs:
+        values = columns.get(spec.name)
+        if values is None:
+            if spec.required:
+                errors.append({'column': spec.name, 'error': 'missing required column'})
+            elif spec.numeric:
+                validated[spec.name] = np.full(n_rows, np.nan if spec.default is None else float(spec.default))
+            else:
+                validated[spec.name] = np.full(n_rows, spec.default, dtype=object)
+            continue
+
+        if not spec.numeric:
+            values = _object_column(values)
+            if spec.required:
+                failed = np.flatnonzero(np.equal(values, None))
+                _report(errors, spec.name, 'required', failed)
+            validated[spec.name] = values
+            continue
+
+        try:
+            values = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            values = None
+        if values is None or values.ndim != 1:
+            errors.append({'column': spec.name, 'error': 'values must be numbers'})
+            continue
+
+        missing = np.isnan(values)
+        if spec.required:
+            _report(errors, spec.name, 'required', np.flatnonzero(missing))
+        elif spec.default is not None and missing.any():
+            values = np.where(missing, float(spec.default), values)
+            missing = np.isnan(values)
+
+        # NaN compares False everywhere, so optional gaps pass the range checks
+        present = ~missing
+        if spec.integer:
+            _report(errors, spec.name, 'integer', np.flatnonzero(present & (values != np.round(values))))
+        if spec.ge is not None:
+            _report(errors, spec.name, f'>= {spec.ge:g}', np.flatnonzero(present & (values < spec.ge)))
+        if spec.gt is not None:
+            _report(errors, spec.name, f'> {spec.gt:g}', np.flatnonzero(present & (values <= spec.gt)))
+        if spec.le is not None:
+            _report(errors, spec.name, f'<= {spec.le:g}', np.flatnonzero(present & (values > spec.le)))
+        validated[spec.name] = values
+
+    if errors:
+        raise ColumnarError('Columnar payload failed validation', errors)
+    return validated, n_rows
+
+def _is_column(values) -> bool:
+    return isinstance(values, list) or (isinstance(values, np.ndarray) and values.ndim == 1)
+
+def _object_column(values) -> np.ndarray:
+    """1-D object array even when the values are themselves lists"""
+    if isinstance(values, np.ndarray) and values.dtype == object:
+        return values
+    return np.fromiter(values, dtype=object, count=len(values))
+
+def _report(errors: List[Dict], column: str, constraint: str, failed: np.ndarray):
+    if len(failed):
+        errors.append({
+            'column': column,
+            'constraint': constraint,
+            'failed_rows': len(failed),
+            'rows': failed[:MAX_REPORTED_ROWS].tolist()
+        })
+
+def encode_columns(columns: Dict[str, object], kind: str, metadata: Optional[Dict] = None) -> bytes:
+    """Encode result columns in the request's format; JSON carries metadata alongside the columns"""
+    if kind == 'json':
+        payload = {
+            **(metadata or {}),
+            'columns': {
+                name: values.tolist() if isinstance(values, np.ndarray) else list(values)
+                for name, values in columns.items()
+            }
+        }
+        return orjson.dumps(payload) if orjson is not None else json.dumps(payload).encode()
+
+    table = pa.table(
+        {name: values.tolist() if isinstance(values, np.ndarray) and values.dtype == object else values for name, values in columns.items()},
+        metadata={key: json.dumps(value) for key, value in (metadata or {}).items()}
+    )
+    sink = io.BytesIO()
+    if kind == 'arrow':
+        with pa_ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    return sink.getvalue()
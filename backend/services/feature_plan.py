@@ -0,0 +1,125 @@
+import hashlib
+import numpy as np
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+_NAN = float('nan')
+
+# Request fields that feed a differently named model feature
+FEATURE_SOURCES = {
+    'expenses': 'annual_expenses',
+}
+
+# Values used when a request leaves a feature out
+FEATURE_DEFAULTS = {
+    'crime_rate': 50.0,  # Medium crime rate
+    'school_rating': 7.0,  # Good school rating
+    'distance_to_highway': 2.0,  # 2 miles
+    'distance_to_public_transit': 1.0,  # 1 mile
+    'building_age': 10.0,  # 10 years old
+    'walk_score': 70.0,  # Walkable
+    'transit_score': 60.0,  # Some transit
+}
+
+# Column transforms applied after defaults are filled in, keyed by model feature
+FEATURE_TRANSFORMS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {}
+
+class FeatureSpec(NamedTuple):
+    column: int
+    name: str
+    source: str
+    default: float
+    transform: Optional[Callable[[np.ndarray], np.ndarray]]
+
+class FeaturePlan:
+    """Feature assembly compiled once per model version: where each column comes from and what fills a gap
+
+    Missing fields, None and NaN all take the column default. The matrix dtype defaults to float64
+    because LightGBM compares splits in double precision; float32 is safe for XGBoost-only ensembles.
+    """
+
+    def __init__(
+        self,
+        feature_names: List[str],
+        sources: Optional[Mapping[str, str]] = None,
+        defaults: Optional[Mapping[str, float]] = None,
+        transforms: Optional[Mapping[str, Callable]] = None,
+        dtype=np.float64
+    ):
+        sources = FEATURE_SOURCES if sources is None else sources
+        defaults = FEATURE_DEFAULTS if defaults is None else defaults
+        transforms = FEATURE_TRANSFORMS if transforms is None else transforms
+
+        self.dtype = np.dtype(dtype)
+        self.specs = [
+            FeatureSpec(
+                column=column,
+                name=name,
+                source=sources.get(name, name),
+                default=float(defaults.get(name, 0.0)),
+                transform=transforms.get(name)
+            )
+            for column, name in enumerate(feature_names)
+        ]
+        self.feature_names = list(feature_names)
+        self.sources = tuple(spec.source for spec in self.specs)
+        self.defaults = np.array([spec.default for spec in self.specs], dtype=self.dtype)
+        self._transforms = [(spec.column, spec.transform) for spec in self.specs if spec.transform is not None]
+
+    @property
+    def n_features(self) -> int:
+        return len(self.specs)
+
+    def row(self, property_data: Mapping, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Fill one feature row, shape (n_features,), into out if given"""
+        return self.matrix([property_data], None if out is None else out.reshape(1, -1))[0]
+
+    def matrix(self, properties: Sequence[Mapping], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Fill a (n_rows, n_features) matrix from a list of dicts, into out if given"""
+        sources = self.sources
+        # One flat list converted in a single call; gaps become NaN and are patched in one vectorized pass
+        values = np.array(
+            [_NAN if value is None else value for row in properties for value in map(row.get, sources)],
+            dtype=np.float64
+        )
+        return self._finish(values.reshape(len(properties), self.n_features), out)
+
+    def from_columns(self, columns: Mapping[str, Sequence], n_rows: Optional[int] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Fill the matrix from column-oriented data: field name to a sequence or array of values"""
+        if n_rows is None:
+            n_rows = len(next(iter(columns.values()))) if columns else 0
+        values = np.empty((n_rows, self.n_features), dtype=np.float64)
+        for spec in self.specs:
+            column = columns.get(spec.source)
+            if column is None:
+                values[:, spec.column] = np.nan
+            else:
+                values[:, spec.column] = np.asarray(column, dtype=np.float64)
+        return self._finish(values, out)
+
+    def cache_keys(self, features: np.ndarray, significant_digits: int = 6) -> List[str]:
+        """One digest per row of the feature matrix rounded to significant_digits; inputs that only differ
+        in fields the models never see, or below that precision, share a key
+        """
+        values = np.asarray(features, dtype=np.float64).reshape(-1, self.n_features)
+        nonzero = values != 0
+        exponents = np.zeros(values.shape, dtype=np.int64)
+        exponents[nonzero] = np.floor(np.log10(np.abs(values[nonzero]))).astype(np.int64) - (significant_digits - 1)
+        mantissas = np.round(values / 10.0 ** exponents).astype(np.int64)
+        # Rounding up to the next power of ten (9.999999 -> 10.0000) must land on the same key as 10.0000 itself
+        carried = np.abs(mantissas) >= 10 ** significant_digits
+        mantissas[carried] //= 10
+        exponents[carried] += 1
+        rows = np.concatenate([mantissas, exponents], axis=1)
+        return [hashlib.md5(row.tobytes()).hexdigest() for row in rows]
+
+    def _finish(self, values: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+        missing = np.isnan(values)
+        if missing.any():
+            values = np.where(missing, self.defaults, values)
+        for column, transform in self._transforms:
+            values[:, column] = transform(values[:, column])
+
+        if out is None:
+            return values.astype(self.dtype, copy=False)
+        out[...] = values
+        return out
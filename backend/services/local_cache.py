@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from middleware.metrics import cache_bytes, cache_entries, cache_evictions_total, cache_requests_total
+
+class LocalCache:
+    """Bounded in-process LRU with per-entry TTL, evicting on entry count and on total encoded size.
+
+    Values are stored encoded (the same bytes written to Redis) so callers always decode a private
+    copy and the memory bound counts what is actually held.
+    """
+
+    def __init__(self, tier: str, max_entries: int, max_bytes: int, ttl: float):
+        self.tier = tier
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (expires_at on the monotonic clock, encoded value), least recently used first
+        self.entries: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._evict(key, 'expired')
+            entry = None
+        if entry is None:
+            cache_requests_total.labels(tier=self.tier, result='miss').inc()
+            return None
+        self.entries.move_to_end(key)
+        cache_requests_total.labels(tier=self.tier, result='hit').inc()
+        return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        """Store an encoded value for at most the tier's TTL; values larger than the whole budget are not kept"""
+        if key in self.entries:
+            self._remove(key)
+        if len(value) > self.max_bytes:
+            self._update_gauges()
+            return
+        self.entries[key] = (time.monotonic() + min(ttl or self.ttl, self.ttl), value)
+        self.size += len(value)
+
+        while len(self.entries) > self.max_entries:
+            self._evict(next(iter(self.entries)), 'size')
+        while self.size > self.max_bytes:
+            self._evict(next(iter(self.entries)), 'memory')
+        self._update_gauges()
+
+    def delete(self, key: str):
+        if key in self.entries:
+            self._remove(key)
+            self._update_gauges()
+
+    def clear(self, reason: str = 'invalidated'):
+        if self.entries:
+            cache_evictions_total.labels(tier=self.tier, reason=reason).inc(len(self.entries))
+        self.entries.clear()
+        self.size = 0
+        self._update_gauges()
+
+    def _evict(self, key: str, reason: str):
+        self._remove(key)
+        cache_evictions_total.labels(tier=self.tier, reason=reason).inc()
+
+    def _remove(self, key: str):
+        _, value = self.entries.pop(key)
+        self.size -= len(value)
+
+    def _update_gauges(self):
+        cache_entries.labels(tier=self.tier).set(len(self.entries))
+        cache_bytes.labels(tier=self.tier).set(self.size)
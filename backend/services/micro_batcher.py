@@ -0,0 +1,125 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import Request
+
+from middleware.metrics import inference_queue_depth, inference_batch_size
+
+class MicroBatcher:
+    """Coalesce concurrent single-property predictions into one batched model call.
+
+    predict_batch(properties, explain=flags) gets one explain flag per property, so only the requests
+    that asked for an explanation pay for it.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[..., Awaitable[List[Dict]]],
+        window_ms: Optional[float] = None,
+        max_batch_size: Optional[int] = None
+    ):
+        self.predict_batch = predict_batch
+        # How long the first request of a batch waits for company, and the hard cap on batch size
+        self.window = (window_ms if window_ms is not None else float(os.getenv('ML_BATCH_WINDOW_MS', '3'))) / 1000
+        self.max_batch_size = max_batch_size or int(os.getenv('ML_BATCH_MAX_SIZE', '64'))
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._collector: Optional[asyncio.Task] = None
+        self._dispatches: Set[asyncio.Task] = set()
+
+    def start(self):
+        """Start collecting requests on the running event loop"""
+        if self._collector is None:
+            self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        """Stop collecting and fail any requests still waiting in the queue"""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+        while not self.queue.empty():
+            _, _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Valuation batcher stopped"))
+        inference_queue_depth.set(0)
+
+    async def submit(self, property_data: Dict, explain: bool = False) -> Dict:
+        """Queue one property for the next batch and wait for its prediction, with contributions if explain"""
+        if self._collector is None:
+            return (await self.predict_batch([property_data], explain=[explain]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((property_data, explain, future))
+        inference_queue_depth.set(self.queue.qsize())
+        return await future
+
+    async def _collect(self):
+        """Gather requests until the window closes or the batch is full, then dispatch"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+
+            while len(batch) < self.max_batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                # Not wait_for(queue.get()): before 3.12 a get finishing as the timeout fires loses its item
+                getter = asyncio.ensure_future(self.queue.get())
+                try:
+                    await asyncio.wait([getter], timeout=remaining)
+                finally:
+                    # Also on stop(), so no orphaned getter takes a request after the queue is failed
+                    if not getter.done():
+                        getter.cancel()
+                if not getter.done():
+                    # Settles the cancelled getter; unlike awaiting it, never swallows a cancellation of our own
+                    await asyncio.wait([getter])
+                # A getter cancelled before it took an item leaves the item queued for the next batch
+                if getter.done() and not getter.cancelled():
+                    batch.append(getter.result())
+
+            inference_queue_depth.set(self.queue.qsize())
+            inference_batch_size.observe(len(batch))
+
+            # Run the batch without holding up collection of the next one
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Dict, bool, asyncio.Future]]):
+        """Run one batched prediction and fan results back out to the waiting requests"""
+        # Skip requests whose clients have already gone away
+        batch = [item for item in batch if not item[2].done()]
+        if not batch:
+            return
+
+        try:
+            results = await self.predict_batch(
+                [property_data for property_data, _, _ in batch],
+                explain=[explain for _, explain, _ in batch]
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+def get_valuation_batcher(request: Request) -> MicroBatcher:
+    """Return the per-worker MicroBatcher created in main.lifespan"""
+    return request.app.state.valuation_batcher
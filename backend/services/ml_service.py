@@ -1,203 +1,560 @@
 import pickle
+import joblib
 import json
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional, Tuple
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
 import os
 import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-import tensorflow as tf
+from fastapi import HTTPException, Request
 
-class MLService:
-    def __init__(self):
+from services.feature_plan import FeaturePlan
+from services.nn_engine import NumpyMLP
+from services.tree_engine import FlatTreeEnsemble, StackedTrees, check_parity
+from services.tree_explainer import EnsembleExplainer
+from services.model_bundle import is_bundle, load_bundle
+from services.model_registry import ModelRegistry
+
+class ExplanationUnavailable(Exception):
+    """Raised when the active model version has no TreeSHAP explainer"""
+
+class InferenceQueueFull(Exception):
+    """Raised when more inferences are pending than the executor is allowed to queue"""
+    
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+# Fields of the synthetic properties used to warm up a newly loaded model version
+WARMUP_PROPERTY = {
+    'square_feet': 50000,
+    'building_age': 15,
+    'num_floors': 5,
+    'occupancy_rate': 0.92,
+    'walk_score': 75,
+    'transit_score': 65,
+    'crime_rate': 40,
+    'school_rating': 7,
+    'distance_to_downtown': 3.5,
+    'annual_revenue': 1500000,
+    'annual_expenses': 500000,
+    'cap_rate': 0.065,
+    'net_operating_income': 1000000,
+}
+
+# Ensemble weights of the point models; tree-based models carry more weight
+MODEL_WEIGHTS = {
+    'xgboost': 0.4,
+    'lightgbm': 0.4,
+    'neural_network': 0.2,
+}
+
+# Quantile boosters written by ml-pipeline/quantile_models.py
+QUANTILE_FAMILIES = ('xgboost', 'lightgbm')
+QUANTILE_BOUNDS = ('lower', 'upper')
+
+def explained_rows(explain: Union[bool, Sequence[bool]], n_rows: int) -> np.ndarray:
+    """Indices of the rows to explain: every row for True, none for False, else those flagged per row"""
+    if isinstance(explain, bool):
+        return np.arange(n_rows) if explain else np.empty(0, dtype=np.intp)
+    return np.flatnonzero(np.asarray(explain, dtype=bool))
+
+class ModelSet:
+    """Everything loaded for one model version; swapped in as a whole so a request never mixes versions"""
+    
+    def __init__(self, version: str = 'mock', source: Optional[str] = None, feature_names: Optional[List[str]] = None):
+        self.version = version
+        self.source = source
+        self.feature_names = feature_names or []
+        # Compiled once here so per-request feature assembly is a single vectorized fill
+        self.feature_plan = FeaturePlan(self.feature_names)
         self.xgb_model = None
         self.lgb_model = None
         self.nn_model = None
+        self.xgb_trees: Optional[FlatTreeEnsemble] = None
+        self.lgb_trees: Optional[FlatTreeEnsemble] = None
+        # Interval bound boosters keyed '<family>_<bound>', and the quantile levels they were trained for
+        self.quantile_trees: Dict[str, FlatTreeEnsemble] = {}
+        self.interval_alphas: Optional[Dict[str, float]] = None
+        # Conformal widening (times the raw interval width) and the test coverage measured at training time
+        self.interval_margin: Optional[float] = None
+        self.interval_coverage: Optional[float] = None
+        # Forests stacked at export time, per input precision; mapped from the bundle rather than rebuilt
+        self.stacked_forests: Dict[str, Tuple[List[str], FlatTreeEnsemble]] = {}
+        self.forest: Optional[StackedTrees] = None
+        self.explainer: Optional[EnsembleExplainer] = None
         self.scaler = None
         self.label_encoders = {}
-        self.feature_names = []
-        self.shap_explainer = None
+        self.feature_importance: Dict[str, float] = {}
+        self.loaded_at = datetime.utcnow()
+    
+    def build_forest(self):
+        """Stack every flattened booster so one traversal per input precision evaluates them all"""
+        flat = {}
+        if self.xgb_trees is not None:
+            flat['xgboost'] = self.xgb_trees
+        if self.lgb_trees is not None:
+            flat['lightgbm'] = self.lgb_trees
+        flat.update(self.quantile_trees)
+        # Fast explanations attribute the point boosters, weighted by their share of the tree weight
+        tree_weight = sum(MODEL_WEIGHTS[name] for name in flat if name in MODEL_WEIGHTS)
+        contribution_weights = {name: MODEL_WEIGHTS[name] / tree_weight for name in flat if name in MODEL_WEIGHTS}
+        self.forest = StackedTrees(flat, contribution_weights, self.stacked_forests) if flat else None
+    
+    def build_explainer(self):
+        """Build the TreeSHAP explainer once per version; explanations stay unavailable if it cannot be built"""
+        ensembles = {}
+        for name, trees, model, flatten in (
+            ('xgboost', self.xgb_trees, self.xgb_model, FlatTreeEnsemble.from_xgboost),
+            ('lightgbm', self.lgb_trees, self.lgb_model, FlatTreeEnsemble.from_lightgbm),
+        ):
+            try:
+                if trees is None and model is not None:
+                    trees = flatten(model)
+            except Exception as e:
+                print(f"Cannot explain {name} model: {e}")
+                trees = None
+            if trees is not None:
+                ensembles[name] = trees
+        if not ensembles:
+            return
+        try:
+            self.explainer = EnsembleExplainer(ensembles, MODEL_WEIGHTS, self.feature_names)
+            print(f"SHAP explainer built for {self.version}: {sorted(ensembles)}")
+        except Exception as e:
+            print(f"SHAP explainer unavailable for {self.version}: {e}")
+    
+    @property
+    def has_intervals(self) -> bool:
+        return bool(self.interval_alphas) and all(
+            any(name.endswith(f'_{bound}') for name in self.quantile_trees) for bound in QUANTILE_BOUNDS
+        )
+    
+    @property
+    def confidence_level(self) -> int:
+        if not self.has_intervals:
+            return 95
+        if self.interval_margin is None and self.interval_coverage is not None:
+            # Uncalibrated boosters under-cover their nominal level; report what they actually achieved
+            return int(round(self.interval_coverage * 100))
+        return int(round((self.interval_alphas['upper'] - self.interval_alphas['lower']) * 100))
+    
+    def set_interval(self, interval: Optional[Dict]):
+        """Take the quantile levels, conformal margin and measured coverage from training metadata"""
+        interval = interval or {}
+        self.interval_alphas = interval.get('alphas')
+        self.interval_margin = interval.get('margin')
+        self.interval_coverage = interval.get('coverage')
+    
+    @property
+    def has_xgb(self) -> bool:
+        return self.xgb_model is not None or self.xgb_trees is not None
+    
+    @property
+    def has_lgb(self) -> bool:
+        return self.lgb_model is not None or self.lgb_trees is not None
+    
+    @property
+    def has_models(self) -> bool:
+        return self.has_xgb or self.has_lgb or self.nn_model is not None
+    
+    def predictions(self, features: np.ndarray, explain: Union[bool, Sequence[bool]] = False) -> Tuple[np.ndarray, np.ndarray, Optional[Tuple[np.ndarray, np.ndarray]], Optional[np.ndarray]]:
+        """Run every loaded model once over the feature matrix.
+        
+        Returns (n_models, n_rows) point predictions, their weights, (lower, upper) interval bounds
+        averaged over the quantile boosters when the version has them, as offsets from the middle of that
+        band, and for the rows explain selects (see explained_rows) the Saabas contributions of the tree
+        models read off the same traversal.
+        """
+        outputs, contributions = {}, None
+        if self.forest is not None:
+            rows = explained_rows(explain, len(features))
+            outputs, contributions = self.forest.predict_with_contributions(features, len(rows) > 0, rows)
+        
+        # Boosters that could not be flattened fall back to the library's own predict
+        if 'xgboost' not in outputs and self.xgb_model is not None:
+            outputs['xgboost'] = self.xgb_model.predict(features)
+        if 'lightgbm' not in outputs and self.lgb_model is not None:
+            outputs['lightgbm'] = self.lgb_model.predict(features)
+        if self.nn_model is not None:
+            outputs['neural_network'] = self.nn_model.predict(features)
+        
+        bounds = None
+        if self.has_intervals:
+            lower, upper = (
+                np.mean([output for name, output in outputs.items() if name.endswith(f'_{bound}')], axis=0)
+                for bound in QUANTILE_BOUNDS
+            )
+            if self.interval_margin:
+                # Same widening the margin was calibrated for in ml-pipeline/quantile_models.py
+                width = np.maximum(upper - lower, 0)
+                lower, upper = lower - self.interval_margin * width, upper + self.interval_margin * width
+            # Only the band's width carries over: the ensemble point, with the neural network in it, can sit
+            # outside the trees' quantiles, and so can the trees' own point
+            half_width = np.abs(upper - lower) / 2
+            bounds = (-half_width, half_width)
+        
+        names = [name for name in MODEL_WEIGHTS if name in outputs]
+        if not names:
+            return np.empty((0, len(features))), np.empty(0), None, None
+        return (
+            np.vstack([outputs[name] for name in names]).astype(np.float64),
+            np.array([MODEL_WEIGHTS[name] for name in names]),
+            bounds,
+            contributions
+        )
+
+class MLService:
+    def __init__(self):
+        # Active model version; replaced by a single assignment when the registry moves on
+        self.models = ModelSet()
         self.is_ready = False
+        # Evaluate boosters through flattened NumPy trees instead of the sklearn wrappers
+        self.use_flat_trees = os.getenv('ML_FLAT_TREES', '1') == '1'
+        # Inference runs off the event loop on a bounded 'thread' or 'process' pool
+        self.executor_kind = os.getenv('ML_EXECUTOR', 'thread')
+        self.inference_workers = int(os.getenv('ML_INFERENCE_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self.max_pending_inferences = int(os.getenv('ML_MAX_PENDING_INFERENCES', '32'))
+        self.retry_after_seconds = int(os.getenv('ML_RETRY_AFTER_SECONDS', '1'))
+        self.executor: Optional[Executor] = None
+        self.pending_inferences = 0
         # In Docker container, models are mounted at /app/models
         self.models_path = '/app/models' if os.path.exists('/app/models') else os.path.join(os.path.dirname(__file__), '../../ml-pipeline/models')
+        # Versioned bundles published by the training pipeline, polled for new versions
+        self.registry = ModelRegistry(os.getenv('ML_REGISTRY_PATH', os.path.join(self.models_path, 'registry')))
+        self.registry_poll_seconds = float(os.getenv('ML_REGISTRY_POLL_SECONDS', '30'))
+        self.warmup_rounds = int(os.getenv('ML_WARMUP_ROUNDS', '3'))
+        self.watch_task: Optional[asyncio.Task] = None
+        self.failed_versions = set()
+        self.reload_lock = asyncio.Lock()
+        # Significant digits kept per feature when building valuation cache keys
+        self.cache_key_digits = int(os.getenv('VALUATION_CACHE_KEY_DIGITS', '6'))
+        # Awaited with the new version after every swap, e.g. to invalidate cached valuations
+        self.version_listeners: List[Callable[[str], Awaitable]] = []
+    
+    @property
+    def feature_names(self) -> List[str]:
+        return self.models.feature_names
+    
+    @property
+    def model_version(self) -> str:
+        return self.models.version
         
     async def load_models(self):
         """Load all trained models"""
         try:
             # Run model loading in executor to avoid blocking
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, self._load_models_sync)
+            models = await loop.run_in_executor(None, self._load_models_sync)
             
             # Check if at least one model loaded successfully
-            models_loaded = [self.xgb_model is not None, self.lgb_model is not None, self.nn_model is not None]
-            if any(models_loaded):
-                self.is_ready = True
-                print(f"Models loaded successfully: XGB={self.xgb_model is not None}, LGB={self.lgb_model is not None}, NN={self.nn_model is not None}")
+            if models.has_models:
+                self.models = models
+                print(f"Models {models.version} loaded successfully: XGB={models.has_xgb}, LGB={models.has_lgb}, NN={models.nn_model is not None}")
             else:
                 print("No models loaded successfully, using mock models")
-                self._create_mock_models()
-                self.is_ready = True
+                self.models = self._create_mock_models()
                 
         except Exception as e:
             print(f"Error loading models: {e}")
             # Create mock models for development
-            self._create_mock_models()
-            self.is_ready = True
+            self.models = self._create_mock_models()
+        
+        self.is_ready = True
+        self._start_executor()
+        self.start_watcher()
+    
+    def start_watcher(self):
+        """Poll the model registry in the background for newly published versions"""
+        if self.watch_task is None and self.registry_poll_seconds > 0:
+            self.watch_task = asyncio.create_task(self._watch_registry())
     
-    def _load_models_sync(self):
+    async def _watch_registry(self):
+        while True:
+            await asyncio.sleep(self.registry_poll_seconds)
+            try:
+                await self.check_for_new_version()
+            except Exception as e:
+                print(f"Model registry check failed: {e}")
+    
+    async def check_for_new_version(self) -> bool:
+        """Load, warm and swap in the registry's active version if it is not the one being served"""
+        version = await asyncio.get_running_loop().run_in_executor(None, self.registry.active_version)
+        if version is None or version == self.models.version or version in self.failed_versions:
+            return False
+        return await self.reload(version)
+    
+    async def reload(self, version: str) -> bool:
+        """Swap to a registry version without interrupting in-flight predictions"""
+        async with self.reload_lock:
+            if version == self.models.version:
+                return False
+            
+            print(f"Loading model version {version} (serving {self.models.version})")
+            loop = asyncio.get_running_loop()
+            try:
+                # Load and warm on the default pool; the inference executor keeps serving the old version
+                models = await loop.run_in_executor(None, self._load_version_sync, version)
+                await loop.run_in_executor(None, self._warm_up, models)
+            except Exception as e:
+                print(f"Model version {version} rejected, still serving {self.models.version}: {e}")
+                self.failed_versions.add(version)
+                return False
+            
+            # Requests already running hold a reference to the previous ModelSet and finish on it
+            previous, self.models = self.models, models
+            print(f"Model version {version} is live (replaced {previous.version})")
+            for listener in self.version_listeners:
+                try:
+                    await listener(version)
+                except Exception as e:
+                    print(f"Model version listener failed: {e}")
+            return True
+    
+    def _load_version_sync(self, version: str) -> 'ModelSet':
+        """Load one registry version; unlike startup loading there is no fallback"""
+        models = self._load_bundle_sync(self.registry.path(version))
+        models.version = version
+        if not models.has_models:
+            raise ValueError("bundle contains no models")
+        return models
+    
+    def _warm_up(self, models: 'ModelSet'):
+        """Run synthetic batches through a freshly loaded version so its first real request is not cold"""
+        for batch_size in [1, 16, 64][:max(self.warmup_rounds, 1)]:
+            results = self._predict_batch_sync([WARMUP_PROPERTY] * batch_size, models, explain=True)
+            values = np.array([result['predicted_value'] for result in results])
+            if not np.all(np.isfinite(values)) or np.any(values <= 0):
+                raise ValueError(f"warm-up produced invalid predictions: {values[:3]}")
+    
+    def _start_executor(self):
+        """Create the inference pool once the models are in place"""
+        if self.executor is not None:
+            return
+        
+        if self.executor_kind == 'process':
+            # Each worker process loads its own copy of the models from models_path
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.inference_workers,
+                initializer=_init_inference_worker,
+                initargs=(self.models_path, self.registry.root)
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.inference_workers,
+                thread_name_prefix='inference'
+            )
+        print(f"Inference executor started: {self.executor_kind} x{self.inference_workers}, max pending {self.max_pending_inferences}")
+    
+    def shutdown(self):
+        """Stop the registry watcher and the inference pool"""
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            self.watch_task = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+    
+    async def _run_inference(self, method: str, *args):
+        """Run a synchronous inference method on the executor, rejecting work once the backlog is full"""
+        if self.pending_inferences >= self.max_pending_inferences:
+            raise InferenceQueueFull(self.retry_after_seconds)
+        
+        self._start_executor()
+        loop = asyncio.get_running_loop()
+        self.pending_inferences += 1
+        try:
+            if isinstance(self.executor, ProcessPoolExecutor):
+                # Workers hold their own copy of the models and reload when the served version changes
+                return await loop.run_in_executor(self.executor, _call_inference_worker, self.models.version, method, *args)
+            return await loop.run_in_executor(self.executor, getattr(self, method), *args)
+        finally:
+            self.pending_inferences -= 1
+    
+    def _load_models_sync(self) -> ModelSet:
         """Synchronous model loading"""
         print(f"Loading models from: {self.models_path}")
         
+        # Prefer the active registry version, then an unversioned bundle, then the pickled models
+        version = self.registry.active_version()
+        if version is not None:
+            try:
+                return self._load_version_sync(version)
+            except Exception as e:
+                print(f"Failed to load model version {version}, falling back: {e}")
+        
+        bundle_path = os.path.join(self.models_path, 'bundle')
+        if is_bundle(bundle_path):
+            try:
+                return self._load_bundle_sync(bundle_path)
+            except Exception as e:
+                print(f"Failed to load model bundle, falling back to pickled models: {e}")
+        
+        version = 'unversioned'
+        metadata = {}
+        
         # Load model metadata first to get feature names
         metadata_path = os.path.join(self.models_path, 'model_metadata.json')
         if os.path.exists(metadata_path):
             with open(metadata_path, 'r') as f:
                 metadata = json.load(f)
-                self.feature_names = metadata.get('features', [])
-                print(f"Loaded feature names from metadata: {self.feature_names}")
+                feature_names = metadata.get('features', [])
+                version = metadata.get('version', version)
+                print(f"Loaded feature names from metadata: {feature_names}")
         else:
             print("No metadata found, using default feature names")
-            self.feature_names = [
+            feature_names = [
                 'square_feet', 'building_age', 'num_floors', 'occupancy_rate',
                 'walk_score', 'transit_score', 'crime_rate', 'school_rating', 
                 'distance_to_downtown', 'annual_revenue', 'expenses', 'cap_rate', 'net_operating_income'
             ]
+        models = ModelSet(version=version, source=self.models_path, feature_names=feature_names)
         
         # Load XGBoost model
         xgb_path = os.path.join(self.models_path, 'xgboost_model.pkl')
         if os.path.exists(xgb_path):
             print(f"Loading XGBoost model from: {xgb_path}")
             with open(xgb_path, 'rb') as f:
-                self.xgb_model = pickle.load(f)
+                models.xgb_model = pickle.load(f)
             print("XGBoost model loaded successfully")
+            if hasattr(models.xgb_model, 'feature_importances_'):
+                models.feature_importance = {
+                    name: float(importance)
+                    for name, importance in zip(models.feature_names, models.xgb_model.feature_importances_)
+                }
         
         # Load LightGBM model
         lgb_path = os.path.join(self.models_path, 'lightgbm_model.pkl')
         if os.path.exists(lgb_path):
             print(f"Loading LightGBM model from: {lgb_path}")
             with open(lgb_path, 'rb') as f:
-                self.lgb_model = pickle.load(f)
+                models.lgb_model = pickle.load(f)
             print("LightGBM model loaded successfully")
         
-        # Load Neural Network
-        nn_path = os.path.join(self.models_path, 'neural_network_model.h5')
-        if os.path.exists(nn_path):
-            try:
-                print(f"Loading Neural Network model from: {nn_path}")
-                self.nn_model = tf.keras.models.load_model(nn_path)
-                print("Neural Network model loaded successfully")
-            except Exception as e:
-                print(f"Failed to load Neural Network model: {e}")
-                self.nn_model = None
-        else:
-            print(f"Neural Network model not found at: {nn_path}")
+        # Flatten the boosters once; each engine is only used if it reproduces native predictions
+        if self.use_flat_trees:
+            models.xgb_trees = self._flatten_trees('XGBoost', models.xgb_model, FlatTreeEnsemble.from_xgboost)
+            models.lgb_trees = self._flatten_trees('LightGBM', models.lgb_model, FlatTreeEnsemble.from_lightgbm)
+            
+            # Quantile boosters for the interval bounds only run flattened, inside the same forest pass
+            flatteners = {'xgboost': FlatTreeEnsemble.from_xgboost, 'lightgbm': FlatTreeEnsemble.from_lightgbm}
+            for family in QUANTILE_FAMILIES:
+                for bound in QUANTILE_BOUNDS:
+                    quantile_path = os.path.join(self.models_path, f'{family}_{bound}.pkl')
+                    if os.path.exists(quantile_path):
+                        engine = self._flatten_trees(f'{family} {bound} bound', joblib.load(quantile_path), flatteners[family])
+                        if engine is not None:
+                            models.quantile_trees[f'{family}_{bound}'] = engine
+            if models.quantile_trees:
+                models.set_interval({'alphas': {'lower': 0.025, 'upper': 0.975}, **(metadata.get('quantiles') or {})})
+            models.build_forest()
         
         # Load scaler
         scaler_path = os.path.join(self.models_path, 'scaler.pkl')
         if os.path.exists(scaler_path):
             print(f"Loading scaler from: {scaler_path}")
-            with open(scaler_path, 'rb') as f:
-                self.scaler = pickle.load(f)
+            # Written with joblib.dump by the training scripts; plain pickle only recovers a bare array
+            models.scaler = joblib.load(scaler_path)
             print("Scaler loaded successfully")
         
+        # Load Neural Network as a NumPy forward pass with the scaler folded into its first layer
+        nn_path = os.path.join(self.models_path, 'neural_network_weights.npz')
+        if os.path.exists(nn_path) and models.scaler is not None:
+            try:
+                print(f"Loading Neural Network weights from: {nn_path}")
+                models.nn_model = NumpyMLP.load(nn_path, input_mean=models.scaler.mean_, input_scale=models.scaler.scale_)
+                print("Neural Network model loaded successfully")
+            except Exception as e:
+                print(f"Failed to load Neural Network model: {e}")
+                models.nn_model = None
+        elif os.path.exists(os.path.join(self.models_path, 'neural_network_model.h5')):
+            print("Neural Network weights not exported; run ml-pipeline/export_nn_weights.py on neural_network_model.h5")
+        else:
+            print(f"Neural Network model not found at: {nn_path}")
+        
         # Load label encoders (optional)
         encoders_path = os.path.join(self.models_path, 'label_encoders.pkl')
         if os.path.exists(encoders_path):
             with open(encoders_path, 'rb') as f:
-                self.label_encoders = pickle.load(f)
+                models.label_encoders = pickle.load(f)
             print("Label encoders loaded successfully")
         
-        print(f"Model loading complete. Feature count: {len(self.feature_names)}")
+        models.build_explainer()
+        print(f"Model loading complete. Feature count: {len(models.feature_names)}")
+        return models
+    
+    def _load_bundle_sync(self, bundle_path: str) -> ModelSet:
+        """Map the bundle's arrays read-only; nothing is unpickled and pages are shared across workers"""
+        bundle = load_bundle(bundle_path)
+        models = ModelSet(version=bundle.version or 'unversioned', source=bundle_path, feature_names=bundle.feature_names)
+        models.xgb_trees = bundle.trees.get('xgboost')
+        models.lgb_trees = bundle.trees.get('lightgbm')
+        models.quantile_trees = {name: engine for name, engine in bundle.trees.items() if name.endswith(QUANTILE_BOUNDS)}
+        models.set_interval(bundle.manifest.get('interval'))
+        models.stacked_forests = bundle.forests
+        models.nn_model = bundle.nn_model
+        models.feature_importance = bundle.feature_importance
+        models.build_forest()
+        models.build_explainer()
+        print(f"Model bundle mapped from {bundle_path}: trees={sorted(bundle.trees)}, NN={models.nn_model is not None}")
+        return models
     
-    def _create_mock_models(self):
+    def _flatten_trees(self, name: str, model, flatten) -> Optional[FlatTreeEnsemble]:
+        """Flatten a booster and verify it against the library's own predict"""
+        if model is None:
+            return None
+        try:
+            engine = flatten(model)
+            error = check_parity(engine, model.predict)
+            print(f"{name} flattened: {engine.n_trees} trees, depth {engine.max_depth}, parity error {error:.1e}")
+            return engine
+        except Exception as e:
+            print(f"{name} flattening failed, using native predict: {e}")
+            return None
+    
+    def _create_mock_models(self) -> ModelSet:
         """Create mock models for development"""
         print("Creating mock models for development")
-        self.feature_names = [
+        return ModelSet(version='mock', feature_names=[
             'square_feet', 'num_floors', 'occupancy_rate', 
             'annual_revenue', 'net_operating_income', 'cap_rate',
             'walk_score', 'transit_score', 'building_age'
-        ]
+        ])
     
-    def prepare_features(self, property_data: Dict) -> np.ndarray:
+    def prepare_features(self, property_data: Dict, plan: Optional[FeaturePlan] = None) -> np.ndarray:
         """Prepare features for prediction"""
-        print(f"Preparing features for: {list(property_data.keys())}")
-        print(f"Expected features: {self.feature_names}")
-        
-        features = []
-        
-        # Map input data fields to model feature names
-        feature_mapping = {
-            'expenses': 'annual_expenses',  # Map 'expenses' to 'annual_expenses'
-        }
-        
-        # Extract features in the exact order expected by the model
-        for feature in self.feature_names:
-            # Check if we need to map the feature name
-            actual_field = feature_mapping.get(feature, feature)
-            
-            if actual_field in property_data:
-                value = float(property_data[actual_field])
-                features.append(value)
-                print(f"  {feature} = {value} (from {actual_field})")
-            else:
-                # Handle missing features with sensible defaults
-                default_value = self._get_default_value(feature)
-                features.append(default_value)
-                print(f"  {feature} = {default_value} (default)")
-        
-        feature_array = np.array(features).reshape(1, -1)
-        print(f"Final feature array shape: {feature_array.shape}, values: {feature_array[0]}")
-        return feature_array
-    
-    def _get_default_value(self, feature_name: str) -> float:
-        """Get sensible default values for missing features"""
-        defaults = {
-            'crime_rate': 50.0,  # Medium crime rate
-            'school_rating': 7.0,  # Good school rating
-            'distance_to_highway': 2.0,  # 2 miles
-            'distance_to_public_transit': 1.0,  # 1 mile
-            'building_age': 10.0,  # 10 years old
-            'walk_score': 70.0,  # Walkable
-            'transit_score': 60.0,  # Some transit
-        }
-        return defaults.get(feature_name, 0.0)
+        return self.prepare_features_batch([property_data], plan)
+    
+    def prepare_features_batch(self, properties: List[Dict], plan: Optional[FeaturePlan] = None) -> np.ndarray:
+        """Prepare one feature matrix for a batch of properties, in the exact column order the models expect"""
+        return (plan or self.models.feature_plan).matrix(properties)
+    
+    def valuation_cache_keys(self, properties: List[Dict]) -> List[str]:
+        """'<model version>:<digest>' keys from the active version's quantized feature vectors"""
+        models = self.models
+        plan = models.feature_plan
+        return [f"{models.version}:{digest}" for digest in plan.cache_keys(plan.matrix(properties), self.cache_key_digits)]
+    
+    def valuation_cache_key(self, property_data: Dict) -> str:
+        return self.valuation_cache_keys([property_data])[0]
+    
+    @staticmethod
+    def _column(properties: List[Dict], field: str, default: float) -> np.ndarray:
+        """Extract one numeric field across a batch, falling back to a default when missing"""
+        return np.array(
+            [float(value) if (value := property_data.get(field)) is not None else default for property_data in properties],
+            dtype=np.float64
+        )
     
     async def predict(self, property_data: Dict) -> Dict:
         """Make a single prediction"""
         try:
-            # Prepare features
-            features = self.prepare_features(property_data)
-            
-            # Make predictions with each model
-            predictions = []
-            
-            if self.xgb_model:
-                xgb_pred = self.xgb_model.predict(features)[0]
-                predictions.append(xgb_pred)
-            
-            if self.lgb_model:
-                lgb_pred = self.lgb_model.predict(features)[0]
-                predictions.append(lgb_pred)
-            
-            if self.nn_model and self.scaler:
-                features_scaled = self.scaler.transform(features)
-                nn_pred = self.nn_model.predict(features_scaled, verbose=0)[0][0]
-                predictions.append(nn_pred)
-            
-            # If we have models, use ensemble average
-            if predictions:
-                final_prediction = np.mean(predictions)
-            else:
-                # Mock prediction for development
-                base_value = property_data.get('net_operating_income', 300000) / property_data.get('cap_rate', 0.06)
-                final_prediction = base_value * np.random.uniform(0.95, 1.05)
-            
-            return {
-                'predicted_value': float(final_prediction),
-                'model_version': 'v1.0.0',
-                'timestamp': datetime.utcnow().isoformat()
-            }
+            return await self._run_inference('_predict_sync', property_data)
             
+        except InferenceQueueFull:
+            raise
         except Exception as e:
             print(f"Prediction error: {e}")
             # Return mock prediction
@@ -207,115 +564,38 @@ class MLService:
                 'timestamp': datetime.utcnow().isoformat()
             }
     
+    def _predict_sync(self, property_data: Dict) -> Dict:
+        """Synchronous single prediction with a plain ensemble average"""
+        # Pin one model version for the whole request
+        models = self.models
+        
+        # Prepare features
+        features = self.prepare_features(property_data, models.feature_plan)
+        
+        # Make predictions with each model
+        predictions, _, _, _ = models.predictions(features)
+        
+        # If we have models, use ensemble average
+        if len(predictions):
+            final_prediction = predictions[:, 0].mean()
+        else:
+            # Mock prediction for development
+            base_value = property_data.get('net_operating_income', 300000) / property_data.get('cap_rate', 0.06)
+            final_prediction = base_value * np.random.uniform(0.95, 1.05)
+        
+        return {
+            'predicted_value': float(final_prediction),
+            'model_version': models.version,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+    
     async def predict_with_confidence(self, property_data: Dict) -> Dict:
         """Make prediction with confidence intervals using ensemble variance and calibrated uncertainty"""
-        print("=== PREDICT_WITH_CONFIDENCE CALLED ===")
-        print(f"Property data received: {property_data}")
-        print(f"Models loaded: xgb={self.xgb_model is not None}, lgb={self.lgb_model is not None}, nn={self.nn_model is not None}")
         try:
-            # Prepare features
-            features = self.prepare_features(property_data)
-            
-            # Collect predictions from all available models
-            predictions = []
-            model_weights = []
-            
-            if self.xgb_model:
-                xgb_pred = self.xgb_model.predict(features)[0]
-                predictions.append(xgb_pred)
-                model_weights.append(0.4)  # Higher weight for tree-based models
-            
-            if self.lgb_model:
-                lgb_pred = self.lgb_model.predict(features)[0]
-                predictions.append(lgb_pred)
-                model_weights.append(0.4)
-            
-            if self.nn_model and self.scaler:
-                features_scaled = self.scaler.transform(features)
-                nn_pred = self.nn_model.predict(features_scaled, verbose=0)[0][0]
-                predictions.append(nn_pred)
-                model_weights.append(0.2)
-            
-            # Calculate ensemble prediction and variance-based uncertainty
-            if predictions:
-                predictions_array = np.array(predictions)
-                weights_array = np.array(model_weights[:len(predictions)])
-                weights_array = weights_array / weights_array.sum()  # Normalize weights
-                
-                # Weighted ensemble prediction
-                final_prediction = np.average(predictions_array, weights=weights_array)
-                
-                # Calculate ensemble variance (measure of model disagreement)
-                ensemble_variance = np.average((predictions_array - final_prediction)**2, weights=weights_array)
-                
-                # Base uncertainty from ensemble variance
-                base_uncertainty = min(np.sqrt(ensemble_variance) / final_prediction, 0.04)  # Cap at 4%
-                
-                # Model calibration factor (reduced)
-                calibration_factor = 1.05  # Much smaller increase for safety
-                
-                # Feature-based uncertainty adjustments (more conservative)
-                feature_uncertainty = 0.0
-                
-                # Data quality factors (smaller adjustments) - ensure float conversion
-                occupancy_rate = float(property_data.get('occupancy_rate', 0.9))
-                if occupancy_rate < 0.7:  # Only for very low occupancy
-                    feature_uncertainty += (0.7 - occupancy_rate) * 0.05  # Max 0.015 for 40% occupancy
-                
-                building_age = float(property_data.get('building_age', 10))
-                if building_age > 50:  # Only for very old buildings
-                    feature_uncertainty += min((building_age - 50) * 0.0002, 0.01)  # Gradual, max 1%
-                
-                # Market factors (smaller adjustment)
-                cap_rate = float(property_data.get('cap_rate', 0.06))
-                if cap_rate > 0.12:  # Only for very high cap rates
-                    feature_uncertainty += 0.005
-                
-                # Total uncertainty calculation (much more conservative)
-                total_uncertainty = base_uncertainty + (feature_uncertainty * calibration_factor)
-                total_uncertainty = min(total_uncertainty, 0.04)  # Hard cap at 4%
-                total_uncertainty = max(total_uncertainty, 0.015)  # Minimum 1.5% uncertainty
-                
-                print(f"=== BACKEND UNCERTAINTY DEBUG ===")
-                print(f"Base uncertainty: {base_uncertainty:.4f}")
-                print(f"Feature uncertainty: {feature_uncertainty:.4f}")
-                print(f"Calibration factor: {calibration_factor:.4f}")
-                print(f"Total uncertainty: {total_uncertainty:.4f}")
-                print(f"Uncertainty percentage: {total_uncertainty * 100:.1f}%")
-                print(f"=== END BACKEND DEBUG ===")
-                
-            else:
-                # Fallback mock prediction with realistic uncertainty
-                print("=== USING MOCK PREDICTION PATH ===")
-                noi = float(property_data.get('net_operating_income', 300000))
-                cap_rate = float(property_data.get('cap_rate', 0.06))
-                base_value = noi / cap_rate
-                final_prediction = base_value * np.random.uniform(0.98, 1.02)
-                total_uncertainty = 0.02  # 2% uncertainty for mock predictions
-                print(f"Mock prediction: {final_prediction}, uncertainty: {total_uncertainty}")
-                print("=== END MOCK PREDICTION ===")
-            
-            # Calculate confidence intervals
-            lower_bound = final_prediction * (1 - total_uncertainty)
-            upper_bound = final_prediction * (1 + total_uncertainty)
-            
-            return {
-                'predicted_value': float(final_prediction),
-                'confidence_interval': {
-                    'lower': float(lower_bound),
-                    'upper': float(upper_bound),
-                    'confidence_level': 95,
-                    'uncertainty_percentage': round(total_uncertainty * 100, 1)  # Plus/minus percentage (not total range)
-                },
-                'price_per_sqft': float(final_prediction / property_data.get('square_feet', 1)),
-                'model_version': 'v1.1.0',
-                'timestamp': datetime.utcnow().isoformat(),
-                'ensemble_info': {
-                    'models_used': len(predictions) if predictions else 0,
-                    'model_agreement': round(100 - (total_uncertainty * 100), 1) if predictions else 0
-                }
-            }
+            return (await self._run_inference('_predict_batch_sync', [property_data]))[0]
             
+        except InferenceQueueFull:
+            raise
         except Exception as e:
             print(f"Enhanced prediction error: {e}")
             import traceback
@@ -342,22 +622,165 @@ class MLService:
                 'price_per_sqft': float(value / square_feet)
             }
     
-    async def batch_predict(self, properties: List[Dict]) -> List[Dict]:
-        """Make batch predictions"""
-        results = []
-        for property_data in properties:
-            prediction = await self.predict_with_confidence(property_data)
-            results.append(prediction)
-        return results
+    async def batch_predict(self, properties: List[Dict], explain: Union[bool, Sequence[bool]] = False) -> List[Dict]:
+        """Make batch predictions with a single model call per ensemble member; explain, for every property or
+        per property, adds fast feature contributions
+        """
+        if not properties:
+            return []
+        
+        try:
+            return await self._run_inference('_predict_batch_sync', properties, None, explain)
+        except InferenceQueueFull:
+            raise
+        except Exception as e:
+            print(f"Batch prediction error, falling back to per-property predictions: {e}")
+            return [await self.predict_with_confidence(property_data) for property_data in properties]
+    
+    async def batch_predict_columns(self, columns: Dict[str, np.ndarray], n_rows: int) -> Dict[str, np.ndarray]:
+        """Predict straight from column arrays, returning result columns instead of per-row dicts"""
+        return await self._run_inference('_predict_columns_sync', columns, n_rows)
+    
+    def _predict_columns_sync(self, columns: Dict[str, np.ndarray], n_rows: int) -> Dict[str, np.ndarray]:
+        """Vectorized ensemble over columnar input; no per-row objects are created"""
+        models = self.models
+        features = models.feature_plan.from_columns(columns, n_rows)
+        
+        def column(field: str, default: float) -> np.ndarray:
+            values = columns.get(field)
+            if values is None:
+                return np.full(n_rows, float(default))
+            values = np.asarray(values, dtype=np.float64)
+            return np.where(np.isnan(values), default, values)
+        
+        return self._ensemble(features, column, models)
+    
+    def _predict_batch_sync(self, properties: List[Dict], models: Optional[ModelSet] = None, explain: Union[bool, Sequence[bool]] = False) -> List[Dict]:
+        """Vectorized ensemble prediction with confidence intervals for a batch of properties"""
+        models = models or self.models
+        features = self.prepare_features_batch(properties, models.feature_plan)
+        result = self._ensemble(features, lambda field, default: self._column(properties, field, default), models, explain)
+        timestamp = datetime.utcnow().isoformat()
+        models_used = result['models_used']
+        
+        predictions = [
+            {
+                'predicted_value': value,
+                'confidence_interval': {
+                    'lower': lower,
+                    'upper': upper,
+                    'confidence_level': result['confidence_level'],
+                    'uncertainty_percentage': uncertainty
+                },
+                'price_per_sqft': per_sqft,
+                'model_version': models.version,
+                'timestamp': timestamp,
+                'ensemble_info': {
+                    'models_used': models_used,
+                    'model_agreement': agreement,
+                    'interval_method': result['interval_method']
+                }
+            }
+            for value, lower, upper, uncertainty, per_sqft, agreement in zip(
+                result['predicted_value'].tolist(),
+                result['lower'].tolist(),
+                result['upper'].tolist(),
+                result['uncertainty_percentage'].tolist(),
+                result['price_per_sqft'].tolist(),
+                result['model_agreement'].tolist()
+            )
+        ]
+        
+        contributions = result.get('contributions')
+        if contributions is not None:
+            bias = float(models.forest.contribution_bias)
+            for index, row in zip(explained_rows(explain, len(predictions)), contributions):
+                prediction = predictions[index]
+                order = np.argsort(-np.abs(row), kind='stable')
+                prediction['explanation'] = {
+                    'method': 'saabas',
+                    'base_value': bias,
+                    # What the contributions add up to: the trees alone, without the neural network's share
+                    'tree_predicted_value': bias + float(row.sum()),
+                    'feature_contributions': {models.feature_names[i]: float(row[i]) for i in order}
+                }
+        return predictions
+    
+    def _ensemble(self, features: np.ndarray, column, models: ModelSet, explain: Union[bool, Sequence[bool]] = False) -> Dict:
+        """Weighted ensemble, confidence bounds and price per sqft as arrays; column(field, default) reads raw inputs"""
+        n_rows = len(features)
+        predictions, model_weights, bounds, contributions = models.predictions(features, explain)
+        models_used = len(predictions)
+        
+        if models_used:
+            weights = model_weights / model_weights.sum()  # Normalize weights
+            
+            # Weighted ensemble prediction and variance (model disagreement) per row
+            final_prediction = weights @ predictions
+            ensemble_variance = weights @ (predictions - final_prediction) ** 2
+        
+        if models_used and bounds is not None:
+            # Calibrated interval from the quantile boosters, evaluated in the same forest pass as the point models,
+            # centred on the ensemble prediction
+            lower_bound = final_prediction + bounds[0]
+            upper_bound = final_prediction + bounds[1]
+            total_uncertainty = (upper_bound - lower_bound) / (2 * np.abs(final_prediction))
+            model_agreement = np.round(100 - np.minimum(np.sqrt(ensemble_variance) / final_prediction, 1) * 100, 1)
+            interval_method = 'quantile'
+        elif models_used:
+            # Base uncertainty from ensemble variance, capped at 4%
+            base_uncertainty = np.minimum(np.sqrt(ensemble_variance) / final_prediction, 0.04)
+            
+            # Model calibration factor (reduced)
+            calibration_factor = 1.05
+            
+            # Data quality factors: very low occupancy, very old buildings
+            occupancy_rate = column('occupancy_rate', 0.9)
+            feature_uncertainty = np.where(occupancy_rate < 0.7, (0.7 - occupancy_rate) * 0.05, 0.0)
+            
+            building_age = column('building_age', 10)
+            feature_uncertainty += np.where(building_age > 50, np.minimum((building_age - 50) * 0.0002, 0.01), 0.0)
+            
+            # Market factors: very high cap rates
+            cap_rate = column('cap_rate', 0.06)
+            feature_uncertainty += np.where(cap_rate > 0.12, 0.005, 0.0)
+            
+            # Total uncertainty between 1.5% and 4%
+            total_uncertainty = np.clip(base_uncertainty + feature_uncertainty * calibration_factor, 0.015, 0.04)
+            model_agreement = np.round(100 - total_uncertainty * 100, 1)
+            interval_method = 'heuristic'
+        else:
+            # Fallback mock prediction with realistic uncertainty
+            noi = column('net_operating_income', 300000)
+            cap_rate = column('cap_rate', 0.06)
+            final_prediction = noi / cap_rate * np.random.uniform(0.98, 1.02, n_rows)
+            total_uncertainty = np.full(n_rows, 0.02)  # 2% uncertainty for mock predictions
+            model_agreement = np.zeros(n_rows)
+            interval_method = 'mock'
+        
+        if interval_method != 'quantile':
+            # Calculate confidence intervals
+            lower_bound = final_prediction * (1 - total_uncertainty)
+            upper_bound = final_prediction * (1 + total_uncertainty)
+        
+        return {
+            'predicted_value': final_prediction,
+            'lower': lower_bound,
+            'upper': upper_bound,
+            'uncertainty_percentage': np.round(total_uncertainty * 100, 1),  # Plus/minus percentage (not total range)
+            'price_per_sqft': final_prediction / column('square_feet', 1),
+            'model_agreement': model_agreement,
+            'models_used': models_used,
+            'confidence_level': models.confidence_level,
+            'interval_method': interval_method,
+            'contributions': contributions,
+            'model_version': models.version
+        }
     
     def get_feature_importance(self) -> Dict:
         """Get feature importance from models"""
-        if self.xgb_model and hasattr(self.xgb_model, 'feature_importances_'):
-            importance = self.xgb_model.feature_importances_
-            return {
-                name: float(imp) 
-                for name, imp in zip(self.feature_names, importance)
-            }
+        if self.models.feature_importance:
+            return dict(self.models.feature_importance)
         
         # Return mock importance
         return {
@@ -374,18 +797,20 @@ class MLService:
     
     async def get_shap_values(self, property_data: Dict) -> Dict:
         """Get SHAP values for explainability"""
-        # This would use actual SHAP in production
-        # For now, return mock explanation
-        return {
-            'base_value': 1000000,
-            'predicted_value': 1500000,
-            'feature_contributions': {
-                'net_operating_income': 200000,
-                'location': 150000,
-                'square_feet': 100000,
-                'building_quality': 50000
-            }
-        }
+        return (await self.explain_batch([property_data]))[0]
+    
+    async def explain_batch(self, properties: List[Dict]) -> List[Dict]:
+        """TreeSHAP attributions for many properties in one explainer call"""
+        return await self._run_inference('_explain_batch_sync', properties)
+    
+    def _explain_batch_sync(self, properties: List[Dict]) -> List[Dict]:
+        models = self.models
+        if models.explainer is None:
+            raise ExplanationUnavailable(f"No SHAP explainer for model version {models.version}")
+        explanations = models.explainer.explain(models.feature_plan.matrix(properties))
+        for explanation in explanations:
+            explanation['model_version'] = models.version
+        return explanations
     
     def get_model_metrics(self) -> Dict:
         """Get current model performance metrics"""
@@ -397,6 +822,38 @@ class MLService:
             'mape': 0.108,
             'within_5_percent': 65.3,
             'within_10_percent': 89.2,
-            'model_version': 'v1.0.0',
+            'model_version': self.models.version,
             'last_trained': '2024-01-01T00:00:00Z'
-        }
\ No newline at end of file
+        }
+
+# Per-process MLService used when inference runs on a ProcessPoolExecutor
+_worker_service: Optional[MLService] = None
+
+def _init_inference_worker(models_path: str, registry_path: str):
+    """Load the models once in each inference worker process"""
+    global _worker_service
+    _worker_service = MLService()
+    _worker_service.models_path = models_path
+    _worker_service.registry = ModelRegistry(registry_path)
+    _worker_service.models = _worker_service._load_models_sync()
+
+def _call_inference_worker(version: str, method: str, *args):
+    """Run an inference method against the worker process's MLService, on the version the parent serves"""
+    if _worker_service.models.version != version and version in _worker_service.registry.versions():
+        _worker_service.models = _worker_service._load_version_sync(version)
+    return getattr(_worker_service, method)(*args)
+
+def get_ml_service(request: Request) -> MLService:
+    """Return the process-wide MLService created in main.lifespan"""
+    return request.app.state.ml_service
+
+def require_ml_service(request: Request) -> MLService:
+    """Return the shared MLService, rejecting requests until its models are loaded"""
+    ml_service = getattr(request.app.state, 'ml_service', None)
+    if ml_service is None or not ml_service.is_ready:
+        raise HTTPException(
+            status_code=503,
+            detail="ML models are still loading",
+            headers={"Retry-After": "5"}
+        )
+    return ml_service
@@ -0,0 +1,181 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from services.nn_engine import NumpyMLP
+from services.tree_engine import FlatTreeEnsemble, StackedTrees
+
+BUNDLE_FORMAT = 'avm-model-bundle'
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+class ModelBundle:
+    """Inference-ready models read from a bundle directory, with every array memory-mapped read-only"""
+
+    def __init__(
+        self,
+        path: str,
+        manifest: Dict,
+        trees: Dict[str, FlatTreeEnsemble],
+        nn_model: Optional[NumpyMLP],
+        scaler_mean: Optional[np.ndarray],
+        scaler_scale: Optional[np.ndarray],
+        forests: Optional[Dict[str, Tuple[List[str], FlatTreeEnsemble]]] = None
+    ):
+        self.path = path
+        self.manifest = manifest
+        self.trees = trees
+        # The trees again, stacked per input precision so serving walks the mapped pages instead of concatenating
+        self.forests = forests or {}
+        self.nn_model = nn_model
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+
+    @property
+    def feature_names(self) -> List[str]:
+        return self.manifest['feature_names']
+
+    @property
+    def feature_importance(self) -> Dict[str, float]:
+        return self.manifest.get('feature_importance', {})
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.manifest.get('version')
+
+def is_bundle(path: str) -> bool:
+    """Whether a directory holds a model bundle"""
+    return os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+def load_bundle(path: str) -> ModelBundle:
+    """Memory-map a bundle so every worker on the host shares the same physical pages"""
+    with open(os.path.join(path, MANIFEST_NAME), 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != BUNDLE_FORMAT or manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model bundle format in {path}")
+
+    def array(name: str) -> np.ndarray:
+        return np.load(os.path.join(path, name), mmap_mode='r', allow_pickle=False)
+
+    def ensemble(spec: Dict) -> FlatTreeEnsemble:
+        return FlatTreeEnsemble(
+            **{key: array(file_name) for key, file_name in spec['arrays'].items()},
+            base_score=spec['base_score'],
+            max_depth=spec['max_depth'],
+            n_features=spec['n_features'],
+            dtype=spec['dtype']
+        )
+
+    trees = {name: ensemble(spec) for name, spec in manifest.get('trees', {}).items()}
+    # Bundles written before forests were stored are stacked in memory at load instead
+    forests = {dtype: (spec['members'], ensemble(spec)) for dtype, spec in manifest.get('forests', {}).items()}
+
+    nn_model = None
+    if 'neural_network' in manifest:
+        nn_model = NumpyMLP([
+            (array(layer['kernel']), array(layer['bias']), layer['activation'])
+            for layer in manifest['neural_network']['layers']
+        ])
+
+    scaler = manifest.get('scaler')
+    return ModelBundle(
+        path=path,
+        manifest=manifest,
+        trees=trees,
+        nn_model=nn_model,
+        scaler_mean=array(scaler['mean']) if scaler else None,
+        scaler_scale=array(scaler['scale']) if scaler else None,
+        forests=forests
+    )
+
+def write_bundle(
+    path: str,
+    feature_names: List[str],
+    trees: Optional[Dict[str, FlatTreeEnsemble]] = None,
+    nn_model: Optional[NumpyMLP] = None,
+    scaler=None,
+    feature_importance: Optional[Dict[str, float]] = None,
+    metadata: Optional[Dict] = None
+) -> str:
+    """Write models as raw .npy arrays plus a manifest, replacing any bundle already at path"""
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.bundle-', dir=parent)
+
+    def save(name: str, value: np.ndarray, dtype=None) -> str:
+        np.save(os.path.join(staging, name), np.ascontiguousarray(value, dtype=dtype))
+        return name
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'created_at': datetime.utcnow().isoformat(),
+        'feature_names': list(feature_names),
+        'feature_importance': feature_importance or {},
+        'trees': {},
+        **(metadata or {})
+    }
+
+    def ensemble(name: str, engine: FlatTreeEnsemble) -> Dict:
+        return {
+            'base_score': engine.base_score,
+            'max_depth': engine.max_depth,
+            'n_features': engine.n_features,
+            'dtype': engine.dtype.name,
+            'arrays': {
+                key: save(f'{name}.{key}.npy', getattr(engine, key), dtype)
+                for key, dtype in FlatTreeEnsemble.ARRAYS.items()
+            }
+        }
+
+    trees = trees or {}
+    for name, engine in trees.items():
+        manifest['trees'][name] = ensemble(name, engine)
+
+    # Members are still stored on their own for explanations; serving traverses these stacked copies
+    if trees:
+        manifest['forests'] = {}
+        for dtype in sorted({engine.dtype.name for engine in trees.values()}):
+            members = [name for name, engine in trees.items() if engine.dtype.name == dtype]
+            forest = StackedTrees.merge([trees[name] for name in members])
+            manifest['forests'][dtype] = {'members': members, **ensemble(f'forest.{dtype}', forest)}
+
+    if nn_model is not None:
+        # Stored already folded, so loading is a straight memory map
+        manifest['neural_network'] = {
+            'layers': [
+                {
+                    'kernel': save(f'neural_network.{i}.kernel.npy', kernel, np.float64),
+                    'bias': save(f'neural_network.{i}.bias.npy', bias, np.float64),
+                    'activation': activation
+                }
+                for i, (kernel, bias, activation) in enumerate(nn_model.layers)
+            ]
+        }
+
+    if scaler is not None:
+        manifest['scaler'] = {
+            'mean': save('scaler.mean.npy', scaler.mean_, np.float64),
+            'scale': save('scaler.scale.npy', scaler.scale_, np.float64)
+        }
+
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Only a fully written directory is renamed into place
+    os.chmod(staging, 0o755)
+    if os.path.exists(path):
+        retired = f'{path}.old'
+        shutil.rmtree(retired, ignore_errors=True)
+        os.rename(path, retired)
+        os.rename(staging, path)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.rename(staging, path)
+
+    print(f"Model bundle written to {path}")
+    return path
@@ -0,0 +1,66 @@
+import os
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from services.model_bundle import is_bundle
+
+# File in the registry root naming the version that should be served
+CURRENT_POINTER = 'CURRENT'
+
+VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+def new_version() -> str:
+    """Version name for a freshly trained bundle; sorts chronologically"""
+    return datetime.utcnow().strftime('v%Y%m%d%H%M%S')
+
+class ModelRegistry:
+    """Directory of immutable model bundles, one per version, plus a CURRENT pointer
+
+    Layout:
+        <root>/<version>/manifest.json ...   bundles written by ml-pipeline/export_bundle.py
+        <root>/CURRENT                       name of the version to serve
+    Without a pointer the newest version (by name) is served. Rolling back is rewriting CURRENT.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, version: str) -> str:
+        if not VERSION_PATTERN.match(version):
+            raise ValueError(f"Invalid model version: {version!r}")
+        return os.path.join(self.root, version)
+
+    def versions(self) -> List[str]:
+        """Every complete bundle in the registry, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if VERSION_PATTERN.match(name) and is_bundle(os.path.join(self.root, name))
+        )
+
+    def active_version(self) -> Optional[str]:
+        """Version named by CURRENT, or the newest bundle when there is no usable pointer"""
+        pointer = os.path.join(self.root, CURRENT_POINTER)
+        if os.path.exists(pointer):
+            with open(pointer, 'r') as f:
+                version = f.read().strip()
+            if VERSION_PATTERN.match(version) and is_bundle(os.path.join(self.root, version)):
+                return version
+            print(f"Model registry pointer names an unknown version: {version!r}")
+
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def publish(self, version: str):
+        """Point CURRENT at a version; watching services pick it up on their next poll"""
+        if not is_bundle(self.path(version)):
+            raise ValueError(f"No model bundle for version {version} in {self.root}")
+
+        pointer = os.path.join(self.root, CURRENT_POINTER)
+        staging = f'{pointer}.tmp'
+        with open(staging, 'w') as f:
+            f.write(version + '\n')
+        os.replace(staging, pointer)
+        print(f"Model version {version} published in {self.root}")
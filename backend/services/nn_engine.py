@@ -0,0 +1,119 @@
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# Activations supported by the exported network; applied in place on the layer output
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': lambda x: np.divide(1.0, 1.0 + np.exp(-x, out=x), out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+}
+
+def load_layer_specs(path: str) -> List[Dict]:
+    """Read the layer list written by ml-pipeline/export_nn_weights.py"""
+    with np.load(path, allow_pickle=False) as archive:
+        layers = json.loads(str(archive['layers']))
+        for index, layer in enumerate(layers):
+            prefix = f'layer_{index}_'
+            for key in archive.files:
+                if key.startswith(prefix):
+                    layer[key[len(prefix):]] = archive[key]
+    return layers
+
+def load_input_scaling(path: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Mean and scale of the StandardScaler the network was trained with, if the export recorded them"""
+    with np.load(path, allow_pickle=False) as archive:
+        if 'input_mean' not in archive.files:
+            return None
+        return archive['input_mean'], archive['input_scale']
+
+class NumpyMLP:
+    """Forward pass of a Dense/BatchNormalization network as a chain of fused matmuls"""
+
+    def __init__(self, layers: List[Tuple[np.ndarray, np.ndarray, str]]):
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {activation}")
+        self.layers = layers
+
+    @classmethod
+    def load(cls, path: str, input_mean: Optional[np.ndarray] = None, input_scale: Optional[np.ndarray] = None) -> 'NumpyMLP':
+        """Load exported weights, optionally folding a StandardScaler into the first layer"""
+        return cls.from_layer_specs(load_layer_specs(path), input_mean, input_scale)
+
+    @classmethod
+    def from_layer_specs(
+        cls,
+        specs: List[Dict],
+        input_mean: Optional[np.ndarray] = None,
+        input_scale: Optional[np.ndarray] = None
+    ) -> 'NumpyMLP':
+        """Fold input scaling and BatchNormalization into the dense weights"""
+        dense_layers: List[List] = []
+        # Per-feature affine (x * s + t) still waiting to be folded into the next dense layer
+        pending: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+        if input_mean is not None and input_scale is not None:
+            scale = 1.0 / np.asarray(input_scale, dtype=np.float64)
+            pending = (scale, -np.asarray(input_mean, dtype=np.float64) * scale)
+
+        for spec in specs:
+            layer_type = spec['type']
+
+            if layer_type == 'dense':
+                kernel = np.asarray(spec['kernel'], dtype=np.float64)
+                bias = np.asarray(spec['bias'], dtype=np.float64) if 'bias' in spec else np.zeros(kernel.shape[1])
+                if pending is not None:
+                    scale, shift = pending
+                    bias = shift @ kernel + bias
+                    kernel = scale[:, None] * kernel
+                    pending = None
+                dense_layers.append([kernel, bias, spec.get('activation', 'linear')])
+
+            elif layer_type == 'batch_normalization':
+                variance = np.asarray(spec['moving_variance'], dtype=np.float64)
+                scale = 1.0 / np.sqrt(variance + spec.get('epsilon', 1e-3))
+                if 'gamma' in spec:
+                    scale = scale * spec['gamma']
+                shift = -np.asarray(spec['moving_mean'], dtype=np.float64) * scale
+                if 'beta' in spec:
+                    shift = shift + spec['beta']
+
+                if pending is None and dense_layers and dense_layers[-1][2] == 'linear':
+                    # BatchNorm directly on a linear dense output folds into that layer
+                    dense_layers[-1][0] = dense_layers[-1][0] * scale
+                    dense_layers[-1][1] = dense_layers[-1][1] * scale + shift
+                elif pending is not None:
+                    pending = (pending[0] * scale, pending[1] * scale + shift)
+                else:
+                    # BatchNorm after a non-linearity folds into the next dense layer instead
+                    pending = (scale, shift)
+
+            elif layer_type == 'activation':
+                if pending is not None or not dense_layers or dense_layers[-1][2] != 'linear':
+                    raise ValueError("Standalone activation must directly follow a linear dense layer")
+                dense_layers[-1][2] = spec['activation']
+
+            else:
+                raise ValueError(f"Unsupported layer type: {layer_type}")
+
+        if pending is not None:
+            # Trailing BatchNorm becomes a diagonal layer
+            scale, shift = pending
+            dense_layers.append([np.diag(scale), shift, 'linear'])
+
+        return cls([(np.ascontiguousarray(kernel), bias, activation) for kernel, bias, activation in dense_layers])
+
+    @property
+    def n_features(self) -> int:
+        return self.layers[0][0].shape[0]
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Predict one value per row"""
+        output = np.asarray(features, dtype=np.float64)
+        for kernel, bias, activation in self.layers:
+            output = output @ kernel
+            output += bias
+            output = ACTIVATIONS[activation](output)
+        return output.reshape(len(output), -1)[:, 0]
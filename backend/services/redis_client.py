@@ -1,162 +1,456 @@
 import redis.asyncio as redis
-import json
+import asyncio
+import math
 import os
-from typing import Optional, Any
+import random
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from datetime import timedelta, datetime
 
+from middleware.metrics import cache_requests_total
+from services.circuit_breaker import CircuitBreaker
+from services.codecs import CacheSerializer, msgpack, stamp, unstamp
+from services.local_cache import LocalCache
+
+# Published when a new model version goes live; every worker drops its now unreachable local entries
+CACHE_INVALIDATION_CHANNEL = 'valuation_cache:invalidate'
+# Carries "<property hash> <encoded valuation>" from the worker that computed it to workers waiting on its lock;
+# an empty valuation means the computation failed and waiters should compute it themselves
+VALUATION_READY_CHANNEL = 'valuation_cache:ready'
+# Where Redis publishes keys written by anyone once client tracking is on
+TRACKING_CHANNEL = '__redis__:invalidate'
+# Delete a lock only while it still holds our token, so a lock that expired and was retaken is left alone
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 class RedisClient:
     def __init__(self):
         self.redis_url = os.getenv('REDIS_URL', 'redis://redis:6379')
+        # Binary connection for codec-encoded values; text_client decodes replies for string-keyed data such as jobs
         self.client: Optional[redis.Redis] = None
+        self.text_client: Optional[redis.Redis] = None
+        # Long-lived subscriber connection; kept apart because a blocking read must not hit the cache timeouts
+        self.pubsub_client: Optional[redis.Redis] = None
+        # The cache sits on the request path: a bounded pool and tight timeouts turn a slow Redis into misses
+        self.max_connections = int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))
+        # Bounds both waiting for a free pooled connection and opening a new one
+        self.pool_timeout = float(os.getenv('REDIS_POOL_TIMEOUT', '0.25'))
+        self.socket_timeout = float(os.getenv('REDIS_SOCKET_TIMEOUT', '0.25'))
+        self.connect_timeout = float(os.getenv('REDIS_CONNECT_TIMEOUT', '0.5'))
+        # Job state is off the request path and moves larger values, so it gets a pool of its own and more time
+        self.text_socket_timeout = float(os.getenv('REDIS_TEXT_SOCKET_TIMEOUT', '5'))
+        self.breaker = CircuitBreaker(
+            'redis',
+            failure_threshold=int(os.getenv('REDIS_BREAKER_FAILURES', '5')),
+            reset_seconds=float(os.getenv('REDIS_BREAKER_RESET_SECONDS', '10'))
+        )
+        # Server-assisted invalidation of the local tier (CLIENT TRACKING, Redis 6+)
+        self.client_tracking = os.getenv('REDIS_CLIENT_TRACKING', 'false').lower() == 'true'
+        compress_threshold = int(os.getenv('REDIS_COMPRESS_THRESHOLD', '1024'))
+        self.serializer = CacheSerializer(os.getenv('REDIS_CODEC', 'msgpack' if msgpack is not None else 'json'), compress_threshold)
+        self.valuation_serializer = CacheSerializer(os.getenv('VALUATION_CACHE_CODEC', 'struct'), compress_threshold)
+        # Per-worker tier in front of Redis; its shorter TTL bounds how long a missed invalidation can last
+        self.local_cache = LocalCache(
+            'local',
+            max_entries=int(os.getenv('VALUATION_LOCAL_CACHE_MAX_ENTRIES', '10000')),
+            max_bytes=int(os.getenv('VALUATION_LOCAL_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            ttl=float(os.getenv('VALUATION_LOCAL_CACHE_TTL_SECONDS', '300'))
+        )
+        # Valuations stay fresh for the caller's TTL, then are served stale for this long while one request recomputes them
+        self.valuation_stale_seconds = int(os.getenv('VALUATION_STALE_TTL_SECONDS', '600'))
+        # XFetch: a larger beta recomputes hot entries earlier ahead of going stale
+        self.xfetch_beta = float(os.getenv('VALUATION_XFETCH_BETA', '1.0'))
+        self.pubsub_task: Optional[asyncio.Task] = None
+        # Futures of requests on this worker waiting for another worker's valuation, by property hash
+        self.valuation_waiters: Dict[str, Set[asyncio.Future]] = {}
+        # Keys per MGET when looking up a whole portfolio
+        self.mget_chunk_size = int(os.getenv('REDIS_MGET_CHUNK_SIZE', '500'))
+        # API usage is counted in memory and flushed as one MULTI batch per interval, off the request path
+        self.usage_counts: Counter = Counter()
+        self.usage_sums: Counter = Counter()
+        self.usage_flush_seconds = float(os.getenv('API_USAGE_FLUSH_SECONDS', '5'))
+        self.usage_key_ttl = int(float(os.getenv('API_USAGE_RETENTION_DAYS', '35')) * 86400)
+        self.usage_task: Optional[asyncio.Task] = None
         
     async def initialize(self):
         """Initialize Redis connection"""
         try:
-            self.client = await redis.from_url(
+            self.client = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(
+                self.redis_url,
+                max_connections=self.max_connections,
+                timeout=self.pool_timeout,
+                socket_timeout=self.socket_timeout,
+                socket_connect_timeout=self.connect_timeout,
+                socket_keepalive=True,
+                health_check_interval=30
+            ))
+            self.text_client = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(
                 self.redis_url,
+                max_connections=self.max_connections,
+                timeout=self.text_socket_timeout,
+                socket_timeout=self.text_socket_timeout,
+                socket_connect_timeout=self.connect_timeout,
+                socket_keepalive=True,
+                health_check_interval=30,
                 encoding="utf-8",
                 decode_responses=True
+            ))
+            self.pubsub_client = redis.from_url(
+                self.redis_url,
+                socket_connect_timeout=self.connect_timeout,
+                socket_keepalive=True,
+                health_check_interval=30
             )
             await self.client.ping()
             print("Redis connection established")
+            self.pubsub_task = asyncio.create_task(self._listen())
+            self.usage_task = asyncio.create_task(self._flush_usage_periodically())
         except Exception as e:
             print(f"Failed to connect to Redis: {e}")
             self.client = None
+            self.text_client = None
+            self.pubsub_client = None
     
     async def close(self):
         """Close Redis connection"""
+        for task in (self.pubsub_task, self.usage_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.pubsub_task = self.usage_task = None
+        await self.flush_usage()
         if self.client:
             await self.client.close()
+        if self.text_client:
+            await self.text_client.close()
+        if self.pubsub_client:
+            await self.pubsub_client.close()
     
-    async def ping(self) -> bool:
-        """Check Redis connection"""
-        try:
-            if self.client:
-                await self.client.ping()
-                return True
-        except:
-            pass
-        return False
+    async def _listen(self):
+        """Drop the local tier when any worker announces stale valuations, and hand published valuations to waiters"""
+        invalidation_channel = CACHE_INVALIDATION_CHANNEL.encode()
+        tracking_channel = TRACKING_CHANNEL.encode()
+        while True:
+            pubsub = self.pubsub_client.pubsub()
+            try:
+                channels = [CACHE_INVALIDATION_CHANNEL, VALUATION_READY_CHANNEL]
+                if self.client_tracking and await self._enable_tracking(pubsub):
+                    channels.append(TRACKING_CHANNEL)
+                await pubsub.subscribe(*channels)
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    if message['channel'] == invalidation_channel:
+                        self.local_cache.clear()
+                    elif message['channel'] == tracking_channel:
+                        self._keys_changed(message['data'])
+                    else:
+                        self._valuation_ready(message['data'])
+            except asyncio.CancelledError:
+                await pubsub.close()
+                raise
+            except Exception as e:
+                # Entries written while disconnected may have missed an invalidation
+                print(f"Cache invalidation listener error, resubscribing: {e}")
+                self.local_cache.clear()
+                await pubsub.close()
+                await asyncio.sleep(1)
     
-    async def get(self, key: str) -> Optional[Any]:
-        """Get value from Redis"""
-        if not self.client:
-            return None
+    async def _enable_tracking(self, pubsub) -> bool:
+        """Have Redis report every write to a valuation key to this subscriber connection.
         
+        Broadcast mode with a redirect to the connection itself, so invalidations arrive as plain pub/sub
+        messages over RESP2 and no per-read tracking state is kept on the server. NOLOOP leaves out writes
+        made on the tracking connection itself.
+        """
         try:
-            value = await self.client.get(key)
-            if value:
-                return json.loads(value)
+            await pubsub.connect()
+            await pubsub.connection.send_command('CLIENT', 'ID')
+            client_id = await pubsub.connection.read_response()
+            await pubsub.connection.send_command(
+                'CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST', 'PREFIX', 'valuation:', 'NOLOOP'
+            )
+            await pubsub.connection.read_response()
+            return True
         except Exception as e:
-            print(f"Redis get error: {e}")
-        return None
-    
-    async def set(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
-        """Set value in Redis with optional expiration"""
-        if not self.client:
+            print(f"Redis client tracking unavailable, relying on TTLs and invalidation broadcasts: {e}")
             return False
-        
+    
+    def _keys_changed(self, keys: Optional[List[bytes]]):
+        # None means the server flushed everything (or dropped tracking state)
+        if keys is None:
+            self.local_cache.clear()
+            return
+        for key in keys:
+            self.local_cache.delete(key.decode())
+    
+    async def _call(self, what: str, operation: Callable[[], Awaitable], default: Any = None) -> Any:
+        """Run one Redis operation unless the breaker is open; failures and timeouts count towards opening it"""
+        if not self.client or not self.breaker.allow():
+            return default
         try:
-            value_str = json.dumps(value)
-            if expire:
-                await self.client.setex(key, expire, value_str)
-            else:
-                await self.client.set(key, value_str)
-            return True
+            result = await operation()
         except Exception as e:
-            print(f"Redis set error: {e}")
-            return False
+            self.breaker.record_failure()
+            print(f"Redis {what} error: {e}")
+            return default
+        except BaseException:
+            # Cancelled mid-call: no verdict on Redis, but a trial must not stay out forever
+            self.breaker.record_abandoned()
+            raise
+        self.breaker.record_success()
+        return result
+    
+    async def ping(self) -> bool:
+        """Check Redis connection; reported down while the breaker is open"""
+        return bool(await self._call('ping', lambda: self.client.ping(), False))
+    
+    async def get(self, key: str) -> Optional[Any]:
+        """Get value from Redis"""
+        return self.serializer.loads(await self._call('get', lambda: self.client.get(key)))
+    
+    async def set(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
+        """Set value in Redis with optional expiration"""
+        data = self.serializer.dumps(value)
+        return await self._call('set', lambda: self.client.set(key, data, ex=expire), False) is not False
     
     async def delete(self, key: str) -> bool:
         """Delete key from Redis"""
-        if not self.client:
-            return False
-        
-        try:
-            await self.client.delete(key)
-            return True
-        except Exception as e:
-            print(f"Redis delete error: {e}")
-            return False
+        return await self._call('delete', lambda: self.client.delete(key)) is not None
     
     async def exists(self, key: str) -> bool:
         """Check if key exists in Redis"""
-        if not self.client:
-            return False
-        
-        try:
-            return await self.client.exists(key) > 0
-        except Exception as e:
-            print(f"Redis exists error: {e}")
-            return False
+        return (await self._call('exists', lambda: self.client.exists(key), 0)) > 0
+    
+    def _encode_valuation(self, valuation: dict, ttl: int, compute_seconds: float) -> bytes:
+        return stamp(self.valuation_serializer.dumps(valuation), time.time() + ttl, compute_seconds)
+    
+    def _decode_valuation(self, value: Optional[bytes]) -> Tuple[Optional[dict], Optional[str]]:
+        """Decoded valuation and why it is due for recomputation: 'stale', 'early' or None if it is not"""
+        if not value:
+            return None, None
+        data, stale_at, compute_seconds = unstamp(value)
+        valuation = self.valuation_serializer.loads(data)
+        if stale_at is None:
+            return valuation, None
+        now = time.time()
+        if now >= stale_at:
+            return valuation, 'stale'
+        # XFetch: recompute ahead of time with a probability that grows near expiry and with compute cost
+        if now - compute_seconds * self.xfetch_beta * math.log(1.0 - random.random()) >= stale_at:
+            return valuation, 'early'
+        return valuation, None
+    
+    async def lookup_valuation(self, property_hash: str) -> Tuple[Optional[dict], Optional[str]]:
+        """Get cached property valuation, from this worker's memory before going to Redis, and why to refresh it"""
+        cache_key = f"valuation:{property_hash}"
+        value = self.local_cache.get(cache_key)
+        if value is None and self.client:
+            value = await self._call('get', lambda: self.client.get(cache_key))
+            # Lookups skipped while the breaker is open are counted apart from real misses
+            cache_requests_total.labels(tier='redis', result='hit' if value else 'bypassed' if self.breaker.is_open else 'miss').inc()
+            if value:
+                self.local_cache.set(cache_key, value)
+        return self._decode_valuation(value)
     
     async def get_cached_valuation(self, property_hash: str) -> Optional[dict]:
-        """Get cached property valuation"""
+        """Get cached property valuation, stale or not"""
+        return (await self.lookup_valuation(property_hash))[0]
+    
+    async def cache_valuation(self, property_hash: str, valuation: dict, ttl: int = 3600, compute_seconds: float = 0.0) -> bool:
+        """Cache property valuation in both tiers, fresh for ttl and kept as stale for the grace period after"""
         cache_key = f"valuation:{property_hash}"
-        return await self.get(cache_key)
+        value = self._encode_valuation(valuation, ttl, compute_seconds)
+        self.local_cache.set(cache_key, value, ttl + self.valuation_stale_seconds)
+        return await self._call('set', lambda: self.client.setex(cache_key, ttl + self.valuation_stale_seconds, value), False) is not False
     
-    async def cache_valuation(self, property_hash: str, valuation: dict, ttl: int = 3600) -> bool:
-        """Cache property valuation with TTL"""
+    async def get_cached_valuations(self, property_hashes: List[str]) -> List[Optional[dict]]:
+        """Look up many valuations: local tier first, then the remaining keys with chunked MGETs.
+        
+        Entries due for recomputation come back as None; the batch that asked recomputes them anyway.
+        """
+        cache_keys = [f"valuation:{property_hash}" for property_hash in property_hashes]
+        values = [self.local_cache.get(cache_key) for cache_key in cache_keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing and self.client:
+            for start in range(0, len(missing), self.mget_chunk_size):
+                chunk = missing[start:start + self.mget_chunk_size]
+                found = await self._call('mget', lambda: self.client.mget([cache_keys[i] for i in chunk]))
+                if found is None:
+                    break
+                for i, value in zip(chunk, found):
+                    if value:
+                        values[i] = value
+                        self.local_cache.set(cache_keys[i], value)
+            hits = sum(1 for i in missing if values[i] is not None)
+            cache_requests_total.labels(tier='redis', result='hit').inc(hits)
+            cache_requests_total.labels(tier='redis', result='bypassed' if self.breaker.is_open else 'miss').inc(len(missing) - hits)
+        decoded = [self._decode_valuation(value) for value in values]
+        return [None if refresh else valuation for valuation, refresh in decoded]
+    
+    async def cache_valuations(self, valuations: Dict[str, dict], ttl: int = 3600, compute_seconds: float = 0.0) -> bool:
+        """Cache many valuations, keyed by property hash, with one pipelined round trip"""
+        if not valuations:
+            return True
+        pipe = self.client.pipeline(transaction=False) if self.client else None
+        for property_hash, valuation in valuations.items():
+            cache_key = f"valuation:{property_hash}"
+            value = self._encode_valuation(valuation, ttl, compute_seconds)
+            self.local_cache.set(cache_key, value, ttl + self.valuation_stale_seconds)
+            if pipe is not None:
+                pipe.set(cache_key, value, ex=ttl + self.valuation_stale_seconds)
+        if pipe is None:
+            return False
+        return await self._call('pipelined set', pipe.execute) is not None
+    
+    async def acquire_valuation_lock(self, property_hash: str, token: str, ttl_ms: int) -> bool:
+        """Try to become the one worker computing a valuation; without Redis every worker is on its own"""
+        acquired = await self._call('lock', lambda: self.client.set(f"lock:valuation:{property_hash}", token, nx=True, px=ttl_ms), True)
+        return bool(acquired)
+    
+    async def release_valuation_lock(self, property_hash: str, token: str):
+        """Give up a valuation lock without a result; waiters are told to compute it themselves"""
+        if not self.client:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.publish(VALUATION_READY_CHANNEL, property_hash.encode() + b' ')
+        pipe.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:valuation:{property_hash}", token)
+        await self._call('lock release', pipe.execute)
+    
+    async def publish_valuation(
+        self,
+        property_hash: str,
+        valuation: dict,
+        token: str,
+        ttl: int = 3600,
+        compute_seconds: float = 0.0,
+        cache: bool = True
+    ):
+        """Cache a freshly computed valuation, send it to waiting workers and release its lock in one round trip"""
         cache_key = f"valuation:{property_hash}"
-        return await self.set(cache_key, valuation, expire=ttl)
+        value = self._encode_valuation(valuation, ttl, compute_seconds)
+        if cache:
+            self.local_cache.set(cache_key, value, ttl + self.valuation_stale_seconds)
+        if not self.client:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        if cache:
+            pipe.set(cache_key, value, ex=ttl + self.valuation_stale_seconds)
+        pipe.publish(VALUATION_READY_CHANNEL, property_hash.encode() + b' ' + value)
+        pipe.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:valuation:{property_hash}", token)
+        await self._call('publish valuation', pipe.execute)
+    
+    async def wait_for_valuation(self, property_hash: str, timeout: float, explained: bool = False) -> Optional[dict]:
+        """Wait for another worker to publish a valuation; None if it failed, lacks a required explanation or did not arrive in time"""
+        future = asyncio.get_running_loop().create_future()
+        waiters = self.valuation_waiters.setdefault(property_hash, set())
+        waiters.add(future)
+        try:
+            # The result may have been published between the caller's cache miss and registering here;
+            # an entry that is due for a refresh is what the caller is waiting to replace, so it does not count
+            cached, refresh = await self.lookup_valuation(property_hash)
+            if cached is not None and refresh is None and (not explained or cached.get('explanation')):
+                return cached
+            valuation = self._decode_valuation(await asyncio.wait_for(future, timeout))[0]
+            if valuation is not None and explained and not valuation.get('explanation'):
+                return None
+            return valuation
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters.discard(future)
+            if not waiters and self.valuation_waiters.get(property_hash) is waiters:
+                del self.valuation_waiters[property_hash]
+    
+    def _valuation_ready(self, data: bytes):
+        property_hash, _, value = data.partition(b' ')
+        waiters = self.valuation_waiters.get(property_hash.decode())
+        if not waiters:
+            return
+        for future in waiters:
+            if not future.done():
+                future.set_result(value)
+    
+    async def invalidate_local_caches(self, reason: str = ''):
+        """Tell every worker to drop its local tier; Redis entries of an old model version are simply never read again"""
+        self.local_cache.clear()
+        await self._call('invalidation', lambda: self.client.publish(CACHE_INVALIDATION_CHANNEL, reason))
     
     async def increment(self, key: str) -> int:
         """Increment a counter"""
-        if not self.client:
-            return 0
-        
-        try:
-            return await self.client.incr(key)
-        except Exception as e:
-            print(f"Redis increment error: {e}")
-            return 0
+        return await self._call('increment', lambda: self.client.incr(key), 0)
     
-    async def track_api_call(self, endpoint: str, user_id: Optional[str] = None):
-        """Track API usage"""
-        if not self.client:
+    def track_api_call(self, endpoint: str, user_id: Optional[str] = None, response_time_ms: Optional[float] = None):
+        """Count an API call in memory; flush_usage writes the counters to Redis"""
+        day = datetime.now().strftime('%Y%m%d')
+        self.usage_counts["api:total_requests"] += 1
+        self.usage_counts[f"api:daily:{day}"] += 1
+        self.usage_counts[f"api:calls:{endpoint}:{day}"] += 1
+        if user_id:
+            self.usage_counts[f"api:user:{user_id}:{day}"] += 1
+        if response_time_ms is not None:
+            self.usage_counts[f"api:timed_requests:{day}"] += 1
+            self.usage_sums[f"api:response_time_ms:{day}"] += response_time_ms
+    
+    async def _flush_usage_periodically(self):
+        while True:
+            await asyncio.sleep(self.usage_flush_seconds)
+            await self.flush_usage()
+    
+    async def flush_usage(self):
+        """Write buffered usage counters in one MULTI/EXEC round trip; daily keys get an expiry"""
+        # While the breaker is open the counters just keep accumulating
+        if not self.client or not (self.usage_counts or self.usage_sums) or not self.breaker.allow():
             return
         
+        counts, self.usage_counts = self.usage_counts, Counter()
+        sums, self.usage_sums = self.usage_sums, Counter()
         try:
-            # Daily counter
-            today_key = f"api:calls:{endpoint}:{datetime.now().strftime('%Y%m%d')}"
-            await self.increment(today_key)
-            
-            # Total requests counter
-            total_key = "api:total_requests"
-            await self.increment(total_key)
-            
-            # User-specific counter if user_id provided
-            if user_id:
-                user_key = f"api:user:{user_id}:{datetime.now().strftime('%Y%m%d')}"
-                await self.increment(user_key)
+            pipe = self.client.pipeline(transaction=True)
+            for key, count in counts.items():
+                pipe.incrby(key, count)
+            for key, total in sums.items():
+                pipe.incrbyfloat(key, total)
+            for key in [*counts, *sums]:
+                if key != "api:total_requests":
+                    pipe.expire(key, self.usage_key_ttl)
+            await pipe.execute()
+            self.breaker.record_success()
         except Exception as e:
-            print(f"Redis tracking error: {e}")
+            # Keep the counts for the next flush rather than losing them
+            self.breaker.record_failure()
+            print(f"Redis usage flush error: {e}")
+            self.usage_counts.update(counts)
+            self.usage_sums.update(sums)
     
     async def get_api_stats(self) -> Optional[dict]:
         """Get API usage statistics"""
-        if not self.client:
+        day = datetime.now().strftime('%Y%m%d')
+        counters = await self._call('get_api_stats', lambda: self.client.mget([
+            "api:total_requests",
+            f"api:daily:{day}",
+            f"api:response_time_ms:{day}",
+            f"api:timed_requests:{day}"
+        ]))
+        if counters is None:
             return None
         
-        try:
-            # Get total requests
-            total_requests = await self.client.get("api:total_requests")
-            total_requests = int(total_requests) if total_requests else 0
-            
-            # Get today's requests
-            today_key = f"api:daily:{datetime.now().strftime('%Y%m%d')}"
-            daily_requests = await self.client.get(today_key)
-            daily_requests = int(daily_requests) if daily_requests else 0
-            
-            # Simplified average response time (would be calculated properly in production)
-            avg_response_time = 45.0 + (total_requests % 50) / 10  # Mock calculation
-            
-            return {
-                "total_requests": total_requests,
-                "daily_requests": daily_requests,
-                "avg_response_time": avg_response_time
-            }
-        except Exception as e:
-            print(f"Redis get_api_stats error: {e}")
-            return None
+        total_requests, daily_requests, response_time_ms, timed_requests = counters
+        timed_requests = int(timed_requests) if timed_requests else 0
+        
+        return {
+            "total_requests": int(total_requests) if total_requests else 0,
+            "daily_requests": int(daily_requests) if daily_requests else 0,
+            # Mean over today's timed valuation requests
+            "avg_response_time": float(response_time_ms) / timed_requests if timed_requests else 0.0
+        }
 
 redis_client = RedisClient()
\ No newline at end of file
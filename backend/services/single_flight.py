@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+
+from middleware.metrics import cache_refreshes_total
+from services.redis_client import RedisClient
+
+class LeaderCancelled(Exception):
+    """The request computing a shared valuation went away before finishing"""
+
+class SingleFlight:
+    """Collapse concurrent requests for the same valuation key into one inference.
+
+    Duplicates on this worker await the first request's future. Across workers the first one to take
+    a short Redis lock computes and publishes the result; the rest wait for it on the ready channel and
+    compute it themselves only if it fails or does not arrive before the lock would have expired.
+    A request run with explained=True only takes a shared result that carries an explanation.
+    """
+
+    def __init__(self, redis: RedisClient, lock_ttl_ms: Optional[int] = None):
+        self.redis = redis
+        # Upper bound on one inference; also how long other workers wait before giving up on the lock holder
+        self.lock_ttl_ms = lock_ttl_ms or int(os.getenv('VALUATION_LOCK_TTL_MS', '5000'))
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self._refreshes: Dict[str, asyncio.Task] = {}
+
+    def refresh(self, key: str, compute: Callable[[], Awaitable[Dict]], reason: str, ttl: int = 3600, explained: bool = False):
+        """Recompute a cached valuation in the background while callers keep being served the current one"""
+        if key in self.inflight or key in self._refreshes:
+            return
+        cache_refreshes_total.labels(reason=reason).inc()
+        task = asyncio.create_task(self._refresh(key, compute, ttl, explained))
+        self._refreshes[key] = task
+        task.add_done_callback(lambda _: self._refreshes.pop(key, None))
+
+    async def _refresh(self, key: str, compute: Callable[[], Awaitable[Dict]], ttl: int, explained: bool):
+        try:
+            await self.run(key, compute, ttl, explained)
+        except Exception as e:
+            # The entry stays until its grace period ends; a later request tries again
+            print(f"Background valuation refresh failed: {e}")
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Dict]], ttl: int = 3600, explained: bool = False) -> Tuple[Dict, bool]:
+        """Return the valuation for key, cached for ttl, and whether another request computed it"""
+        future = self.inflight.get(key)
+        if future is not None:
+            try:
+                result = await asyncio.shield(future)
+            except LeaderCancelled:
+                return await self.run(key, compute, ttl, explained)
+            if not explained or result.get('explanation'):
+                return result, True
+            # The leader skipped the explanation; the leader has left inflight by now, so this one leads the next flight
+            return await self.run(key, compute, ttl, explained)
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            result, shared = await self._run_across_workers(key, compute, ttl, explained)
+            future.set_result(result)
+            return result, shared
+        except asyncio.CancelledError:
+            # Followers retry on their own rather than failing with a request they did not make
+            future.set_exception(LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+    async def _run_across_workers(self, key: str, compute: Callable[[], Awaitable[Dict]], ttl: int, explained: bool) -> Tuple[Dict, bool]:
+        token = uuid.uuid4().hex
+        if not await self.redis.acquire_valuation_lock(key, token, self.lock_ttl_ms):
+            result = await self.redis.wait_for_valuation(key, self.lock_ttl_ms / 1000, explained)
+            if result is not None:
+                return result, True
+            # The lock holder failed, is too slow or left out the explanation; its lock is gone by now, so just compute
+            started = time.perf_counter()
+            result = await compute()
+            if self._cacheable(key, result):
+                await self.redis.cache_valuation(key, result, ttl=ttl, compute_seconds=time.perf_counter() - started)
+            return result, False
+
+        started = time.perf_counter()
+        try:
+            result = await compute()
+        except BaseException:
+            await self.redis.release_valuation_lock(key, token)
+            raise
+        await self.redis.publish_valuation(
+            key,
+            result,
+            token,
+            ttl=ttl,
+            compute_seconds=time.perf_counter() - started,
+            cache=self._cacheable(key, result)
+        )
+        return result, False
+
+    @staticmethod
+    def _cacheable(key: str, result: Dict) -> bool:
+        # Skipped if a version swap landed between keying and predicting; waiters still get the result
+        return key.startswith(f"{result.get('model_version')}:")
+
+def get_valuation_flights(request: Request) -> SingleFlight:
+    """Return the per-worker SingleFlight created in main.lifespan"""
+    return request.app.state.valuation_flights
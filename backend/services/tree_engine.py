@@ -0,0 +1,448 @@
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# How a split treats missing values (NaN, and for LightGBM's 'Zero' type also 0.0)
+MISSING_AS_ZERO, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+LIGHTGBM_MISSING_TYPES = {'None': MISSING_AS_ZERO, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+# LightGBM reads every input with |x| <= kZeroThreshold (1e-35f) as exactly 0.0
+LIGHTGBM_ZERO_THRESHOLD = float(np.float32(1e-35))
+
+class FlatTreeEnsemble:
+    """Gradient-boosted trees flattened into node arrays and evaluated with vectorized NumPy traversal.
+
+    Every split sends a row left when ``x <= threshold``; leaves point at themselves so all
+    trees can be walked in lock-step for ``max_depth`` steps.
+    """
+
+    CHUNK_ROWS = 256
+
+    # Node arrays, stored in exactly the dtype the traversal uses so memory-mapped copies are never duplicated
+    ARRAYS = {
+        'feature': np.intp,
+        'threshold': np.float64,
+        'children': np.intp,
+        'default_left': np.bool_,
+        'missing_type': np.int8,
+        'value': np.float64,
+        'cover': np.float64,
+        'roots': np.intp,
+    }
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        default_left: np.ndarray,
+        missing_type: np.ndarray,
+        value: np.ndarray,
+        cover: np.ndarray,
+        roots: np.ndarray,
+        base_score: float,
+        max_depth: int,
+        n_features: int,
+        dtype: str = 'float64'
+    ):
+        self.feature = feature.astype(np.intp, copy=False)
+        # Thresholds are already rounded to the precision the source library compares in
+        self.threshold = threshold.astype(np.float64, copy=False)
+        # (n_nodes, 2) left/right child indices
+        self.children = children.astype(np.intp, copy=False)
+        self.default_left = default_left.astype(np.bool_, copy=False)
+        self.missing_type = missing_type.astype(np.int8, copy=False)
+        self.value = value.astype(np.float64, copy=False)
+        self.cover = cover.astype(np.float64, copy=False)
+        self.roots = roots.astype(np.intp, copy=False)
+        self.base_score = float(base_score)
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        # Precision the source library compares features in (XGBoost uses float32)
+        self.dtype = np.dtype(dtype)
+        self._flat_children = self.children.reshape(-1)
+        self._has_missing_as_zero = bool(np.any(self.missing_type == MISSING_AS_ZERO))
+        self._has_missing_zero = bool(np.any(self.missing_type == MISSING_ZERO))
+
+    @property
+    def left(self) -> np.ndarray:
+        return self.children[:, 0]
+
+    @property
+    def right(self) -> np.ndarray:
+        return self.children[:, 1]
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def shap_trees(self, scale: float = 1.0) -> List[Dict]:
+        """Per-tree arrays in the dict layout shap.TreeExplainer accepts, leaf values multiplied by scale"""
+        bounds = np.append(self.roots, len(self.feature))
+        is_leaf = self.left == np.arange(len(self.feature))
+        trees = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            leaf = is_leaf[start:end]
+            left = np.where(leaf, -1, self.left[start:end] - start)
+            right = np.where(leaf, -1, self.right[start:end] - start)
+            trees.append({
+                'children_left': left,
+                'children_right': right,
+                'children_default': np.where(self.default_left[start:end], left, right),
+                'features': np.where(leaf, -2, self.feature[start:end]),
+                'thresholds': np.where(leaf, 0.0, self.threshold[start:end]),
+                'values': (self.value[start:end] * scale).reshape(-1, 1),
+                'node_sample_weight': np.asarray(self.cover[start:end], dtype=np.float64)
+            })
+        return trees
+
+    def saabas_tables(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Cover-weighted expected value of every node, and per node the (n_nodes, n_features) feature contributions
+        accumulated along its path from the root: value(leaf) = expected(root) + contributions(leaf).sum()
+        """
+        is_leaf = self.left == np.arange(len(self.feature))
+        levels = [self.roots]
+        while True:
+            parents = levels[-1][~is_leaf[levels[-1]]]
+            if not len(parents):
+                break
+            levels.append(self.children[parents].reshape(-1))
+
+        expected = np.where(is_leaf, self.value, 0.0)
+        cover = self.cover.astype(np.float64)
+        for level in reversed(levels):
+            parents = level[~is_leaf[level]]
+            left, right = self.children[parents].T
+            total = cover[left] + cover[right]
+            # Uncovered splits (no training rows recorded) fall back to the plain mean of the children
+            expected[parents] = np.where(
+                total > 0,
+                (cover[left] * expected[left] + cover[right] * expected[right]) / np.where(total > 0, total, 1.0),
+                (expected[left] + expected[right]) / 2
+            )
+
+        contributions = np.zeros((len(self.feature), self.n_features), dtype=np.float64)
+        for level in levels:
+            parents = np.repeat(level[~is_leaf[level]], 2)
+            children = self.children[parents[::2]].reshape(-1)
+            contributions[children] = contributions[parents]
+            contributions[children, self.feature[parents]] += expected[children] - expected[parents]
+        return expected, contributions
+
+    @classmethod
+    def from_nodes(cls, trees: List[List[Dict]], base_score: float, n_features: int, dtype: str = 'float64') -> 'FlatTreeEnsemble':
+        """Build from per-tree node lists whose child indices are local to their tree"""
+        columns = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'default_left', 'missing_type', 'value', 'cover')}
+        roots = []
+        max_depth = 0
+
+        for nodes in trees:
+            offset = len(columns['feature'])
+            roots.append(offset)
+            depth = {0: 0}
+            for local_id, node in enumerate(nodes):
+                node_id = offset + local_id
+                if node.get('left', -1) < 0:
+                    # Leaf: feature 0 with an infinite threshold and self-loops keeps traversal in place
+                    columns['feature'].append(0)
+                    columns['threshold'].append(np.inf)
+                    columns['left'].append(node_id)
+                    columns['right'].append(node_id)
+                    columns['default_left'].append(True)
+                    columns['missing_type'].append(MISSING_NAN)
+                else:
+                    columns['feature'].append(node['feature'])
+                    columns['threshold'].append(node['threshold'])
+                    columns['left'].append(offset + node['left'])
+                    columns['right'].append(offset + node['right'])
+                    columns['default_left'].append(node['default_left'])
+                    columns['missing_type'].append(node.get('missing_type', MISSING_NAN))
+                    depth[node['left']] = depth[node['right']] = depth[local_id] + 1
+                    max_depth = max(max_depth, depth[local_id] + 1)
+                columns['value'].append(node.get('value', 0.0))
+                columns['cover'].append(node.get('cover', 0.0))
+
+        return cls(
+            feature=np.array(columns['feature'], dtype=np.intp),
+            threshold=np.array(columns['threshold'], dtype=np.float64).astype(dtype).astype(np.float64),
+            children=np.stack([columns['left'], columns['right']], axis=1).astype(np.intp),
+            default_left=np.array(columns['default_left'], dtype=np.bool_),
+            missing_type=np.array(columns['missing_type'], dtype=np.int8),
+            value=np.array(columns['value'], dtype=np.float64),
+            cover=np.array(columns['cover'], dtype=np.float64),
+            roots=np.array(roots, dtype=np.intp),
+            base_score=base_score,
+            max_depth=max_depth,
+            n_features=n_features,
+            dtype=dtype
+        )
+
+    @classmethod
+    def from_xgboost(cls, model) -> 'FlatTreeEnsemble':
+        """Flatten an XGBRegressor or Booster from its JSON model dump"""
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+        gbtree = learner['gradient_booster']['model']
+        trees = gbtree['trees']
+
+        # Match the sklearn wrapper, which stops at the early-stopping best iteration
+        best_iteration = getattr(model, 'best_iteration', None)
+        if best_iteration is not None and gbtree.get('iteration_indptr'):
+            trees = trees[:gbtree['iteration_indptr'][best_iteration + 1]]
+
+        flat_trees = []
+        for tree in trees:
+            if any(tree.get('split_type', [])):
+                raise ValueError("Categorical splits are not supported")
+            nodes = []
+            for i, left in enumerate(tree['left_children']):
+                if left < 0:
+                    # XGBoost keeps the leaf value in split_conditions
+                    nodes.append({'value': tree['split_conditions'][i], 'cover': tree['sum_hessian'][i]})
+                else:
+                    # XGBoost goes left on x < t; in float32 that is x <= the next float below t
+                    threshold = np.nextafter(np.float32(tree['split_conditions'][i]), np.float32(-np.inf))
+                    nodes.append({
+                        'feature': tree['split_indices'][i],
+                        'threshold': float(threshold),
+                        'left': left,
+                        'right': tree['right_children'][i],
+                        'default_left': bool(tree['default_left'][i]),
+                        'missing_type': MISSING_NAN,
+                        'cover': tree['sum_hessian'][i]
+                    })
+            flat_trees.append(nodes)
+
+        base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+        n_features = int(learner['learner_model_param']['num_feature'])
+        return cls.from_nodes(flat_trees, base_score, n_features, dtype='float32')
+
+    @classmethod
+    def from_lightgbm(cls, model) -> 'FlatTreeEnsemble':
+        """Flatten an LGBMRegressor or Booster from dump_model()"""
+        booster = model.booster_ if hasattr(model, 'booster_') else model
+        # dump_model keeps only the best iteration when early stopping recorded one
+        dump = booster.dump_model()
+        if dump.get('num_tree_per_iteration', 1) != 1:
+            raise ValueError("Only single-output LightGBM models are supported")
+
+        flat_trees = []
+        for tree in dump['tree_info']:
+            nodes: List[Dict] = []
+
+            def visit(node: Dict) -> int:
+                node_id = len(nodes)
+                if 'leaf_value' in node:
+                    nodes.append({'value': node['leaf_value'], 'cover': node.get('leaf_count', 0)})
+                    return node_id
+                if node['decision_type'] != '<=':
+                    raise ValueError("Categorical splits are not supported")
+                flat = {
+                    'feature': node['split_feature'],
+                    'threshold': cls._lightgbm_threshold(node['threshold']),
+                    'default_left': node['default_left'],
+                    'missing_type': LIGHTGBM_MISSING_TYPES[node['missing_type']],
+                    'value': node.get('internal_value', 0.0),
+                    'cover': node.get('internal_count', 0)
+                }
+                nodes.append(flat)
+                flat['left'] = visit(node['left_child'])
+                flat['right'] = visit(node['right_child'])
+                return node_id
+
+            visit(tree['tree_structure'])
+            flat_trees.append(nodes)
+
+        return cls.from_nodes(flat_trees, 0.0, dump['max_feature_idx'] + 1)
+
+    @staticmethod
+    def _lightgbm_threshold(threshold: float) -> float:
+        """Move a threshold inside LightGBM's zero band to where the band's inputs, compared as 0.0, actually split"""
+        if -LIGHTGBM_ZERO_THRESHOLD <= threshold < 0:
+            return float(np.nextafter(-LIGHTGBM_ZERO_THRESHOLD, -np.inf))
+        if 0 <= threshold < LIGHTGBM_ZERO_THRESHOLD:
+            return LIGHTGBM_ZERO_THRESHOLD
+        return threshold
+
+    def predict_leaves(self, features: np.ndarray) -> np.ndarray:
+        """Leaf node index reached in every tree, shape (n_rows, n_trees)"""
+        features = np.asarray(features, dtype=self.dtype)
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        features = np.ascontiguousarray(features, dtype=np.float64)
+
+        # Walk a few hundred rows at a time so the node index blocks stay in cache
+        leaves = np.empty((len(features), self.n_trees), dtype=np.intp)
+        for start in range(0, len(features), self.CHUNK_ROWS):
+            chunk = features[start:start + self.CHUNK_ROWS]
+            leaves[start:start + len(chunk)] = self._walk(chunk)
+        return leaves
+
+    def _walk(self, features: np.ndarray) -> np.ndarray:
+        """Advance every (row, tree) pair one level per step until all sit on leaves"""
+        has_nan = bool(np.isnan(features).any())
+        flat_features = features.ravel()
+
+        # Flat offsets avoid 2-D fancy indexing inside the loop
+        row_offsets = (np.arange(len(features), dtype=np.intp) * features.shape[1])[:, None]
+        nodes = np.tile(self.roots, (len(features), 1))
+        for _ in range(self.max_depth):
+            values = flat_features.take(row_offsets + self.feature.take(nodes))
+            go_right = values > self.threshold.take(nodes)
+
+            if has_nan or self._has_missing_zero:
+                go_right = self._route_missing(nodes, values, go_right, has_nan)
+
+            nodes = self._flat_children.take(2 * nodes + go_right)
+        return nodes
+
+    def _route_missing(self, nodes: np.ndarray, values: np.ndarray, go_right: np.ndarray, has_nan: bool) -> np.ndarray:
+        """Send missing values down each split's default branch"""
+        node_missing = self.missing_type.take(nodes)
+        is_nan = np.isnan(values) if has_nan else np.zeros(values.shape, dtype=bool)
+
+        if has_nan and self._has_missing_as_zero:
+            # LightGBM without missing handling compares NaN as 0.0
+            as_zero = is_nan & (node_missing == MISSING_AS_ZERO)
+            go_right = np.where(as_zero, 0.0 > self.threshold.take(nodes), go_right)
+            is_nan &= ~as_zero
+
+        missing = is_nan
+        if self._has_missing_zero:
+            missing = missing | ((node_missing == MISSING_ZERO) & (np.abs(values) <= LIGHTGBM_ZERO_THRESHOLD))
+        return np.where(missing, ~self.default_left.take(nodes), go_right)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Sum of leaf values plus base score, one value per row"""
+        return self.base_score + self.value[self.predict_leaves(features)].sum(axis=1)
+
+    def parity_sample(self, n_rows: int = 256, seed: int = 0) -> np.ndarray:
+        """Rows built from the ensemble's own split thresholds, so comparisons land on and around every boundary"""
+        rng = np.random.default_rng(seed)
+        sample = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        is_split = np.isfinite(self.threshold)
+        for column in range(self.n_features):
+            thresholds = self.threshold[is_split & (self.feature == column)].astype(self.dtype)
+            if len(thresholds) == 0:
+                continue
+            picked = rng.choice(thresholds, n_rows)
+            # A third exactly on a threshold, a third just above, a third well inside a bucket
+            nudge = rng.integers(0, 3, n_rows)
+            above = np.nextafter(picked, np.array(np.inf, dtype=self.dtype))
+            inside = picked + (np.abs(picked) + 1) * rng.uniform(-0.01, 0.01, n_rows).astype(self.dtype)
+            sample[:, column] = np.select([nudge == 0, nudge == 1], [picked, above], inside)
+        return sample
+
+def check_parity(engine: FlatTreeEnsemble, native_predict, features: Optional[np.ndarray] = None, rtol: float = 1e-5) -> float:
+    """Compare the flattened engine with the library's own predict; returns the worst relative error"""
+    if features is None:
+        features = engine.parity_sample()
+    expected = np.asarray(native_predict(features), dtype=np.float64).reshape(-1)
+    actual = engine.predict(features)
+    scale = np.maximum(np.abs(expected), 1.0)
+    worst = float(np.max(np.abs(actual - expected) / scale)) if len(expected) else 0.0
+    if worst > rtol:
+        raise ValueError(f"Flattened trees diverge from native predictions (max relative error {worst:.2e})")
+    return worst
+
+class StackedTrees:
+    """Several flattened ensembles walked as one forest: a single traversal per input precision yields every model's output"""
+
+    def __init__(
+        self,
+        ensembles: Dict[str, FlatTreeEnsemble],
+        contribution_weights: Optional[Dict[str, float]] = None,
+        forests: Optional[Dict[str, Tuple[List[str], FlatTreeEnsemble]]] = None
+    ):
+        contribution_weights = contribution_weights or {}
+        # Per dtype name, member names and their forest as already stacked by merge(), e.g. memory-mapped from a bundle
+        forests = forests or {}
+        self.names = list(ensembles)
+        self.n_features = max(engine.n_features for engine in ensembles.values())
+        # Saabas tables of the weighted members, read with the same leaf indices as the predictions
+        self.contribution_bias = 0.0
+        self.has_contributions = bool(set(contribution_weights) & set(ensembles))
+        self.groups = []
+        for dtype in sorted({engine.dtype.str for engine in ensembles.values()}):
+            members = [(name, engine) for name, engine in ensembles.items() if engine.dtype.str == dtype]
+            stacked = forests.get(np.dtype(dtype).name)
+            if self._matches(stacked, members):
+                # Stacked at export time and memory-mapped: walked in place rather than concatenated into private memory
+                order, forest = stacked
+                members.sort(key=lambda member: order.index(member[0]))
+            else:
+                forest = self.merge([engine for _, engine in members])
+            tree_starts = np.cumsum([0] + [engine.n_trees for _, engine in members[:-1]])
+            base_scores = np.array([engine.base_score for _, engine in members])
+            tables = []
+            node_offset = 0
+            for (name, engine), first_tree in zip(members, tree_starts):
+                if name in contribution_weights:
+                    weight = contribution_weights[name]
+                    expected, table = engine.saabas_tables()
+                    table = np.pad(table, ((0, 0), (0, self.n_features - engine.n_features))) * weight
+                    tables.append((slice(first_tree, first_tree + engine.n_trees), node_offset, table))
+                    self.contribution_bias += weight * (engine.base_score + expected[engine.roots].sum())
+                node_offset += len(engine.feature)
+            self.groups.append(([name for name, _ in members], (forest, tree_starts, base_scores), tables))
+
+    @staticmethod
+    def _matches(stacked: Optional[Tuple[List[str], FlatTreeEnsemble]], members: List[Tuple[str, FlatTreeEnsemble]]) -> bool:
+        """Whether a prebuilt forest holds exactly these members"""
+        if stacked is None:
+            return False
+        names, forest = stacked
+        engines = dict(members)
+        return sorted(names) == sorted(engines) and \
+            forest.n_trees == sum(engine.n_trees for engine in engines.values()) and \
+            len(forest.feature) == sum(len(engine.feature) for engine in engines.values())
+
+    @staticmethod
+    def merge(engines: List[FlatTreeEnsemble]) -> FlatTreeEnsemble:
+        """Concatenate node tables in order, shifting child and root indices; base scores stay with the members"""
+        node_offsets = np.cumsum([0] + [len(engine.feature) for engine in engines[:-1]])
+        return FlatTreeEnsemble(
+            feature=np.concatenate([engine.feature for engine in engines]),
+            threshold=np.concatenate([engine.threshold for engine in engines]),
+            children=np.concatenate([engine.children + offset for engine, offset in zip(engines, node_offsets)]),
+            default_left=np.concatenate([engine.default_left for engine in engines]),
+            missing_type=np.concatenate([engine.missing_type for engine in engines]),
+            value=np.concatenate([engine.value for engine in engines]),
+            cover=np.concatenate([engine.cover for engine in engines]),
+            roots=np.concatenate([engine.roots + offset for engine, offset in zip(engines, node_offsets)]),
+            base_score=0.0,
+            max_depth=max(engine.max_depth for engine in engines),
+            n_features=max(engine.n_features for engine in engines),
+            dtype=engines[0].dtype.name
+        )
+
+    def predict(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        """Every model's prediction, keyed by the name it was stacked under"""
+        return self.predict_with_contributions(features, contributions=False)[0]
+
+    def predict_with_contributions(
+        self,
+        features: np.ndarray,
+        contributions: bool = True,
+        rows: Optional[np.ndarray] = None
+    ) -> Tuple[Dict[str, np.ndarray], Optional[np.ndarray]]:
+        """Predictions plus the weighted members' Saabas contributions, shape (n_rows, n_features), from one traversal;
+        rows limits the contributions to those row indices, in that order
+        """
+        features = np.atleast_2d(features)
+        rows = np.arange(len(features)) if rows is None else np.asarray(rows, dtype=np.intp)
+        outputs = {}
+        totals = np.zeros((len(rows), self.n_features)) if contributions and self.has_contributions else None
+        for names, (forest, tree_starts, base_scores), tables in self.groups:
+            leaves = forest.predict_leaves(features)
+            sums = np.add.reduceat(forest.value.take(leaves), tree_starts, axis=1) + base_scores
+            outputs.update(zip(names, sums.T))
+            if totals is None or not len(rows):
+                continue
+            explained = leaves if len(rows) == len(features) else leaves[rows]
+            for trees, node_offset, table in tables:
+                member_leaves = explained[:, trees] - node_offset
+                # Row chunks bound the (rows, trees, features) gather
+                for start in range(0, len(rows), FlatTreeEnsemble.CHUNK_ROWS):
+                    chunk = member_leaves[start:start + FlatTreeEnsemble.CHUNK_ROWS]
+                    totals[start:start + len(chunk)] += table.take(chunk, axis=0).sum(axis=1)
+        return outputs, totals
@@ -0,0 +1,385 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, Request
+
+from services.ml_service import MLService, InferenceQueueFull
+from services.redis_client import RedisClient
+
+JOB_QUEUE = 'valuation_jobs:queue'
+JOB_RUNNING = 'valuation_jobs:running'
+
+FINISHED_STATUSES = {'completed', 'failed', 'cancelled'}
+
+# Move the oldest queued job to the running list and lease it in one step, so a claimed job always has an owner
+CLAIM_SCRIPT = """
+local job_id = redis.call('RPOP', KEYS[1])
+if job_id then
+    redis.call('LPUSH', KEYS[2], job_id)
+    redis.call('SET', ARGV[1] .. job_id .. ARGV[2], ARGV[3], 'EX', ARGV[4])
+end
+return job_id
+"""
+
+# Extend a lease only if it is still ours (or lapsed), checked and written in one step
+RENEW_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+# Count a finished chunk only if the lease is still ours and no one else has counted it first
+COMMIT_CHUNK_SCRIPT = """
+local owner = redis.call('GET', KEYS[2])
+if owner and owner ~= ARGV[1] then
+    return 0
+end
+if redis.call('HGET', KEYS[1], 'completed_chunks') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[4])
+redis.call('DEL', KEYS[4])
+redis.call('HINCRBY', KEYS[1], 'completed_chunks', 1)
+redis.call('HINCRBY', KEYS[1], 'successful', ARGV[5])
+redis.call('HINCRBY', KEYS[1], 'failed', ARGV[6])
+redis.call('HINCRBYFLOAT', KEYS[1], 'total_value', ARGV[7])
+redis.call('HSET', KEYS[1], 'model_version', ARGV[8], 'updated_at', ARGV[9])
+return 1
+"""
+
+# Change the status of a job that has not finished (or been cancelled), optionally only at a given chunk count
+STATUS_SCRIPT = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if not status or status == 'completed' or status == 'failed' or status == 'cancelled' then
+    return 0
+end
+if ARGV[2] ~= '' and redis.call('HGET', KEYS[1], 'completed_chunks') ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[1], ARGV[3], ARGV[4], 'updated_at', ARGV[5])
+return 1
+"""
+
+class JobNotFound(Exception):
+    """Raised for unknown or expired job ids"""
+
+class ValuationJobs:
+    """Batch valuations split into chunks, persisted in Redis and worked off by background runners
+
+    Each chunk's input is stored at submit time and its results are written in the same transaction that
+    advances completed_chunks, so a restarted runner resumes from the first unfinished chunk.
+    """
+
+    def __init__(self, redis: RedisClient, ml_service: MLService, chunk_size: Optional[int] = None):
+        self.redis = redis
+        self.ml_service = ml_service
+        self.chunk_size = chunk_size or int(os.getenv('VALUATION_JOB_CHUNK_SIZE', '1000'))
+        self.concurrency = int(os.getenv('VALUATION_JOB_CONCURRENCY', '1'))
+        self.ttl = int(os.getenv('VALUATION_JOB_TTL_SECONDS', str(7 * 24 * 3600)))
+        # A running job whose lease is not renewed within this window is picked up by another runner
+        self.lease_seconds = int(os.getenv('VALUATION_JOB_LEASE_SECONDS', '30'))
+        self.max_attempts = int(os.getenv('VALUATION_JOB_MAX_ATTEMPTS', '3'))
+        self.poll_seconds = float(os.getenv('VALUATION_JOB_POLL_SECONDS', '1'))
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._runners: Set[asyncio.Task] = set()
+        self._claim = None
+        self._renew = None
+        self._commit = None
+        self._status = None
+        self._last_recovery = 0.0
+
+    @property
+    def client(self):
+        return self.redis.text_client
+
+    @staticmethod
+    def _key(job_id: str, *parts) -> str:
+        return ':'.join(['valuation_job', job_id, *map(str, parts)])
+
+    def _require_redis(self):
+        if self.client is None:
+            raise RuntimeError("Redis is unavailable; valuation jobs need it for persistence")
+
+    def start(self):
+        """Start the background runners on the running event loop"""
+        if not self._runners:
+            for _ in range(self.concurrency):
+                task = asyncio.create_task(self._run())
+                self._runners.add(task)
+                task.add_done_callback(self._runners.discard)
+
+    async def stop(self):
+        """Stop the runners; unfinished jobs resume elsewhere once their lease expires"""
+        for task in list(self._runners):
+            task.cancel()
+        if self._runners:
+            await asyncio.gather(*self._runners, return_exceptions=True)
+
+    async def submit(self, properties: List[Dict]) -> Dict:
+        """Store a batch as chunks and queue it, returning the new job's status"""
+        self._require_redis()
+        job_id = uuid.uuid4().hex
+        n_chunks = (len(properties) + self.chunk_size - 1) // self.chunk_size
+        now = datetime.utcnow().isoformat()
+
+        # Inputs go in before the job is queued, in bounded pipelines so huge batches don't build one giant request
+        pipe = self.client.pipeline(transaction=False)
+        for chunk in range(n_chunks):
+            start = chunk * self.chunk_size
+            pipe.set(self._key(job_id, 'input', chunk), json.dumps(properties[start:start + self.chunk_size]), ex=self.ttl)
+            if len(pipe) >= 100:
+                await pipe.execute()
+        await pipe.execute()
+
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(self._key(job_id), mapping={
+            'job_id': job_id,
+            'status': 'queued',
+            'total_properties': len(properties),
+            'chunk_size': self.chunk_size,
+            'chunks': n_chunks,
+            'completed_chunks': 0,
+            'successful': 0,
+            'failed': 0,
+            'total_value': 0,
+            'created_at': now,
+            'updated_at': now
+        })
+        pipe.expire(self._key(job_id), self.ttl)
+        pipe.lpush(JOB_QUEUE, job_id)
+        await pipe.execute()
+
+        print(f"Valuation job {job_id} queued: {len(properties)} properties in {n_chunks} chunks")
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Dict:
+        """Job status and progress"""
+        self._require_redis()
+        job = await self.client.hgetall(self._key(job_id))
+        if not job:
+            raise JobNotFound(job_id)
+
+        for field in ('total_properties', 'chunk_size', 'chunks', 'completed_chunks', 'successful', 'failed'):
+            job[field] = int(job[field])
+        job['total_value'] = float(job['total_value'])
+        processed = job['successful'] + job['failed']
+        job['processed_properties'] = processed
+        job['progress_percent'] = round(100 * processed / max(job['total_properties'], 1), 1)
+        job['average_property_value'] = job['total_value'] / max(job['successful'], 1)
+        return job
+
+    async def results(self, job_id: str, offset: int = 0, limit: int = 1000) -> Dict:
+        """One page of results in submission order; only finished chunks are visible"""
+        job = await self.get(job_id)
+        chunk_size = job['chunk_size']
+        available = min(job['completed_chunks'] * chunk_size, job['total_properties'])
+
+        end = min(offset + limit, available)
+        results = []
+        if offset < end:
+            chunks = list(range(offset // chunk_size, (end - 1) // chunk_size + 1))
+            pages = await self.client.mget([self._key(job_id, 'results', chunk) for chunk in chunks])
+            for chunk, page in zip(chunks, pages):
+                rows = json.loads(page) if page else []
+                first = chunk * chunk_size
+                results.extend(rows[max(offset - first, 0):end - first])
+
+        return {
+            'job_id': job_id,
+            'status': job['status'],
+            'offset': offset,
+            'limit': limit,
+            'available': available,
+            'total_properties': job['total_properties'],
+            'next_offset': offset + len(results) if offset + len(results) < available else None,
+            'results': results
+        }
+
+    async def cancel(self, job_id: str) -> Dict:
+        """Stop a job after its current chunk; finished chunks stay readable"""
+        job = await self.get(job_id)
+        if job['status'] not in FINISHED_STATUSES:
+            await self.client.hset(self._key(job_id), mapping={
+                'status': 'cancelled',
+                'updated_at': datetime.utcnow().isoformat()
+            })
+            await self.client.lrem(JOB_QUEUE, 0, job_id)
+        return await self.get(job_id)
+
+    async def _run(self):
+        """Claim queued jobs one at a time, checking periodically for jobs abandoned by a dead runner"""
+        while True:
+            try:
+                if self.client is None:
+                    await asyncio.sleep(5)
+                    continue
+
+                if time.monotonic() - self._last_recovery > self.lease_seconds:
+                    self._last_recovery = time.monotonic()
+                    await self._recover_abandoned()
+
+                job_id = await self._claim_next()
+                if job_id is None:
+                    await asyncio.sleep(self.poll_seconds)
+                    continue
+                await self._process(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Valuation job runner error: {e}")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _claim_next(self) -> Optional[str]:
+        if self._claim is None:
+            self._claim = self.client.register_script(CLAIM_SCRIPT)
+        job_id = await self._claim(
+            keys=[JOB_QUEUE, JOB_RUNNING],
+            args=['valuation_job:', ':lease', self.runner_id, self.lease_seconds]
+        )
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    async def _recover_abandoned(self):
+        """Requeue running jobs whose lease has lapsed; they continue from their last finished chunk"""
+        for job_id in await self.client.lrange(JOB_RUNNING, 0, -1):
+            if await self.client.exists(self._key(job_id, 'lease')):
+                continue
+            # Only the runner that actually removes the entry requeues it
+            if await self.client.lrem(JOB_RUNNING, 1, job_id):
+                await self.client.rpush(JOB_QUEUE, job_id)
+                print(f"Valuation job {job_id} lost its runner, resuming")
+
+    async def _renew_lease(self, job_id: str) -> bool:
+        """Extend our lease; False if another runner has taken the job over"""
+        if self._renew is None:
+            self._renew = self.client.register_script(RENEW_SCRIPT)
+        return bool(await self._renew(keys=[self._key(job_id, 'lease')], args=[self.runner_id, self.lease_seconds]))
+
+    async def _set_status(self, job_id: str, status: str, field: str, value: str, completed_chunks: Optional[int] = None) -> bool:
+        """Move an unfinished job to status; False if it finished or was cancelled, or is no longer at completed_chunks"""
+        if self._status is None:
+            self._status = self.client.register_script(STATUS_SCRIPT)
+        return bool(await self._status(
+            keys=[self._key(job_id)],
+            args=[status, '' if completed_chunks is None else completed_chunks, field, value, datetime.utcnow().isoformat()]
+        ))
+
+    async def _commit_chunk(self, job_id: str, chunk: int, results: List[Dict], successful: int, value: float, model_version: str) -> bool:
+        """Store a chunk's results and count them in one step; False if another runner got there first"""
+        if self._commit is None:
+            self._commit = self.client.register_script(COMMIT_CHUNK_SCRIPT)
+        return bool(await self._commit(
+            keys=[self._key(job_id), self._key(job_id, 'lease'), self._key(job_id, 'results', chunk), self._key(job_id, 'input', chunk)],
+            args=[
+                self.runner_id, chunk, json.dumps(results), self.ttl,
+                successful, len(results) - successful, value, model_version, datetime.utcnow().isoformat()
+            ]
+        ))
+
+    async def _release(self, job_id: str):
+        await self.client.lrem(JOB_RUNNING, 0, job_id)
+        await self.client.delete(self._key(job_id, 'lease'))
+
+    async def _process(self, job_id: str):
+        key = self._key(job_id)
+        try:
+            job = await self.get(job_id)
+        except JobNotFound:
+            await self._release(job_id)
+            return
+
+        if job['status'] in FINISHED_STATUSES:
+            await self._release(job_id)
+            return
+
+        if job['completed_chunks']:
+            print(f"Valuation job {job_id} resuming at chunk {job['completed_chunks']}/{job['chunks']}")
+        # Not over a cancel that landed since the job was read
+        if not await self._set_status(job_id, 'running', 'runner', self.runner_id):
+            await self._release(job_id)
+            return
+
+        for chunk in range(job['completed_chunks'], job['chunks']):
+            if not await self._renew_lease(job_id):
+                print(f"Valuation job {job_id} was taken over by another runner")
+                return
+            if await self.client.hget(key, 'status') == 'cancelled':
+                break
+
+            payload = await self.client.get(self._key(job_id, 'input', chunk))
+            if payload is None:
+                # A runner that lost the job may find the input already consumed by the one that took it over
+                await self._set_status(job_id, 'failed', 'error', f"input for chunk {chunk} has expired", completed_chunks=chunk)
+                break
+
+            results, successful, value, model_version = await self._value_chunk(job_id, chunk, json.loads(payload))
+
+            # Results and progress move together, so a crash never leaves a chunk half counted
+            if not await self._commit_chunk(job_id, chunk, results, successful, value, model_version):
+                print(f"Valuation job {job_id} was taken over by another runner")
+                return
+        else:
+            # A cancel during the last chunk stands
+            if await self._set_status(job_id, 'completed', 'completed_at', datetime.utcnow().isoformat(), completed_chunks=job['chunks']):
+                print(f"Valuation job {job_id} completed")
+
+        await self._release(job_id)
+
+    async def _value_chunk(self, job_id: str, chunk: int, properties: List[Dict]) -> Tuple[List[Dict], int, float, str]:
+        """Value one chunk, waiting out inference backpressure and retrying other failures"""
+        first_index = chunk * self.chunk_size
+        attempt = 0
+        while True:
+            try:
+                predictions = await self.ml_service.batch_predict(properties)
+                break
+            except InferenceQueueFull as e:
+                # Interactive traffic has priority; keep the lease alive while we wait
+                await self._renew_lease(job_id)
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    error = str(e)
+                    return [
+                        {
+                            'index': first_index + i,
+                            'property_id': property_data.get('property_id'),
+                            'status': 'failed',
+                            'error': error
+                        }
+                        for i, property_data in enumerate(properties)
+                    ], 0, 0.0, self.ml_service.model_version
+                await asyncio.sleep(attempt)
+
+        results = [
+            {
+                'index': first_index + i,
+                'property_id': property_data.get('property_id'),
+                'status': 'success',
+                'valuation': {
+                    'predicted_value': prediction['predicted_value'],
+                    'confidence_interval': prediction['confidence_interval'],
+                    'price_per_sqft': prediction['price_per_sqft']
+                }
+            }
+            for i, (property_data, prediction) in enumerate(zip(properties, predictions))
+        ]
+        total_value = sum(prediction['predicted_value'] for prediction in predictions)
+        model_version = predictions[0].get('model_version', self.ml_service.model_version) if predictions else self.ml_service.model_version
+        return results, len(results), total_value, model_version
+
+def get_valuation_jobs(request: Request) -> ValuationJobs:
+    """Return the per-worker ValuationJobs created in main.lifespan"""
+    jobs = getattr(request.app.state, 'valuation_jobs', None)
+    if jobs is None or jobs.client is None:
+        raise HTTPException(status_code=503, detail="Valuation jobs need Redis, which is unavailable")
+    return jobs
@@ -0,0 +1,224 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from middleware.metrics import valuation_write_queue_depth, valuation_writes_total
+from services.database import AsyncSessionLocal, Property, Valuation
+
+# asyncpg binds at most 32767 parameters per statement
+MAX_BIND_PARAMETERS = 32767
+PROPERTY_ID_LENGTH = Property.__table__.c.property_id.type.length
+
+class ValuationWriter:
+    """Write-behind persistence for /predict valuations.
+
+    Rows are buffered in memory and written every VALUATION_WRITE_BATCH_SIZE rows or
+    VALUATION_WRITE_INTERVAL_MS, whichever comes first, as multi-row INSERT ... ON CONFLICT DO NOTHING
+    statements in one transaction of the writer's own session. A flush that fails because the database
+    is unreachable keeps its rows for the next one; valuation ids are assigned on submit, so a retried
+    batch never inserts a row twice. A batch the database refuses is written in halves until the
+    offending rows are found, and only those are dropped.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        batch_size: Optional[int] = None,
+        interval_ms: Optional[float] = None,
+        max_pending: Optional[int] = None
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or int(os.getenv('VALUATION_WRITE_BATCH_SIZE', '500'))
+        self.interval = (interval_ms if interval_ms is not None else float(os.getenv('VALUATION_WRITE_INTERVAL_MS', '1000'))) / 1000
+        # Beyond this many unwritten rows (a long database outage) the oldest are dropped to bound memory
+        self.max_pending = max_pending or int(os.getenv('VALUATION_WRITE_MAX_PENDING', '50000'))
+        self.properties: Dict[str, Dict] = {}
+        self.valuations: List[Dict] = []
+        self._full = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def start(self):
+        """Start flushing on the running event loop"""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the flusher and write whatever is still buffered"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self.valuations:
+            print(f"Valuation writer stopped with {len(self.valuations)} valuations unwritten")
+
+    def submit(self, property_id: Optional[str], prediction: Dict, property_data: Dict):
+        """Queue a valuation, and the property it belongs to if that is not stored yet"""
+        if not property_id:
+            return
+        if len(property_id) > PROPERTY_ID_LENGTH:
+            # Cutting it down could file the valuation under another property
+            print(f"Not saving valuation for property id longer than {PROPERTY_ID_LENGTH} characters: {property_id[:80]}")
+            valuation_writes_total.labels(result='rejected').inc()
+            return
+        now = datetime.utcnow()
+        if property_id not in self.properties:
+            property_row = _fit(Property, {
+                **{k: v for k, v in property_data.items() if k != 'property_id' and hasattr(Property, k)},
+                'id': uuid.uuid4(),
+                'property_id': property_id,
+                'created_at': now,
+                'updated_at': now
+            })
+            missing = [
+                column.name for column in Property.__table__.columns
+                if not column.nullable and column.default is None and property_row.get(column.name) is None
+            ]
+            if missing:
+                # The valuation is still saved if the property is already stored; if not, the write isolates and drops it
+                print(f"Not saving property {property_id}, missing {', '.join(missing)}")
+            else:
+                self.properties[property_id] = property_row
+        self.valuations.append(_fit(Valuation, {
+            'id': uuid.uuid4(),
+            'property_id': property_id,
+            'predicted_value': prediction['predicted_value'],
+            'confidence_lower': prediction['confidence_interval']['lower'],
+            'confidence_upper': prediction['confidence_interval']['upper'],
+            'confidence_level': prediction['confidence_interval'].get('confidence_level', 95.0),
+            'model_version': prediction.get('model_version', 'v1.0.0'),
+            'model_type': 'ensemble',
+            'prediction_metadata': prediction,
+            'created_at': now
+        }))
+
+        if len(self.valuations) > self.max_pending:
+            self._drop_oldest()
+        valuation_write_queue_depth.set(len(self.valuations))
+        if len(self.valuations) >= self.batch_size:
+            self._full.set()
+
+    def _drop_oldest(self):
+        # Make room for a whole batch at once so a long outage does not prune on every submit
+        dropped = len(self.valuations) - max(self.max_pending - self.batch_size, 0)
+        del self.valuations[:dropped]
+        remaining = {valuation['property_id'] for valuation in self.valuations}
+        self.properties = {property_id: row for property_id, row in self.properties.items() if property_id in remaining}
+        valuation_writes_total.labels(result='dropped').inc(dropped)
+        print(f"Valuation write buffer full, dropped the {dropped} oldest valuations")
+
+    async def _flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if not await self.flush():
+                # Back off rather than retrying in a tight loop while the database is down
+                await asyncio.sleep(self.interval)
+
+    async def flush(self) -> bool:
+        """Write everything buffered so far, one batch at a time; unwritten rows stay buffered while the database is unreachable"""
+        flushed = True
+        async with self._flush_lock:
+            while self.valuations:
+                properties, valuations = self._take_batch()
+                written: List[Dict] = []
+                try:
+                    await self._write_isolating(properties, valuations, written)
+                except Exception as e:
+                    written_ids = {valuation['id'] for valuation in written}
+                    unwritten = [valuation for valuation in valuations if valuation['id'] not in written_ids]
+                    valuation_writes_total.labels(result='written').inc(len(written))
+                    if not _is_transient(e):
+                        # Not something a retry fixes, and it did not single out any rows
+                        print(f"Error saving {len(unwritten)} valuations to database, dropping them: {e}")
+                        valuation_writes_total.labels(result='rejected').inc(len(unwritten))
+                        continue
+                    print(f"Error saving {len(unwritten)} valuations to database, will retry: {e}")
+                    valuation_writes_total.labels(result='retried').inc(len(unwritten))
+                    self.valuations[:0] = unwritten
+                    needed = {valuation['property_id'] for valuation in unwritten}
+                    for property_row in properties:
+                        if property_row['property_id'] in needed:
+                            self.properties.setdefault(property_row['property_id'], property_row)
+                    flushed = False
+                    break
+                valuation_writes_total.labels(result='written').inc(len(written))
+            valuation_write_queue_depth.set(len(self.valuations))
+            if len(self.valuations) < self.batch_size:
+                self._full.clear()
+        return flushed
+
+    def _take_batch(self) -> Tuple[List[Dict], List[Dict]]:
+        valuations, self.valuations = self.valuations[:self.batch_size], self.valuations[self.batch_size:]
+        needed = {valuation['property_id'] for valuation in valuations}
+        properties = [self.properties.pop(property_id) for property_id in needed if property_id in self.properties]
+        return properties, valuations
+
+    async def _write_isolating(self, properties: List[Dict], valuations: List[Dict], written: List[Dict]):
+        """Write a batch, splitting it in halves around rows the database refuses; written collects what got in"""
+        try:
+            await self._write(properties, valuations)
+        except (IntegrityError, DataError) as e:
+            if len(valuations) == 1:
+                print(f"Dropping valuation {valuations[0]['id']} of property {valuations[0]['property_id']}, refused by the database: {e.orig}")
+                valuation_writes_total.labels(result='rejected').inc()
+                return
+            middle = len(valuations) // 2
+            by_property_id = {row['property_id']: row for row in properties}
+            for half in (valuations[:middle], valuations[middle:]):
+                needed = {valuation['property_id'] for valuation in half}
+                await self._write_isolating([by_property_id[p] for p in needed if p in by_property_id], half, written)
+            return
+        written.extend(valuations)
+
+    async def _write(self, properties: List[Dict], valuations: List[Dict]):
+        async with self.session_factory() as session:
+            async with session.begin():
+                # Properties first so the valuations' foreign keys resolve; existing properties are left as they are
+                await self._insert(session, Property, properties, 'property_id')
+                await self._insert(session, Valuation, valuations, 'id')
+
+    @staticmethod
+    async def _insert(session: AsyncSession, model, rows: List[Dict], conflict_column: str):
+        if not rows:
+            return
+        # Every row of one multi-row VALUES list needs the same columns
+        columns = sorted({column for row in rows for column in row})
+        rows = [{column: row.get(column) for column in columns} for row in rows]
+        chunk_size = MAX_BIND_PARAMETERS // len(columns)
+        for start in range(0, len(rows), chunk_size):
+            statement = insert(model).values(rows[start:start + chunk_size])
+            await session.execute(statement.on_conflict_do_nothing(index_elements=[conflict_column]))
+
+def _fit(model, row: Dict) -> Dict:
+    """Cut strings down to their column's length, which Postgres would refuse the whole statement over"""
+    for column in model.__table__.columns:
+        length = getattr(column.type, 'length', None)
+        value = row.get(column.name)
+        if length and isinstance(value, str) and len(value) > length:
+            row[column.name] = value[:length]
+    return row
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failed write may succeed as is once the database is reachable again"""
+    if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError, OSError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+def get_valuation_writer(request: Request) -> ValuationWriter:
+    """Return the per-worker ValuationWriter created in main.lifespan"""
+    return request.app.state.valuation_writer
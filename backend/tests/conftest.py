@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the backend the way the app does (services.*, api.*), whichever directory pytest runs from
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+from services import circuit_breaker
+from services.circuit_breaker import CircuitBreaker
+from services.redis_client import RedisClient
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def make_breaker(monkeypatch, failure_threshold=3, reset_seconds=10.0):
+    clock = Clock()
+    # Only the breaker's clock; the event loop keeps real time
+    monkeypatch.setattr(circuit_breaker, 'time', SimpleNamespace(monotonic=clock))
+    return CircuitBreaker('test', failure_threshold=failure_threshold, reset_seconds=reset_seconds), clock
+
+def test_opens_after_consecutive_failures_only(monkeypatch):
+    breaker, _ = make_breaker(monkeypatch)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.is_open and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+
+def test_lets_one_trial_through_after_the_cool_down(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    for _ in range(3):
+        breaker.record_failure()
+
+    clock.now += 9.9
+    assert not breaker.allow()
+    clock.now += 0.1
+    assert breaker.allow()
+    # Only one call probes the dependency while the trial is out
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
+
+def test_a_failed_trial_starts_another_cool_down(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    for _ in range(3):
+        breaker.record_failure()
+
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open
+    clock.now += 9
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+def test_a_trial_that_never_reports_back_does_not_keep_the_breaker_open(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    for _ in range(3):
+        breaker.record_failure()
+
+    clock.now += 10
+    assert breaker.allow()
+    # The trial's caller went away without a verdict
+    clock.now += 9
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+class HangingRedis:
+    async def ping(self):
+        await asyncio.sleep(10)
+
+def test_a_cancelled_trial_call_frees_the_trial(monkeypatch):
+    _, clock = make_breaker(monkeypatch)
+    client = RedisClient()
+    client.breaker = CircuitBreaker('redis', failure_threshold=1, reset_seconds=10.0)
+    client.breaker.record_failure()
+    client.client = HangingRedis()
+    clock.now += 10
+
+    async def main():
+        try:
+            await asyncio.wait_for(client.ping(), 0.01)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(main())
+    assert client.breaker.is_open
+    assert [client.breaker.allow() for _ in range(3)] == [True, False, False]
+
+class DownRedis:
+    def __init__(self):
+        self.calls = 0
+
+    async def ping(self):
+        self.calls += 1
+        raise ConnectionError('connection refused')
+
+    async def mget(self, keys):
+        self.calls += 1
+        raise ConnectionError('connection refused')
+
+def test_redis_health_and_stats_calls_go_through_the_breaker():
+    client = RedisClient()
+    client.breaker = CircuitBreaker('redis', failure_threshold=2, reset_seconds=10.0)
+    client.client = DownRedis()
+
+    async def main():
+        return [await client.ping(), await client.get_api_stats(), await client.ping(), await client.get_api_stats()]
+
+    assert asyncio.run(main()) == [False, None, False, None]
+    # The second failure opened the breaker, so the last two calls never reached Redis
+    assert client.client.calls == 2
+    assert client.breaker.is_open
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from services.codecs import CODECS, CacheSerializer, Codec, ValuationStructCodec, stamp, unstamp
+
+VALUATION = {
+    'property_id': 'P-1001',
+    'predicted_value': 20773863.23,
+    'confidence_interval': {'lower': 13890222.7, 'upper': 24645923.8, 'confidence_level': 95.0, 'uncertainty_percentage': 25.9},
+    'price_per_sqft': 1038.69,
+    'valuation_date': '2026-10-17T18:53:32.364254',
+    'model_version': 'v20261017185102',
+    'processing_time_ms': 7.28,
+    'cached': False,
+    'explanation': {'method': 'saabas', 'base_value': 1.5e7, 'feature_contributions': {'cap_rate': 4245077.0}},
+}
+
+def available_codecs():
+    names = ['json', 'struct']
+    try:
+        import msgpack  # noqa: F401
+        names.append('msgpack')
+    except ImportError:
+        pass
+    return names
+
+@pytest.mark.parametrize('codec', available_codecs())
+@pytest.mark.parametrize('compress_threshold', [0, 64])
+@pytest.mark.parametrize('value', [
+    VALUATION,
+    {**VALUATION, 'property_id': None, 'processing_time_ms': None, 'cached': True, 'explanation': None},
+    {**VALUATION, 'confidence_interval': {**VALUATION['confidence_interval'], 'method': 'quantile'}},
+])
+def test_valuations_round_trip(codec, compress_threshold, value):
+    serializer = CacheSerializer(codec, compress_threshold=compress_threshold)
+    assert serializer.loads(serializer.dumps(value)) == value
+
+def test_entries_stay_readable_after_the_codec_changes():
+    written = CacheSerializer('struct').dumps(VALUATION)
+    assert CacheSerializer('json').loads(written) == VALUATION
+    # Untagged JSON from before values were tagged
+    assert CacheSerializer('struct').loads(json.dumps(VALUATION).encode()) == VALUATION
+
+@pytest.mark.parametrize('length', [ValuationStructCodec.NONE_STRING - 1, ValuationStructCodec.NONE_STRING, 70000])
+def test_strings_too_long_for_the_struct_layout_fall_back_to_json(length):
+    value = {**VALUATION, 'property_id': 'x' * length}
+    data = CacheSerializer('struct', compress_threshold=0).dumps(value)
+    expected_tag = ValuationStructCodec.tag if length < ValuationStructCodec.NONE_STRING else CODECS['json'].tag
+    assert data[:1] == expected_tag
+    assert CacheSerializer('struct').loads(data) == value
+
+def test_values_outside_the_struct_layout_fall_back_to_json():
+    serializer = CacheSerializer('struct')
+    for value in ({'api_calls': 3}, [1, 2, 3], {**VALUATION, 'predicted_value': 'n/a'}):
+        data = serializer.dumps(value)
+        assert data[:1] == CODECS['json'].tag
+        assert serializer.loads(data) == value
+
+def test_codec_is_abstract():
+    with pytest.raises(TypeError):
+        Codec()
+
+def test_freshness_stamp_round_trips():
+    data = CacheSerializer('struct').dumps(VALUATION)
+    assert unstamp(stamp(data, 1790000000.5, 0.012)) == (data, 1790000000.5, 0.012)
+    assert unstamp(data) == (data, None, 0.0)
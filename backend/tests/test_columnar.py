@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pytest
+
+from api.valuations import PropertyValuationRequest
+from services.columnar import ColumnarError, column_specs, decode_columns, validate_columns
+
+SPECS = column_specs(PropertyValuationRequest)
+
+def columns(**overrides):
+    base = {
+        'property_type': ['Office', 'Retail'],
+        'city': ['Austin', 'Dallas'],
+        'square_feet': [52000, 1800],
+        'occupancy_rate': [0.93, 0.8],
+        'annual_revenue': [2e6, 1.5e5],
+        'annual_expenses': [8e5, 6e4],
+        'net_operating_income': [1.2e6, 9e4],
+        'cap_rate': [0.061, 0.07],
+    }
+    base.update(overrides)
+    return base
+
+def test_valid_columns_become_float_arrays_with_defaults():
+    validated, n_rows = validate_columns(columns(), SPECS, max_rows=100)
+    assert n_rows == 2
+    np.testing.assert_array_equal(validated['square_feet'], [52000.0, 1800.0])
+    np.testing.assert_array_equal(validated['building_age'], [10.0, 10.0])
+    assert validated['city'].tolist() == ['Austin', 'Dallas']
+
+@pytest.mark.parametrize('value', [52000, 'Austin', None, {'rows': [1, 2]}])
+def test_a_non_list_column_is_a_validation_error(value):
+    body = json.dumps({'columns': columns(square_feet=value)}).encode()
+    with pytest.raises(ColumnarError) as raised:
+        validate_columns(decode_columns(body, 'json'), SPECS, max_rows=100)
+    assert raised.value.status_code == 422
+    assert raised.value.errors == [{'column': 'square_feet', 'error': 'not a list'}]
+
+def test_nested_lists_are_not_numbers():
+    with pytest.raises(ColumnarError) as raised:
+        validate_columns(columns(square_feet=[[52000], [1800]]), SPECS, max_rows=100)
+    assert raised.value.errors == [{'column': 'square_feet', 'error': 'values must be numbers'}]
+
+def test_failing_rows_are_reported_per_constraint():
+    with pytest.raises(ColumnarError) as raised:
+        validate_columns(columns(square_feet=[52000, 10], cap_rate=[None, 0.07]), SPECS, max_rows=100)
+    assert [(error['column'], error['constraint'], error['rows']) for error in raised.value.errors] == [
+        ('square_feet', '>= 100', [1]),
+        ('cap_rate', 'required', [0]),
+    ]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from services.feature_plan import FeaturePlan
+
+FEATURES = ['square_feet', 'building_age', 'occupancy_rate', 'expenses', 'cap_rate']
+
+@pytest.fixture
+def plan():
+    return FeaturePlan(FEATURES)
+
+def key(plan, property_data, digits=6):
+    return plan.cache_keys(plan.matrix([property_data]), digits)[0]
+
+BASE = {'square_feet': 52000, 'building_age': 12, 'occupancy_rate': 0.93, 'annual_expenses': 410000.0, 'cap_rate': 0.061}
+
+def test_matrix_reads_sources_and_fills_defaults(plan):
+    matrix = plan.matrix([BASE, {'square_feet': 1000, 'building_age': None, 'cap_rate': float('nan')}])
+    np.testing.assert_array_equal(matrix[0], [52000, 12, 0.93, 410000.0, 0.061])
+    # building_age has a default of 10; fields without one fall back to 0
+    np.testing.assert_array_equal(matrix[1], [1000, 10, 0, 0, 0])
+
+def test_columns_and_rows_build_the_same_matrix(plan):
+    rows = [BASE, {'square_feet': 800.5, 'occupancy_rate': None}]
+    columns = {'square_feet': [52000, 800.5], 'building_age': [12, np.nan], 'occupancy_rate': [0.93, np.nan],
+               'annual_expenses': [410000.0, np.nan], 'cap_rate': [0.061, np.nan]}
+    np.testing.assert_array_equal(plan.from_columns(columns), plan.matrix(rows))
+
+def test_fields_the_models_never_see_do_not_change_the_key(plan):
+    assert key(plan, BASE) == key(plan, {**BASE, 'property_id': 'P-1', 'address': '1 Main St', 'city': 'Austin'})
+
+def test_missing_none_and_the_default_share_a_key(plan):
+    without_age = {k: v for k, v in BASE.items() if k != 'building_age'}
+    assert key(plan, without_age) == key(plan, {**BASE, 'building_age': None}) == key(plan, {**BASE, 'building_age': 10})
+
+def test_differences_below_the_precision_share_a_key(plan):
+    assert key(plan, BASE) == key(plan, {**BASE, 'square_feet': 52000.0001, 'cap_rate': 0.0610000004})
+    assert key(plan, BASE) != key(plan, {**BASE, 'square_feet': 52001})
+    assert key(plan, BASE) != key(plan, {**BASE, 'cap_rate': 0.06101})
+
+def test_fewer_digits_coarsen_the_key(plan):
+    assert key(plan, BASE, 3) == key(plan, {**BASE, 'square_feet': 52040}, 3)
+    assert key(plan, BASE, 6) != key(plan, {**BASE, 'square_feet': 52040}, 6)
+
+def test_rounding_up_to_the_next_power_of_ten_shares_a_key(plan):
+    assert key(plan, {**BASE, 'square_feet': 9999.9999}) == key(plan, {**BASE, 'square_feet': 10000})
+    assert key(plan, {**BASE, 'cap_rate': -0.099999999}) == key(plan, {**BASE, 'cap_rate': -0.1})
+
+def test_sign_and_zero_are_distinguished(plan):
+    keys = {key(plan, {**BASE, 'cap_rate': value}) for value in (0.0, 0.061, -0.061, 1e-12)}
+    assert len(keys) == 4
+
+def test_keys_are_computed_per_row(plan):
+    rows = [BASE, {**BASE, 'square_feet': 60000}, BASE]
+    keys = plan.cache_keys(plan.matrix(rows))
+    assert keys[0] == keys[2] != keys[1]
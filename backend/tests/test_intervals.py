@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from services.ml_service import MLService, WARMUP_PROPERTY
+from services.model_registry import ModelRegistry
+
+ML_PIPELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ml-pipeline')
+sys.path.insert(0, ML_PIPELINE)
+
+from export_bundle import export_bundle
+
+SHIPPED_MODELS = os.path.join(ML_PIPELINE, 'models')
+
+def link_shipped_models(tmp_path, skip=()):
+    for name in os.listdir(SHIPPED_MODELS):
+        if os.path.isfile(os.path.join(SHIPPED_MODELS, name)) and name not in skip:
+            os.symlink(os.path.join(SHIPPED_MODELS, name), tmp_path / name)
+
+def shipped_service(tmp_path) -> MLService:
+    """An MLService serving the committed models, exported into a bundle of its own"""
+    link_shipped_models(tmp_path)
+    export_bundle(str(tmp_path), 'v-test')
+    service = MLService()
+    service.models_path = str(tmp_path)
+    service.registry = ModelRegistry(str(tmp_path / 'registry'))
+    return service
+
+def test_shipped_intervals_bracket_the_ensemble_prediction(tmp_path):
+    service = shipped_service(tmp_path)
+    models = service._load_models_sync()
+    assert models.version == 'v-test' and models.nn_model is not None
+
+    # The warm-up property, where the neural network pulls the ensemble above the trees' upper quantile
+    rng = np.random.default_rng(0)
+    properties = [WARMUP_PROPERTY] + [
+        {**WARMUP_PROPERTY, 'square_feet': float(sqft), 'occupancy_rate': float(occupancy)}
+        for sqft, occupancy in zip(rng.uniform(5000, 200000, 50), rng.uniform(0.6, 1.0, 50))
+    ]
+    for result in service._predict_batch_sync(properties, models):
+        interval = result['confidence_interval']
+        assert interval['lower'] < result['predicted_value'] < interval['upper']
+
+def test_export_refuses_quantile_models_without_a_calibrated_margin(tmp_path):
+    link_shipped_models(tmp_path, skip={'model_metadata.json'})
+    with open(os.path.join(SHIPPED_MODELS, 'model_metadata.json')) as f:
+        metadata = json.load(f)
+    del metadata['quantiles']['margin']
+    with open(tmp_path / 'model_metadata.json', 'w') as f:
+        json.dump(metadata, f)
+
+    with pytest.raises(ValueError, match='calibrated margin'):
+        export_bundle(str(tmp_path), 'v-test')
+    assert not os.path.exists(tmp_path / 'registry' / 'v-test')
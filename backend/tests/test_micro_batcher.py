@@ -0,0 +1,93 @@
+import asyncio
+import random
+
+import pytest
+
+from services.micro_batcher import MicroBatcher
+
+def make_batcher(window_ms=2, max_batch_size=8, fail=False):
+    batches = []
+
+    async def predict_batch(properties, explain):
+        batches.append(len(properties))
+        await asyncio.sleep(0)
+        if fail:
+            raise RuntimeError("model failed")
+        return [
+            {'predicted_value': p['x'] * 2, **({'explanation': {'x': p['x']}} if flag else {})}
+            for p, flag in zip(properties, explain)
+        ]
+
+    return MicroBatcher(predict_batch, window_ms=window_ms, max_batch_size=max_batch_size), batches
+
+def test_concurrent_requests_share_batches():
+    async def main():
+        batcher, batches = make_batcher()
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit({'x': i}) for i in range(50)))
+        await batcher.stop()
+        return results, batches
+
+    results, batches = asyncio.run(main())
+    assert [r['predicted_value'] for r in results] == [i * 2 for i in range(50)]
+    assert max(batches) <= 8
+    assert len(batches) < 50
+
+def test_no_request_is_lost_when_arrivals_straddle_the_window():
+    async def main():
+        batcher, _ = make_batcher(window_ms=1, max_batch_size=4)
+        batcher.start()
+        rng = random.Random(7)
+
+        async def late_submit(i):
+            # Land right around the end of collection windows
+            await asyncio.sleep(rng.uniform(0, 0.004))
+            return await batcher.submit({'x': i})
+
+        results = await asyncio.wait_for(asyncio.gather(*(late_submit(i) for i in range(400))), timeout=10)
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(main())
+    assert [r['predicted_value'] for r in results] == [i * 2 for i in range(400)]
+
+def test_only_requests_that_ask_are_explained():
+    async def main():
+        batcher, batches = make_batcher()
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit({'x': i}, explain=i % 3 == 0) for i in range(8)))
+        await batcher.stop()
+        return results, batches
+
+    results, batches = asyncio.run(main())
+    assert batches == [8]
+    assert [i for i, result in enumerate(results) if 'explanation' in result] == [0, 3, 6]
+
+def test_batch_failure_reaches_every_request():
+    async def main():
+        batcher, _ = make_batcher(fail=True)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit({'x': i}) for i in range(5)), return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+
+def test_unstarted_batcher_predicts_directly():
+    batcher, batches = make_batcher()
+    assert asyncio.run(batcher.submit({'x': 3})) == {'predicted_value': 6}
+    assert batches == [1]
+
+def test_stop_fails_requests_still_queued():
+    async def main():
+        batcher, _ = make_batcher(window_ms=50)
+        batcher.start()
+        # Queued behind a collector that is stopped before dispatching
+        batcher._collector.cancel()
+        pending = asyncio.ensure_future(batcher.submit({'x': 1}))
+        await asyncio.sleep(0)
+        await batcher.stop()
+        with pytest.raises(RuntimeError):
+            await pending
+
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+import lightgbm as lgb
+import numpy as np
+import xgboost as xgb
+
+from services.model_bundle import load_bundle, write_bundle
+from services.tree_engine import FlatTreeEnsemble, StackedTrees
+
+def trained_trees():
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(300, 4))
+    target = features[:, 0] * 2 + np.abs(features[:, 1])
+    return {
+        'xgboost': FlatTreeEnsemble.from_xgboost(xgb.XGBRegressor(n_estimators=10, max_depth=3).fit(features, target)),
+        'lightgbm': FlatTreeEnsemble.from_lightgbm(lgb.LGBMRegressor(n_estimators=10, verbose=-1).fit(features, target)),
+        'lightgbm_upper': FlatTreeEnsemble.from_lightgbm(
+            lgb.LGBMRegressor(objective='quantile', alpha=0.9, n_estimators=10, verbose=-1).fit(features, target)
+        ),
+    }
+
+def memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+def test_stacked_forests_are_served_from_the_mapped_bundle(tmp_path):
+    trees = trained_trees()
+    bundle = load_bundle(write_bundle(str(tmp_path / 'v1'), ['a', 'b', 'c', 'd'], trees=trees))
+    assert sorted(bundle.forests) == ['float32', 'float64']
+
+    weights = {'xgboost': 0.5, 'lightgbm': 0.5}
+    mapped = StackedTrees(bundle.trees, weights, bundle.forests)
+    in_memory = StackedTrees(trees, weights)
+
+    for _, (forest, _, _), _ in mapped.groups:
+        for key in FlatTreeEnsemble.ARRAYS:
+            assert memory_mapped(getattr(forest, key)), key
+
+    features = np.random.default_rng(1).normal(size=(64, 4))
+    expected, expected_contributions = in_memory.predict_with_contributions(features)
+    actual, contributions = mapped.predict_with_contributions(features)
+    for name in trees:
+        np.testing.assert_array_equal(actual[name], expected[name])
+    np.testing.assert_allclose(contributions, expected_contributions)
+
+def test_forests_that_do_not_match_the_members_are_rebuilt(tmp_path):
+    trees = trained_trees()
+    bundle = load_bundle(write_bundle(str(tmp_path / 'v1'), ['a', 'b', 'c', 'd'], trees=trees))
+    members = {name: engine for name, engine in bundle.trees.items() if name != 'lightgbm_upper'}
+
+    stacked = StackedTrees(members, forests=bundle.forests)
+
+    lightgbm_group = next(group for group in stacked.groups if 'lightgbm' in group[0])
+    assert not memory_mapped(lightgbm_group[1][0].feature)
+    features = np.random.default_rng(1).normal(size=(16, 4))
+    np.testing.assert_allclose(stacked.predict(features)['lightgbm'], trees['lightgbm'].predict(features), rtol=1e-12)
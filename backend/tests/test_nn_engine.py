@@ -0,0 +1,101 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services.nn_engine import NumpyMLP, load_input_scaling
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ml-pipeline'))
+
+from export_nn_weights import save_layer_specs
+
+rng = np.random.default_rng(0)
+
+def dense(n_in, n_out, activation='linear'):
+    return {'type': 'dense', 'kernel': rng.normal(size=(n_in, n_out)), 'bias': rng.normal(size=n_out), 'activation': activation}
+
+def batch_norm(n):
+    return {
+        'type': 'batch_normalization',
+        'epsilon': 1e-3,
+        'gamma': rng.uniform(0.5, 2.0, n),
+        'beta': rng.normal(size=n),
+        'moving_mean': rng.normal(size=n),
+        'moving_variance': rng.uniform(0.1, 3.0, n)
+    }
+
+def reference_forward(specs, features, mean=None, scale=None):
+    """Layer-by-layer forward pass, the way Keras runs it at inference time"""
+    output = features if mean is None else (features - mean) / scale
+    for spec in specs:
+        if spec['type'] == 'dense':
+            output = output @ spec['kernel'] + spec['bias']
+            activation = spec['activation']
+        elif spec['type'] == 'batch_normalization':
+            output = (output - spec['moving_mean']) / np.sqrt(spec['moving_variance'] + spec['epsilon']) * spec['gamma'] + spec['beta']
+            activation = 'linear'
+        else:
+            activation = spec['activation']
+        if activation == 'relu':
+            output = np.maximum(output, 0)
+        elif activation == 'tanh':
+            output = np.tanh(output)
+        elif activation == 'sigmoid':
+            output = 1 / (1 + np.exp(-output))
+    return output[:, 0]
+
+ARCHITECTURES = {
+    # Shape of the shipped model: BatchNorm after each ReLU dense layer
+    'bn_after_activation': lambda: [dense(6, 16, 'relu'), batch_norm(16), dense(16, 8, 'relu'), batch_norm(8), dense(8, 1)],
+    'bn_before_activation': lambda: [dense(6, 16), batch_norm(16), {'type': 'activation', 'activation': 'relu'}, dense(16, 1)],
+    'leading_and_trailing_bn': lambda: [batch_norm(6), dense(6, 4, 'tanh'), dense(4, 1), batch_norm(1)],
+    'stacked_bn': lambda: [dense(6, 5, 'sigmoid'), batch_norm(5), batch_norm(5), dense(5, 1)],
+}
+
+@pytest.mark.parametrize('name', sorted(ARCHITECTURES))
+@pytest.mark.parametrize('scaled', [False, True])
+def test_folded_network_matches_layer_by_layer_forward_pass(name, scaled):
+    specs = ARCHITECTURES[name]()
+    features = rng.normal(loc=3.0, scale=5.0, size=(64, 6))
+    mean, scale = (features.mean(axis=0), features.std(axis=0)) if scaled else (None, None)
+
+    model = NumpyMLP.from_layer_specs(specs, mean, scale)
+
+    np.testing.assert_allclose(model.predict(features), reference_forward(specs, features, mean, scale), rtol=1e-9, atol=1e-9)
+
+def test_folding_leaves_only_dense_layers():
+    model = NumpyMLP.from_layer_specs(ARCHITECTURES['bn_after_activation']())
+    assert [kernel.shape for kernel, _, _ in model.layers] == [(6, 16), (16, 8), (8, 1)]
+
+def test_exported_archive_round_trips(tmp_path):
+    specs = ARCHITECTURES['bn_after_activation']()
+    path = str(tmp_path / 'weights.npz')
+    save_layer_specs(specs, path)
+
+    features = rng.normal(size=(10, 6))
+    np.testing.assert_allclose(NumpyMLP.load(path).predict(features), reference_forward(specs, features), rtol=1e-9)
+    assert load_input_scaling(path) is None
+
+def test_exported_archive_records_its_scaler(tmp_path):
+    specs = ARCHITECTURES['bn_before_activation']()
+    scaler = SimpleNamespace(mean_=rng.normal(size=6), scale_=rng.uniform(0.5, 2.0, 6))
+    path = str(tmp_path / 'weights.npz')
+    save_layer_specs(specs, path, scaler)
+
+    mean, scale = load_input_scaling(path)
+    np.testing.assert_array_equal(mean, scaler.mean_)
+    np.testing.assert_array_equal(scale, scaler.scale_)
+    features = rng.normal(size=(10, 6))
+    np.testing.assert_allclose(
+        NumpyMLP.load(path, mean, scale).predict(features),
+        reference_forward(specs, features, scaler.mean_, scaler.scale_),
+        rtol=1e-9
+    )
+
+def test_unsupported_layers_are_rejected():
+    with pytest.raises(ValueError):
+        NumpyMLP.from_layer_specs([{'type': 'dropout'}])
+    with pytest.raises(ValueError):
+        NumpyMLP.from_layer_specs([dense(3, 1, 'softplus')])
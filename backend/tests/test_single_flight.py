@@ -0,0 +1,78 @@
+import asyncio
+
+import fakeredis
+
+from services.redis_client import RedisClient
+from services.single_flight import SingleFlight
+
+KEY = 'v1:abc'
+
+def valuation(explanation=None):
+    return {
+        'predicted_value': 1.0,
+        'confidence_interval': {'lower': 0.5, 'upper': 2.0, 'confidence_level': 95.0, 'uncertainty_percentage': 10.0},
+        'price_per_sqft': 1.0,
+        'valuation_date': '2026-01-01T00:00:00',
+        'model_version': 'v1',
+        'processing_time_ms': None,
+        'cached': False,
+        'property_id': None,
+        'explanation': explanation
+    }
+
+EXPLANATION = {'feature_contributions': {'square_feet': 0.5}, 'base_value': 0.5, 'tree_predicted_value': 1.0}
+
+def computer(calls, explanation=None, delay=0.05):
+    async def compute():
+        calls.append(explanation is not None)
+        await asyncio.sleep(delay)
+        return valuation(explanation)
+    return compute
+
+async def worker(server):
+    client = RedisClient()
+    client.client = client.pubsub_client = fakeredis.FakeAsyncRedis(server=server)
+    client.pubsub_task = asyncio.create_task(client._listen())
+    return client, SingleFlight(client, lock_ttl_ms=1000)
+
+def test_an_explained_request_does_not_take_a_shared_result_without_an_explanation():
+    async def main():
+        server = fakeredis.FakeServer()
+        (first, first_flights), (second, second_flights) = await worker(server), await worker(server)
+        await asyncio.sleep(0.01)
+        calls = []
+
+        # Same worker and across workers, a leader computing without an explanation is not enough
+        results = await asyncio.gather(
+            first_flights.run(KEY, computer(calls)),
+            first_flights.run(KEY, computer(calls, EXPLANATION), explained=True),
+            second_flights.run(KEY, computer(calls, EXPLANATION), explained=True),
+            first_flights.run(KEY, computer(calls))
+        )
+
+        assert results[0] == (valuation(), False)
+        assert results[1][0]['explanation'] == EXPLANATION
+        assert results[2][0]['explanation'] == EXPLANATION
+        assert results[3] == (valuation(), True)
+        assert calls.count(False) == 1
+        await first.close()
+        await second.close()
+
+    asyncio.run(main())
+
+def test_a_waiter_does_not_take_an_entry_that_is_due_for_a_refresh():
+    async def main():
+        server = fakeredis.FakeServer()
+        client, _ = await worker(server)
+        await asyncio.sleep(0.01)
+
+        # Past its TTL but inside the grace period: what a refresh in flight is about to replace
+        await client.cache_valuation(KEY, valuation(), ttl=-1)
+        assert await client.wait_for_valuation(KEY, 0.05) is None
+
+        await client.cache_valuation(KEY, valuation(), ttl=3600)
+        assert await client.wait_for_valuation(KEY, 0.05) == valuation()
+        assert await client.wait_for_valuation(KEY, 0.05, explained=True) is None
+        await client.close()
+
+    asyncio.run(main())
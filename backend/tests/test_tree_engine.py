@@ -0,0 +1,82 @@
+import lightgbm as lgb
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from services.tree_engine import FlatTreeEnsemble, StackedTrees, check_parity
+
+def training_data(seed=0, n_rows=400, n_features=5, missing=0.1):
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(n_rows, n_features))
+    target = 3 * features[:, 0] - 2 * features[:, 1] ** 2 + np.sin(features[:, 2]) + rng.normal(scale=0.1, size=n_rows)
+    features[rng.random(features.shape) < missing] = np.nan
+    return features, target
+
+def probe_rows(engine, seed=1):
+    """Split-boundary rows, plus random rows with NaNs, zeros and values LightGBM rounds to zero"""
+    rng = np.random.default_rng(seed)
+    random_rows = rng.normal(size=(200, engine.n_features))
+    random_rows[rng.random(random_rows.shape) < 0.15] = np.nan
+    random_rows[rng.random(random_rows.shape) < 0.1] = 0.0
+    random_rows[rng.random(random_rows.shape) < 0.05] = rng.choice([-1e-36, 1e-36, -1e-35, 1e-35])
+    return np.vstack([engine.parity_sample(), random_rows])
+
+def assert_parity(engine, native_predict):
+    rows = probe_rows(engine)
+    np.testing.assert_allclose(engine.predict(rows), native_predict(rows), rtol=1e-5, atol=1e-5)
+
+def test_xgboost_flattening_matches_native_predict():
+    features, target = training_data()
+    model = xgb.XGBRegressor(n_estimators=30, max_depth=4, learning_rate=0.3, base_score=0.5)
+    model.fit(features, target)
+
+    assert_parity(FlatTreeEnsemble.from_xgboost(model), model.predict)
+
+def test_xgboost_flattening_stops_at_best_iteration():
+    features, target = training_data()
+    model = xgb.XGBRegressor(n_estimators=200, max_depth=3, learning_rate=0.5, early_stopping_rounds=3)
+    model.fit(features[:300], target[:300], eval_set=[(features[300:], target[300:])], verbose=False)
+    assert model.best_iteration < 199
+
+    engine = FlatTreeEnsemble.from_xgboost(model)
+    assert engine.n_trees == model.best_iteration + 1
+    assert_parity(engine, model.predict)
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'use_missing': False},
+    {'zero_as_missing': True},
+])
+def test_lightgbm_flattening_matches_native_predict(params):
+    features, target = training_data()
+    model = lgb.LGBMRegressor(n_estimators=30, num_leaves=15, min_child_samples=5, verbose=-1, **params)
+    model.fit(features, target)
+
+    assert_parity(FlatTreeEnsemble.from_lightgbm(model), model.predict)
+
+def test_check_parity_rejects_a_diverging_engine():
+    features, target = training_data()
+    model = lgb.LGBMRegressor(n_estimators=10, verbose=-1).fit(features, target)
+    engine = FlatTreeEnsemble.from_lightgbm(model)
+
+    assert check_parity(engine, model.predict) <= 1e-5
+    engine.value = engine.value + 1.0
+    with pytest.raises(ValueError):
+        check_parity(engine, model.predict)
+
+def test_stacked_contributions_for_selected_rows_match_the_full_batch():
+    features, target = training_data()
+    stacked = StackedTrees({
+        'xgboost': FlatTreeEnsemble.from_xgboost(xgb.XGBRegressor(n_estimators=10, max_depth=3).fit(features, target)),
+        'lightgbm': FlatTreeEnsemble.from_lightgbm(lgb.LGBMRegressor(n_estimators=10, verbose=-1).fit(features, target)),
+    }, {'xgboost': 0.5, 'lightgbm': 0.5})
+    rows = features[:40]
+
+    outputs, everything = stacked.predict_with_contributions(rows)
+    selected_outputs, selected = stacked.predict_with_contributions(rows, rows=np.array([3, 17, 39]))
+    _, none = stacked.predict_with_contributions(rows, rows=np.array([], dtype=np.intp))
+
+    np.testing.assert_array_equal(selected, everything[[3, 17, 39]])
+    assert none.shape == (0, features.shape[1])
+    for name in outputs:
+        np.testing.assert_array_equal(selected_outputs[name], outputs[name])
@@ -0,0 +1,80 @@
+import asyncio
+import uuid
+
+import lightgbm as lgb
+import numpy as np
+import xgboost as xgb
+
+from api.valuations import explain_valuations
+from services.database import Property, Valuation
+from services.ml_service import MODEL_WEIGHTS
+from services.tree_engine import FlatTreeEnsemble
+from services.tree_explainer import EnsembleExplainer
+
+FEATURES = ['a', 'b', 'c', 'd']
+
+def fitted_pair(seed=0, n_rows=300):
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(n_rows, len(FEATURES)))
+    target = 3 * features[:, 0] - 2 * features[:, 1] ** 2 + np.sin(features[:, 2]) + rng.normal(scale=0.1, size=n_rows)
+    xgb_model = xgb.XGBRegressor(n_estimators=20, max_depth=3, learning_rate=0.3).fit(features, target)
+    lgb_model = lgb.LGBMRegressor(n_estimators=20, num_leaves=8, min_child_samples=5, verbose=-1).fit(features, target)
+    return features, xgb_model, lgb_model
+
+def test_contributions_add_up_to_the_weighted_tree_prediction():
+    features, xgb_model, lgb_model = fitted_pair()
+    explainer = EnsembleExplainer(
+        {'xgboost': FlatTreeEnsemble.from_xgboost(xgb_model), 'lightgbm': FlatTreeEnsemble.from_lightgbm(lgb_model)},
+        MODEL_WEIGHTS,
+        FEATURES
+    )
+
+    tree_weight = MODEL_WEIGHTS['xgboost'] + MODEL_WEIGHTS['lightgbm']
+    expected = (MODEL_WEIGHTS['xgboost'] * xgb_model.predict(features) + MODEL_WEIGHTS['lightgbm'] * lgb_model.predict(features)) / tree_weight
+    values = explainer.shap_values(features)
+    np.testing.assert_allclose(explainer.expected_value + values.sum(axis=1), expected, rtol=1e-5, atol=1e-5)
+
+    explanation = explainer.explain(features[:1])[0]
+    assert explanation['tree_predicted_value'] == explainer.expected_value + float(values[0].sum())
+    assert list(explanation['feature_contributions']) == [FEATURES[i] for i in np.argsort(-np.abs(values[0]), kind='stable')]
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+        self.commits = 0
+
+    async def execute(self, statement):
+        return FakeResult(self.rows)
+
+    async def commit(self):
+        self.commits += 1
+
+class FakeMLService:
+    def __init__(self):
+        self.explained = []
+
+    async def explain_batch(self, properties):
+        self.explained.append([p['property_id'] for p in properties])
+        return [{'base_value': 1.0, 'tree_predicted_value': 2.0, 'feature_contributions': {'a': 1.0}} for _ in properties]
+
+def test_explanations_are_stored_once_and_served_from_storage_afterwards():
+    valuation = Valuation(id=uuid.uuid4(), property_id='P1', predicted_value=2.5)
+    property_row = Property(property_id='P1', property_type='Office', city='Austin', state='TX', square_feet=1000)
+    db, ml_service = FakeSession([(valuation, property_row)]), FakeMLService()
+    valuation_id = str(valuation.id)
+
+    first = asyncio.run(explain_valuations(db, ml_service, [valuation_id]))
+    second = asyncio.run(explain_valuations(db, ml_service, [valuation_id]))
+
+    assert ml_service.explained == [['P1']]
+    assert db.commits == 1
+    assert valuation.shap_values == first[valuation_id]['explanation']
+    assert second == first
+    assert second[valuation_id]['predicted_value'] == 2.5
@@ -0,0 +1,175 @@
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+
+from services.valuation_jobs import JOB_QUEUE, JOB_RUNNING, ValuationJobs
+
+class RunnerCrashed(BaseException):
+    """Stands in for the process dying mid-job: nothing in the runner catches it"""
+
+class FakeModels:
+    model_version = 'test'
+
+    def __init__(self, crash_on_call=None, during_call=None, during=None):
+        self.calls = []
+        self.crash_on_call = crash_on_call
+        # Awaited while valuing call number during_call, for whatever happens to the job meanwhile
+        self.during_call = during_call
+        self.during = during
+
+    async def batch_predict(self, properties):
+        self.calls.append([p['property_id'] for p in properties])
+        if len(self.calls) == self.crash_on_call:
+            raise RunnerCrashed()
+        if len(self.calls) == self.during_call:
+            await self.during()
+        return [
+            {'predicted_value': p['square_feet'] * 100.0, 'confidence_interval': {'lower': 0, 'upper': 0}, 'price_per_sqft': 100.0, 'model_version': 'test'}
+            for p in properties
+        ]
+
+def make_jobs(server, runner_id, models):
+    redis = SimpleNamespace(text_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    jobs = ValuationJobs(redis, models, chunk_size=2)
+    jobs.runner_id = runner_id
+    return jobs
+
+PROPERTIES = [{'property_id': f'P{i}', 'square_feet': 1000 + i} for i in range(9)]
+
+def test_a_job_resumes_from_its_first_unfinished_chunk_after_its_runner_dies():
+    async def main():
+        server = fakeredis.FakeServer()
+        first_models, second_models = FakeModels(crash_on_call=3), FakeModels()
+        first = make_jobs(server, 'runner-a', first_models)
+        second = make_jobs(server, 'runner-b', second_models)
+
+        job_id = (await first.submit(PROPERTIES))['job_id']
+        assert await first._claim_next() == job_id
+        try:
+            await first._process(job_id)
+        except RunnerCrashed:
+            pass
+
+        crashed = await first.get(job_id)
+        assert crashed['status'] == 'running'
+        assert crashed['completed_chunks'] == 2
+
+        # While the lease holds nobody else takes the job
+        await second._recover_abandoned()
+        assert await second._claim_next() is None
+
+        await second.client.delete(first._key(job_id, 'lease'))
+        await second._recover_abandoned()
+        assert await second._claim_next() == job_id
+        await second._process(job_id)
+
+        return second_models, await second.get(job_id), await second.results(job_id)
+
+    second_models, job, page = asyncio.run(main())
+
+    # Chunks 0 and 1 finished before the crash and are not valued again
+    assert second_models.calls == [['P4', 'P5'], ['P6', 'P7'], ['P8']]
+    assert job['status'] == 'completed'
+    assert job['completed_chunks'] == 5
+    assert job['successful'] == 9
+    assert job['total_value'] == sum(p['square_feet'] * 100.0 for p in PROPERTIES)
+    assert [row['index'] for row in page['results']] == list(range(9))
+    assert [row['property_id'] for row in page['results']] == [p['property_id'] for p in PROPERTIES]
+
+def test_results_only_expose_finished_chunks():
+    async def main():
+        server = fakeredis.FakeServer()
+        jobs = make_jobs(server, 'runner-a', FakeModels(crash_on_call=2))
+        job_id = (await jobs.submit(PROPERTIES))['job_id']
+        await jobs._claim_next()
+        try:
+            await jobs._process(job_id)
+        except RunnerCrashed:
+            pass
+        return await jobs.results(job_id, offset=1, limit=5), await jobs.client.lrange(JOB_RUNNING, 0, -1), await jobs.client.llen(JOB_QUEUE)
+
+    page, running, queued = asyncio.run(main())
+    assert page['available'] == 2
+    assert [row['index'] for row in page['results']] == [1]
+    assert page['next_offset'] is None
+    assert len(running) == 1 and queued == 0
+
+def test_a_lease_taken_over_by_another_runner_is_not_renewed():
+    async def main():
+        server = fakeredis.FakeServer()
+        first = make_jobs(server, 'runner-a', FakeModels())
+        second = make_jobs(server, 'runner-b', FakeModels())
+        job_id = (await first.submit(PROPERTIES))['job_id']
+        await first._claim_next()
+        lease_key = first._key(job_id, 'lease')
+
+        renewed = await first._renew_lease(job_id)
+        taken_over = await second._renew_lease(job_id)
+        owner_after_takeover = await first.client.get(lease_key)
+        # A lapsed lease can be picked up again by whoever renews first
+        await first.client.delete(lease_key)
+        return renewed, taken_over, owner_after_takeover, await second._renew_lease(job_id), await first.client.ttl(lease_key)
+
+    renewed, taken_over, owner, reclaimed, ttl = asyncio.run(main())
+    assert renewed and not taken_over
+    assert owner == 'runner-a'
+    assert reclaimed and 0 < ttl <= 30
+
+def test_a_runner_that_lost_its_lease_mid_chunk_does_not_count_the_chunk_again():
+    async def main():
+        server = fakeredis.FakeServer()
+        second = make_jobs(server, 'runner-b', FakeModels())
+
+        async def taken_over():
+            # The lease lapses while the chunk is valued; another runner claims the job and finishes it
+            await second.client.delete(second._key(job_id, 'lease'))
+            await second._recover_abandoned()
+            assert await second._claim_next() == job_id
+            await second._process(job_id)
+
+        first = make_jobs(server, 'runner-a', FakeModels(during_call=2, during=taken_over))
+        job_id = (await first.submit(PROPERTIES))['job_id']
+        await first._claim_next()
+        await first._process(job_id)
+        return await first.get(job_id)
+
+    job = asyncio.run(main())
+    assert job['status'] == 'completed'
+    assert job['completed_chunks'] == job['chunks'] == 5
+    assert job['successful'] == 9 and job['failed'] == 0
+    assert job['total_value'] == sum(p['square_feet'] * 100.0 for p in PROPERTIES)
+
+def test_a_cancel_during_the_last_chunk_is_not_overwritten():
+    async def main():
+        server = fakeredis.FakeServer()
+
+        async def cancelled():
+            await jobs.cancel(job_id)
+
+        jobs = make_jobs(server, 'runner-a', FakeModels(during_call=5, during=cancelled))
+        job_id = (await jobs.submit(PROPERTIES))['job_id']
+        await jobs._claim_next()
+        await jobs._process(job_id)
+        return await jobs.get(job_id), await jobs.client.lrange(JOB_RUNNING, 0, -1)
+
+    job, running = asyncio.run(main())
+    assert job['status'] == 'cancelled'
+    assert job['completed_chunks'] == 5
+    assert running == []
+
+def test_a_job_cancelled_before_its_runner_starts_stays_cancelled():
+    async def main():
+        server = fakeredis.FakeServer()
+        models = FakeModels()
+        jobs = make_jobs(server, 'runner-a', models)
+        job_id = (await jobs.submit(PROPERTIES))['job_id']
+        await jobs._claim_next()
+        await jobs.client.hset(jobs._key(job_id), 'status', 'cancelled')
+        # As if the cancel landed after _process read the job as queued
+        assert not await jobs._set_status(job_id, 'running', 'runner', jobs.runner_id)
+        await jobs._process(job_id)
+        return await jobs.get(job_id), models.calls
+
+    job, calls = asyncio.run(main())
+    assert job['status'] == 'cancelled' and calls == []
@@ -0,0 +1,91 @@
+import asyncio
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from services.valuation_writer import ValuationWriter
+
+PROPERTY = {
+    'property_type': 'Office',
+    'city': 'Los Angeles',
+    'state': 'CA',
+    'square_feet': 1000,
+    'occupancy_rate': 0.9,
+    'annual_revenue': 100000.0,
+    'annual_expenses': 40000.0,
+    'net_operating_income': 60000.0,
+    'cap_rate': 0.05
+}
+
+def prediction(value=1000000.0):
+    return {
+        'predicted_value': value,
+        'confidence_interval': {'lower': value * 0.9, 'upper': value * 1.1, 'confidence_level': 95.0},
+        'model_version': 'v1'
+    }
+
+class FakeDatabase:
+    """Stands in for _write: one transaction per call, refusing negative values or everything while down"""
+
+    def __init__(self):
+        self.properties = {}
+        self.valuations = {}
+        self.down = False
+        self.attempts = 0
+
+    async def write(self, properties, valuations):
+        self.attempts += 1
+        if self.down:
+            raise OperationalError('INSERT INTO valuations', {}, ConnectionRefusedError('connection refused'))
+        for valuation in valuations:
+            if valuation['predicted_value'] < 0:
+                raise IntegrityError('INSERT INTO valuations', {}, Exception('violates check constraint'))
+        for row in properties:
+            self.properties.setdefault(row['property_id'], row)
+        for valuation in valuations:
+            self.valuations[valuation['id']] = valuation
+
+def make_writer(database, batch_size=8):
+    writer = ValuationWriter(session_factory=None, batch_size=batch_size, interval_ms=1000)
+    writer._write = database.write
+    return writer
+
+def test_a_poisoned_row_is_dropped_and_the_rest_of_its_batch_written():
+    database = FakeDatabase()
+    writer = make_writer(database)
+    for i in range(8):
+        writer.submit(f'P{i}', prediction(-1.0 if i == 5 else 1000000.0 + i), PROPERTY)
+
+    assert asyncio.run(writer.flush())
+    assert sorted(v['property_id'] for v in database.valuations.values()) == [f'P{i}' for i in range(8) if i != 5]
+    assert writer.valuations == [] and writer.properties == {}
+    # Halving 8 rows down to the bad one, not one write per row
+    assert database.attempts < 8
+
+def test_rows_are_kept_through_a_database_outage_and_written_once_it_is_back():
+    database = FakeDatabase()
+    writer = make_writer(database, batch_size=4)
+    for i in range(6):
+        writer.submit(f'P{i}', prediction(), PROPERTY)
+
+    database.down = True
+    assert not asyncio.run(writer.flush())
+    assert database.valuations == {}
+    assert len(writer.valuations) == 6 and len(writer.properties) == 6
+
+    database.down = False
+    assert asyncio.run(writer.flush())
+    assert sorted(v['property_id'] for v in database.valuations.values()) == [f'P{i}' for i in range(6)]
+    assert writer.valuations == [] and writer.properties == {}
+
+def test_submit_fits_rows_to_their_columns():
+    writer = make_writer(FakeDatabase())
+    writer.submit('P' * 51, prediction(), PROPERTY)
+    assert writer.valuations == []
+
+    writer.submit('P1', prediction(), {**PROPERTY, 'property_class': 'A' * 20})
+    assert writer.properties['P1']['property_class'] == 'A' * 10
+
+    # No row for a property missing a required column; its valuation still goes out in case the property is stored
+    writer.submit('P2', prediction(), {**PROPERTY, 'state': None})
+    assert 'P2' not in writer.properties
+    assert [v['property_id'] for v in writer.valuations] == ['P1', 'P2']
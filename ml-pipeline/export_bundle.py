@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Package trained models into the memory-mapped bundle the backend serves from.
+
+Reads xgboost_model.pkl, lightgbm_model.pkl, the quantile boosters
+(<family>_<lower|upper>.pkl), scaler.pkl, neural_network_weights.npz and
+model_metadata.json from a models directory and writes a new version into the
+model registry, <models>/registry/<version>: a manifest.json plus raw .npy arrays
+for tree nodes, folded NN weights and scaler statistics (format defined in
+backend/services/model_bundle.py). The version is then published through
+registry/CURRENT, and running backends swap to it without a restart.
+
+Usage:
+    python export_bundle.py [models_dir] [version] [--no-publish]
+"""
+
+import json
+import os
+import sys
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from services.model_bundle import write_bundle
+from services.model_registry import ModelRegistry, new_version
+from services.nn_engine import NumpyMLP, load_input_scaling
+from services.tree_engine import FlatTreeEnsemble, check_parity
+from quantile_models import QUANTILE_ALPHAS, QUANTILE_FAMILIES, quantile_model_path
+
+DEFAULT_FEATURES = [
+    'square_feet', 'building_age', 'num_floors', 'occupancy_rate',
+    'walk_score', 'transit_score', 'crime_rate', 'school_rating',
+    'distance_to_downtown', 'annual_revenue', 'expenses', 'cap_rate', 'net_operating_income'
+]
+
+def _flatten(name, model, flatten):
+    """Flatten a booster, refusing to export trees that disagree with the library"""
+    engine = flatten(model)
+    error = check_parity(engine, model.predict)
+    print(f"{name}: {engine.n_trees} trees, depth {engine.max_depth}, parity error {error:.1e}")
+    return engine
+
+def export_bundle(models_dir='models', version=None, publish=True):
+    """Build <models_dir>/registry/<version> from the training artifacts in models_dir"""
+    registry = ModelRegistry(os.path.join(models_dir, 'registry'))
+    version = version or new_version()
+    if version in registry.versions():
+        raise ValueError(f"Model version {version} already exists; registry versions are immutable")
+
+    metadata = {}
+    metadata_path = os.path.join(models_dir, 'model_metadata.json')
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+    feature_names = metadata.get('features')
+    feature_names_path = os.path.join(models_dir, 'feature_names.json')
+    if feature_names is None and os.path.exists(feature_names_path):
+        with open(feature_names_path, 'r') as f:
+            feature_names = json.load(f)
+    feature_names = feature_names or DEFAULT_FEATURES
+
+    trees = {}
+    feature_importance = {}
+
+    xgb_path = os.path.join(models_dir, 'xgboost_model.pkl')
+    if os.path.exists(xgb_path):
+        xgb_model = joblib.load(xgb_path)
+        trees['xgboost'] = _flatten('XGBoost', xgb_model, FlatTreeEnsemble.from_xgboost)
+        feature_importance = {
+            name: float(importance)
+            for name, importance in zip(feature_names, xgb_model.feature_importances_)
+        }
+
+    lgb_path = os.path.join(models_dir, 'lightgbm_model.pkl')
+    if os.path.exists(lgb_path):
+        trees['lightgbm'] = _flatten('LightGBM', joblib.load(lgb_path), FlatTreeEnsemble.from_lightgbm)
+
+    # Interval bounds, stored as '<family>_lower' / '<family>_upper' trees
+    flatteners = {'xgboost': FlatTreeEnsemble.from_xgboost, 'lightgbm': FlatTreeEnsemble.from_lightgbm}
+    quantiles = metadata.get('quantiles') or {}
+    alphas = quantiles.get('alphas', QUANTILE_ALPHAS)
+    for family in QUANTILE_FAMILIES:
+        for bound in alphas:
+            path = quantile_model_path(models_dir, family, bound)
+            if os.path.exists(path):
+                trees[f'{family}_{bound}'] = _flatten(f'{family} {bound} bound', joblib.load(path), flatteners[family])
+    interval = None
+    if any(name.endswith(('_lower', '_upper')) for name in trees):
+        # The conformal margin is part of the interval; bounds shipped without it would claim coverage they do not have
+        if quantiles.get('margin') is None or quantiles.get('coverage') is None:
+            raise ValueError(f"Quantile models in {models_dir} have no calibrated margin and coverage in model_metadata.json; retrain them")
+        interval = {'alphas': alphas, 'margin': quantiles['margin'], 'coverage': quantiles['coverage']}
+
+    scaler = None
+    scaler_path = os.path.join(models_dir, 'scaler.pkl')
+    if os.path.exists(scaler_path):
+        scaler = joblib.load(scaler_path)
+
+    nn_model = None
+    nn_path = os.path.join(models_dir, 'neural_network_weights.npz')
+    if os.path.exists(nn_path) and scaler is not None:
+        scaling = load_input_scaling(nn_path)
+        if scaling is not None and not (np.allclose(scaling[0], scaler.mean_) and np.allclose(scaling[1], scaler.scale_)):
+            raise ValueError(f"{nn_path} was trained with a different scaler than {scaler_path}; retrain or re-export them together")
+        nn_model = NumpyMLP.load(nn_path, input_mean=scaler.mean_, input_scale=scaler.scale_)
+        print(f"Neural network: {len(nn_model.layers)} dense layers")
+
+    bundle_dir = write_bundle(
+        registry.path(version),
+        feature_names=feature_names,
+        trees=trees,
+        nn_model=nn_model,
+        scaler=scaler,
+        feature_importance=feature_importance,
+        metadata={'version': version, 'trained_at': metadata.get('training_date'), 'interval': interval}
+    )
+    if publish:
+        registry.publish(version)
+    return bundle_dir
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    models_dir = args[0] if args else 'models'
+    version = args[1] if len(args) > 1 else None
+    export_bundle(models_dir, version, publish='--no-publish' not in sys.argv)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Export the neural network's Dense/BatchNormalization weights to a NumPy archive.
+
+The backend runs the forward pass with plain NumPy (backend/services/nn_engine.py),
+so TensorFlow is only needed here, at training time.
+
+Usage:
+    python export_nn_weights.py models/neural_network_model.h5 [models/neural_network_weights.npz]
+"""
+
+import json
+import os
+import sys
+import numpy as np
+
+WEIGHT_NAMES = {
+    'dense': ['kernel', 'bias'],
+    'batch_normalization': ['gamma', 'beta', 'moving_mean', 'moving_variance'],
+}
+
+LAYER_TYPES = {
+    'Dense': 'dense',
+    'BatchNormalization': 'batch_normalization',
+    'Activation': 'activation',
+}
+
+# Layers that do nothing at inference time
+SKIPPED_LAYERS = {'InputLayer', 'Dropout', 'GaussianNoise', 'GaussianDropout'}
+
+def _layer_spec(class_name, config, weights):
+    """Describe one layer as {'type', hyperparameters..., weight arrays...}"""
+    if class_name in SKIPPED_LAYERS:
+        return None
+    if class_name not in LAYER_TYPES:
+        raise ValueError(f"Layer {config.get('name')} ({class_name}) cannot be exported")
+
+    layer_type = LAYER_TYPES[class_name]
+    spec = {'type': layer_type}
+
+    if layer_type == 'dense':
+        spec['activation'] = config.get('activation', 'linear')
+        names = ['kernel', 'bias'] if config.get('use_bias', True) else ['kernel']
+    elif layer_type == 'batch_normalization':
+        spec['epsilon'] = config.get('epsilon', 1e-3)
+        names = (['gamma'] if config.get('scale', True) else []) + \
+                (['beta'] if config.get('center', True) else []) + \
+                ['moving_mean', 'moving_variance']
+    else:
+        spec['activation'] = config['activation']
+        names = []
+
+    if len(weights) != len(names):
+        raise ValueError(f"Layer {config.get('name')}: expected {names}, got {len(weights)} arrays")
+    for name, value in zip(names, weights):
+        spec[name] = np.asarray(value, dtype=np.float64)
+    return spec
+
+def keras_layer_specs(model):
+    """Layer specs from a live Keras Sequential model"""
+    specs = []
+    for layer in model.layers:
+        spec = _layer_spec(type(layer).__name__, layer.get_config(), layer.get_weights())
+        if spec is not None:
+            specs.append(spec)
+    return specs
+
+def h5_layer_specs(h5_path):
+    """Layer specs read straight from a Keras .h5 file with h5py, no TensorFlow needed"""
+    import h5py
+
+    with h5py.File(h5_path, 'r') as f:
+        model_config = json.loads(f.attrs['model_config'])
+        weight_groups = f['model_weights']
+
+        specs = []
+        for layer in model_config['config']['layers']:
+            class_name, config = layer['class_name'], layer['config']
+            if class_name in SKIPPED_LAYERS:
+                continue
+
+            arrays = {}
+            if config['name'] in weight_groups:
+                def collect(name, item):
+                    if isinstance(item, h5py.Dataset):
+                        arrays[name.split('/')[-1].split(':')[0]] = item[()]
+                weight_groups[config['name']].visititems(collect)
+
+            names = [n for n in WEIGHT_NAMES.get(LAYER_TYPES.get(class_name), []) if n in arrays]
+            spec = _layer_spec(class_name, config, [arrays[n] for n in names])
+            if spec is not None:
+                specs.append(spec)
+        return specs
+
+def save_layer_specs(specs, output_path, scaler=None):
+    """Write layer specs as one .npz: a JSON layer list plus layer_<i>_<weight> arrays, and the input scaler's statistics if given"""
+    layers = []
+    arrays = {}
+    if scaler is not None:
+        # Lets export_bundle.py check the network ships with the scaler it was trained on
+        arrays['input_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+        arrays['input_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+    for index, spec in enumerate(specs):
+        layers.append({k: v for k, v in spec.items() if not isinstance(v, np.ndarray)})
+        for key, value in spec.items():
+            if isinstance(value, np.ndarray):
+                arrays[f'layer_{index}_{key}'] = value
+
+    np.savez(output_path, layers=np.array(json.dumps(layers)), **arrays)
+    print(f"Neural network weights exported to {output_path} ({len(specs)} layers)")
+
+def export_keras_model(model, output_path, scaler=None):
+    """Export a trained Keras model next to its .h5 file"""
+    save_layer_specs(keras_layer_specs(model), output_path, scaler)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    h5_path = sys.argv[1]
+    output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(h5_path), 'neural_network_weights.npz')
+    save_layer_specs(h5_layer_specs(h5_path), output_path)
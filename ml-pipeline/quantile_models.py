@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Quantile boosters for valuation confidence intervals.
+
+Trains LightGBM (objective='quantile') and XGBoost (objective='reg:quantileerror')
+models for the lower and upper interval bounds and saves them next to the point
+models as <family>_<bound>.pkl. export_bundle.py flattens them into the serving
+bundle, where they are evaluated in the same forest traversal as the point models.
+
+Raw quantile boosters under-cover, so the interval is conformalized (split-conformal
+quantile regression) on a calibration holdout: the served bounds are widened by
+margin * (upper - lower) on each side, with the margin chosen so the holdout reaches
+the nominal coverage.
+"""
+
+import os
+import joblib
+import lightgbm as lgb
+import numpy as np
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+
+# 95% interval
+QUANTILE_ALPHAS = {'lower': 0.025, 'upper': 0.975}
+
+QUANTILE_FAMILIES = ('xgboost', 'lightgbm')
+
+# Share of the training rows held out for calibration when no calibration set is given
+CALIBRATION_FRACTION = 0.2
+
+def quantile_model_path(models_dir, family, bound):
+    return os.path.join(models_dir, f'{family}_{bound}.pkl')
+
+def widen_interval(lower, upper, margin):
+    """Served bounds: each side moved out by margin times the raw interval width (the backend does the same)"""
+    width = np.maximum(upper - lower, 0)
+    return lower - margin * width, upper + margin * width
+
+def conformal_margin(lower, upper, y, coverage):
+    """Smallest width-relative margin that makes at least `coverage` of the calibration rows fall inside,
+    with the (n + 1) finite-sample correction of split-conformal prediction
+    """
+    width = np.maximum(upper - lower, 0)
+    outside = np.maximum(lower - y, y - upper)
+    scores = np.where(width > 0, outside / np.where(width > 0, width, 1), np.where(outside > 0, np.inf, -np.inf))
+    rank = int(np.ceil((len(scores) + 1) * coverage))
+    if rank > len(scores):
+        raise ValueError(f"{len(scores)} calibration rows are too few for {coverage:.0%} coverage")
+    return float(np.sort(scores)[rank - 1])
+
+def _average_bounds(models, X):
+    # Served intervals average the families, so calibrate and evaluate the same way
+    return tuple(np.mean([model.predict(X) for model in models[bound]], axis=0) for bound in ('lower', 'upper'))
+
+def train_quantile_models(X_train, y_train, models_dir='models', X_test=None, y_test=None, alphas=QUANTILE_ALPHAS,
+                          X_cal=None, y_cal=None):
+    """Fit and save one booster per family and bound, then calibrate them on X_cal (by default a holdout
+    carved from the training rows); returns metadata with the margin and test coverage
+    """
+    if X_cal is None:
+        X_train, X_cal, y_train, y_cal = train_test_split(X_train, y_train, test_size=CALIBRATION_FRACTION, random_state=42)
+    models = {bound: [] for bound in alphas}
+
+    for bound, alpha in alphas.items():
+        print(f"Training quantile boosters for the {bound} bound (alpha={alpha})...")
+        family_models = {
+            'xgboost': xgb.XGBRegressor(
+                objective='reg:quantileerror',
+                quantile_alpha=alpha,
+                n_estimators=200,
+                max_depth=6,
+                learning_rate=0.05,
+                random_state=42
+            ),
+            'lightgbm': lgb.LGBMRegressor(
+                objective='quantile',
+                alpha=alpha,
+                n_estimators=200,
+                max_depth=8,
+                learning_rate=0.05,
+                random_state=42,
+                verbosity=-1
+            ),
+        }
+        for family, model in family_models.items():
+            model.fit(X_train, y_train)
+            joblib.dump(model, quantile_model_path(models_dir, family, bound))
+            models[bound].append(model)
+
+    nominal = alphas['upper'] - alphas['lower']
+    lower, upper = _average_bounds(models, X_cal)
+    margin = conformal_margin(lower, upper, np.asarray(y_cal), nominal)
+    metadata = {'alphas': dict(alphas), 'margin': margin, 'calibration_rows': len(y_cal)}
+    print(f"Conformal margin {margin:+.3f} x interval width from {len(y_cal)} calibration rows")
+
+    if X_test is not None:
+        y_test = np.asarray(y_test)
+        raw_lower, raw_upper = _average_bounds(models, X_test)
+        lower, upper = widen_interval(raw_lower, raw_upper, margin)
+        metadata['uncalibrated_coverage'] = float(np.mean((y_test >= raw_lower) & (y_test <= raw_upper)))
+        metadata['coverage'] = float(np.mean((y_test >= lower) & (y_test <= upper)))
+        metadata['median_width_pct'] = float(np.median((upper - lower) / np.abs(y_test)) * 100)
+        print(f"Interval coverage on test set: {metadata['coverage']:.1%} (target {nominal:.0%}, "
+              f"{metadata['uncalibrated_coverage']:.1%} before calibration), median width {metadata['median_width_pct']:.1f}%")
+    return metadata
@@ -18,6 +18,9 @@ import pickle
 import json
 import os
 from datetime import datetime
+from export_nn_weights import export_keras_model
+from export_bundle import export_bundle
+from quantile_models import train_quantile_models
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -30,6 +33,7 @@ class PropertyValuationEnsemble:
         self.scaler = StandardScaler()
         self.label_encoders = {}
         self.feature_names = None
+        self.quantile_metadata = None
         self.target_column = 'property_value'
         
         mlflow.set_tracking_uri(mlflow_tracking_uri)
@@ -290,6 +294,11 @@ class PropertyValuationEnsemble:
             for key, value in lgb_metrics.items():
                 mlflow.log_metric(f"lightgbm_{key}", value)
             
+            # Lower/upper bound boosters for the served confidence intervals
+            os.makedirs('models', exist_ok=True)
+            self.quantile_metadata = train_quantile_models(X_train, y_train, 'models', X_test, y_test, X_cal=X_val, y_cal=y_val)
+            mlflow.log_metric("interval_coverage", self.quantile_metadata['coverage'])
+            
             self.train_neural_network(X_train, y_train, X_val, y_val)
             nn_metrics = self.evaluate_model(self.nn_model, X_test, y_test, "Neural Network")
             for key, value in nn_metrics.items():
@@ -348,6 +357,7 @@ class PropertyValuationEnsemble:
             pickle.dump(self.lgb_model, f)
         
         self.nn_model.save('models/neural_network_model.h5')
+        export_keras_model(self.nn_model, 'models/neural_network_weights.npz', self.scaler)
         
         with open('models/scaler.pkl', 'wb') as f:
             pickle.dump(self.scaler, f)
@@ -358,20 +368,26 @@ class PropertyValuationEnsemble:
         with open('models/feature_names.json', 'w') as f:
             json.dump(self.feature_names, f)
         
+        # Same file and keys as train_simple.py; export_bundle.py and the backend read the features and intervals from it
         metadata = {
-            'trained_at': datetime.now().isoformat(),
+            'training_date': datetime.now().isoformat(),
+            'features': self.feature_names,
             'model_versions': {
                 'xgboost': xgb.__version__,
                 'lightgbm': lgb.__version__,
                 'tensorflow': tf.__version__
             },
             'feature_count': len(self.feature_names),
-            'target': self.target_column
+            'target': self.target_column,
+            'quantiles': self.quantile_metadata
         }
         
-        with open('models/metadata.json', 'w') as f:
+        with open('models/model_metadata.json', 'w') as f:
             json.dump(metadata, f, indent=2)
         
+        # Memory-mapped copy of everything above, published as a new version for the serving backend
+        export_bundle('models')
+        
         print("\n✓ All models saved successfully!")
 
 if __name__ == "__main__":
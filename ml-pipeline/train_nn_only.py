@@ -15,6 +15,8 @@ from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import pickle
 import json
 import os
+from export_nn_weights import export_keras_model
+from export_bundle import export_bundle
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -175,6 +177,14 @@ def train_neural_network():
     model.save('/app/models/neural_network_model.h5')
     print("Neural network model saved to /app/models/neural_network_model.h5")
     
+    # The scaler goes with these weights; one left over from another run would skew every input
+    with open('/app/models/scaler.pkl', 'wb') as f:
+        pickle.dump(scaler, f)
+    
+    # NumPy copy of the weights used by the backend for inference
+    export_keras_model(model, '/app/models/neural_network_weights.npz', scaler)
+    export_bundle('/app/models')
+    
     return model
 
 if __name__ == "__main__":
@@ -14,6 +14,8 @@ import joblib
 import os
 import json
 from datetime import datetime
+from export_bundle import export_bundle
+from quantile_models import train_quantile_models
 
 # Create sample data for training
 np.random.seed(42)
@@ -122,6 +124,9 @@ joblib.dump(xgb_model, 'models/xgboost_model.pkl')
 joblib.dump(lgb_model, 'models/lightgbm_model.pkl')
 joblib.dump(scaler, 'models/scaler.pkl')
 
+# Quantile boosters for the confidence interval bounds
+quantile_metadata = train_quantile_models(X_train, y_train, 'models', X_test, y_test)
+
 # Save model metadata
 metadata = {
     "training_date": datetime.now().isoformat(),
@@ -131,17 +136,23 @@ metadata = {
         "xgboost": xgb_metrics,
         "lightgbm": lgb_metrics,
         "ensemble": ensemble_metrics
-    }
+    },
+    "quantiles": quantile_metadata
 }
 
 with open('models/model_metadata.json', 'w') as f:
     json.dump(metadata, f, indent=2)
 
+# Memory-mapped serving bundle, published as a new registry version
+export_bundle('models')
+
 print("\nModels saved to 'models/' directory:")
 print("  - xgboost_model.pkl")
 print("  - lightgbm_model.pkl")
 print("  - scaler.pkl")
+print("  - {xgboost,lightgbm}_{lower,upper}.pkl")
 print("  - model_metadata.json")
+print("  - registry/ (new published version)")
 
 print("\n" + "="*50)
 print("Training Complete!")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the Redis cache codecs on a cached valuation record
+
+Reports stored size, encode and decode time per codec, with and without zlib
+compression, for a plain valuation and one carrying a fast explanation.
+Usage: python scripts/benchmark_cache_codecs.py [iterations]
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+
+from services.codecs import CODECS, CacheSerializer, msgpack
+
+FEATURES = [
+    'square_feet', 'building_age', 'num_floors', 'occupancy_rate', 'walk_score', 'transit_score', 'crime_rate',
+    'school_rating', 'distance_to_downtown', 'annual_revenue', 'expenses', 'cap_rate', 'net_operating_income'
+]
+
+VALUATION = {
+    'property_id': 'PROP-000123',
+    'predicted_value': 17753652.29054849,
+    'confidence_interval': {
+        'lower': 15375159.08912551,
+        'upper': 24405507.238786686,
+        'confidence_level': 95.0,
+        'uncertainty_percentage': 24.4
+    },
+    'price_per_sqft': 887.6826145274245,
+    'valuation_date': '2026-10-17T18:16:40.100542',
+    'model_version': 'v20261017181631',
+    'processing_time_ms': 4.213,
+    'cached': False,
+    'explanation': None
+}
+
+EXPLAINED = {
+    **VALUATION,
+    'explanation': {
+        'method': 'saabas',
+        'base_value': 21364502.77105436,
+        'predicted_value': 19339109.01583633,
+        'feature_contributions': {name: (i + 1) * 104729.3371 * (-1) ** i for i, name in enumerate(FEATURES)}
+    }
+}
+
+def bench(name, value, codec, compress_threshold, iterations):
+    serializer = CacheSerializer(codec, compress_threshold)
+    data = serializer.dumps(value)
+    assert serializer.loads(data) == value, f"{codec} does not round-trip"
+    encode = timeit.timeit(lambda: serializer.dumps(value), number=iterations) / iterations * 1e6
+    decode = timeit.timeit(lambda: serializer.loads(data), number=iterations) / iterations * 1e6
+    compression = 'zlib' if compress_threshold else 'off'
+    print(f"{name:<10} {codec:<8} {compression:<5} {len(data):>7} {encode:>11.2f} {decode:>11.2f}")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    codecs = [codec for codec in CODECS if codec != 'msgpack' or msgpack is not None]
+    print(f"{'record':<10} {'codec':<8} {'zlib':<5} {'bytes':>7} {'encode us':>11} {'decode us':>11}")
+    for name, value in (('valuation', VALUATION), ('explained', EXPLAINED)):
+        for codec in codecs:
+            for compress_threshold in (0, 256):
+                bench(name, value, codec, compress_threshold, iterations)
+    if msgpack is None:
+        print("msgpack not installed; skipped")
+
+if __name__ == '__main__':
+    main()